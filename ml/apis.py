@@ -6,6 +6,8 @@ from pathlib import Path
 import time
 from .src.embedder.embedding_feature import SbertConfig, SbertEmbedder
 from .src.models import CVJDXGBRanker
+from .src.scoring import get_skill_extractor, get_skill_store
+from .src.retrieval import get_bm25_index
 
 # ============== internal state ==============
 _LOCK = threading.Lock()
@@ -105,6 +107,39 @@ def rank_cv_for_jd(
     ]
 
 
+def cache_cv_skills(resume_texts: List[str]) -> int:
+    """Extract + store CV skills ahead of ranking (same extractor config as build_features)."""
+    fc = load_model().feat_cfg
+    if not fc.skill_store_path:
+        return 0
+    extr = get_skill_extractor(fuzzy_threshold=fc.fuzzy_vendor, max_alias_len=fc.max_alias_len, use_fuzzy=True)
+    return len(get_skill_store(fc.skill_store_path).extract_many(extr, resume_texts))
+
+
+def index_cv_bm25(cv_id, resume_text: str) -> bool:
+    path = load_model().feat_cfg.bm25_index_path
+    if not path:
+        return False
+    get_bm25_index(path).upsert(cv_id, resume_text or "")
+    return True
+
+
+def remove_cv_bm25(cv_id) -> bool:
+    path = load_model().feat_cfg.bm25_index_path
+    if not path:
+        return False
+    get_bm25_index(path).remove(cv_id)
+    return True
+
+
+def rebuild_bm25_index(items, path: Optional[str] = None) -> int:
+    """Backfill: replace the BM25 index with (cv_id, resume_text) items; returns the number of docs."""
+    path = path or load_model().feat_cfg.bm25_index_path
+    if not path:
+        return 0
+    return get_bm25_index(path).rebuild(items)
+
+
 def is_loaded() -> bool:
     global _MODEL
     return _MODEL is not None
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""
+Benchmark: regex alternation vs Aho-Corasick alias matching in SkillExtractor.
+
+    python -m ml.benchmarks.bench_alias_matcher [--vendor DIR] [--docs 50]
+
+Uses the vendor dictionary when present, otherwise a synthetic dictionary
+built from token_dist.json. CV texts are sampled from the resume token
+distribution in token_dist.json at realistic lengths.
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from ml.src.scoring.alias_matcher import make_alias_matcher
+from ml.src.scoring.skill_extractor import _DEFAULT_DATA_PATH, SkillExtractor, clean_text
+
+_ROOT = Path(__file__).resolve().parents[2]
+_TOKEN_DIST = _ROOT / "token_dist.json"
+
+
+def _load_token_dist():
+    with _TOKEN_DIST.open("r", encoding="utf-8") as f:
+        dist = json.load(f)
+    words = list(dist.keys())
+    weights = [float(dist[w]) for w in words]
+    return words, weights
+
+def _synthetic_aliases(words, n_aliases: int, rng: random.Random):
+    vocab = words[:5000]
+    aliases = set(vocab[:n_aliases // 2])
+    while len(aliases) < n_aliases:
+        k = rng.choice((2, 2, 3))
+        aliases.add(" ".join(rng.choice(vocab) for _ in range(k)))
+    return sorted(aliases)
+
+def _make_docs(words, weights, n_docs: int, n_words: int, rng: random.Random):
+    docs = []
+    for _ in range(n_docs):
+        ws = rng.choices(words, weights=weights, k=n_words)
+        docs.append(clean_text(" ".join(w + ("," if rng.random() < 0.1 else "") for w in ws)))
+    return docs
+
+def _time(matcher, docs):
+    t0 = time.perf_counter()
+    out = [set(matcher.find(d)) for d in docs]
+    return time.perf_counter() - t0, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vendor", default=_DEFAULT_DATA_PATH)
+    ap.add_argument("--docs", type=int, default=50)
+    ap.add_argument("--synthetic-aliases", type=int, default=20000)
+    ap.add_argument("--seed", type=int, default=13)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    words, weights = _load_token_dist()
+
+    if Path(args.vendor).exists():
+        extr = SkillExtractor(data_path=args.vendor, use_fuzzy=False, use_artifact=False)
+        aliases = [a for al in extr.skill_dict.values() for a in al]
+        print(f"vendor dictionary: {len(extr.skill_dict)} skills, {len(aliases)} aliases")
+    else:
+        aliases = _synthetic_aliases(words, args.synthetic_aliases, rng)
+        print(f"vendor dictionary not found, synthetic: {len(aliases)} aliases")
+
+    engines = {}
+    for name in ("regex", "aho"):
+        t0 = time.perf_counter()
+        engines[name] = make_alias_matcher(name, aliases)
+        print(f"build[{name}]: {time.perf_counter() - t0:.3f}s")
+
+    print(f"{'words':>6} {'docs':>5} {'regex ms/doc':>13} {'aho ms/doc':>11} {'speedup':>8} {'identical':>9}")
+    for n_words in (150, 600, 1500, 3000):
+        docs = _make_docs(words, weights, args.docs, n_words, rng)
+        t_re, out_re = _time(engines["regex"], docs)
+        t_ac, out_ac = _time(engines["aho"], docs)
+        print(f"{n_words:>6} {len(docs):>5} {1e3 * t_re / len(docs):>13.2f} {1e3 * t_ac / len(docs):>11.2f} "
+              f"{t_re / max(t_ac, 1e-9):>7.1f}x {str(out_re == out_ac):>9}")
+
+
+if __name__ == "__main__":
+    main()
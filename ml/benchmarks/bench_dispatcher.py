@@ -0,0 +1,74 @@
+"""
+Concurrent small encodes: direct encoder calls vs the micro-batching dispatcher.
+
+    python -m ml.benchmarks.bench_dispatcher [--threads 16] [--requests 400] [--wait-ms 0 2 5]
+
+Each request is 1-3 short texts (search queries / JD snippets), issued from
+`threads` threads at once. Encoder: --model or the random MiniLM-shaped one
+from bench_token_batching.
+"""
+from __future__ import annotations
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from ml.benchmarks.bench_token_batching import _load_token_dist, _random_minilm
+from ml.src.embedder.dispatcher import EmbeddingDispatcher
+
+
+def _requests(words, p, n: int, rng):
+    out = []
+    for _ in range(n):
+        out.append([" ".join(rng.choice(words, size=rng.integers(4, 30), p=p)) for _ in range(rng.integers(1, 4))])
+    return out
+
+def _run(fn, reqs, threads: int):
+    lat = []
+    def one(r):
+        t0 = time.perf_counter()
+        fn(r)
+        lat.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(threads) as ex:
+        list(ex.map(one, reqs))
+    return time.perf_counter() - t0, np.percentile(lat, [50, 95]) * 1e3
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--max-batch", type=int, default=64)
+    ap.add_argument("--wait-ms", type=float, nargs="+", default=[0, 2, 5])
+    ap.add_argument("--model", default=None)
+    args = ap.parse_args()
+
+    import torch
+    torch.manual_seed(0)
+    words, p = _load_token_dist()
+    reqs = _requests(words, p, args.requests, np.random.default_rng(0))
+    model = None
+    if args.model:
+        try:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(args.model, device="cpu")
+        except Exception as e:
+            print(f"cannot load {args.model} ({type(e).__name__}); using random MiniLM-shaped encoder")
+    model = model or _random_minilm(words)
+    model.encode(reqs[0])
+
+    n_texts = sum(len(r) for r in reqs)
+    print(f"[dispatcher] requests={len(reqs)} texts={n_texts} threads={args.threads}")
+    dt, (p50, p95) = _run(lambda r: model.encode(r, convert_to_numpy=True), reqs, args.threads)
+    print(f"  direct          {n_texts / dt:7.1f} texts/s  p50={p50:6.1f} ms  p95={p95:6.1f} ms")
+    for w in args.wait_ms:
+        d = EmbeddingDispatcher(model, max_batch=args.max_batch, max_wait_ms=w)
+        dt, (p50, p95) = _run(d.encode, reqs, args.threads)
+        st = d.stats()
+        d.close()
+        print(f"  wait={w:>4.1f} ms    {n_texts / dt:7.1f} texts/s  p50={p50:6.1f} ms  p95={p95:6.1f} ms"
+              f"  avg batch={st['avg_batch']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
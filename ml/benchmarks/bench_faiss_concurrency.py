@@ -0,0 +1,100 @@
+"""
+FAISS search QPS vs request threads: global-lock search (previous behaviour)
+vs lock-free snapshot search, optionally with a concurrent writer.
+
+    python -m ml.benchmarks.bench_faiss_concurrency [--n 100000] [--dim 384] [--kind hnsw]
+        [--threads 1 2 4 8] [--seconds 3] [--writes-per-s 20]
+
+Each thread issues single-query searches (one /faiss/search request) in a loop.
+faiss OpenMP is pinned to 1 thread so parallelism comes from request threads.
+The writer upserts CVs at --writes-per-s and checkpoints every 200 writes;
+under the old scheme a checkpoint (write_index) held the lock readers wait on.
+"""
+from __future__ import annotations
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+import faiss
+
+import ml.vectorstore.faiss_store as fs
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+def _run(search, queries, threads: int, seconds: float, writer=None):
+    stop, counts, lat = threading.Event(), [0] * threads, [[] for _ in range(threads)]
+    def reader(t):
+        rng = np.random.default_rng(t)
+        while not stop.is_set():
+            q = queries[rng.integers(len(queries))][None]
+            t0 = time.perf_counter()
+            search(q)
+            lat[t].append(time.perf_counter() - t0)
+            counts[t] += 1
+    th = [threading.Thread(target=reader, args=(t,)) for t in range(threads)]
+    if writer is not None:
+        th.append(threading.Thread(target=writer, args=(stop,)))
+    [t.start() for t in th]
+    time.sleep(seconds)
+    stop.set()
+    [t.join() for t in th]
+    all_lat = np.concatenate([np.asarray(l) for l in lat]) * 1e3
+    return sum(counts) / seconds, np.percentile(all_lat, 50), np.percentile(all_lat, 99)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--kind", default="hnsw", choices=fs.INDEX_KINDS)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--writes-per-s", type=float, default=20.0)
+    args = ap.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(0)
+    X = _unit(rng.normal(size=(args.n, args.dim)))
+    queries = _unit(rng.normal(size=(512, args.dim)))
+    d = Path(tempfile.mkdtemp(prefix="faiss_conc_"))
+    fs._base_dir = lambda: d
+    fs.FLUSH_ROWS, fs.FLUSH_SECONDS = 10**9, 10**9
+    t0 = time.perf_counter()
+    fs.build_new(X, np.arange(args.n), kind=args.kind)
+    print(f"[faiss concurrency] kind={args.kind} n={args.n:,} dim={args.dim} build={time.perf_counter() - t0:.1f}s")
+
+    old_lock = threading.RLock()
+    def locked_search(q):                       # previous search(): _LOCK around the whole call
+        with old_lock:
+            return fs.search(q, topk=10)
+    def free_search(q):
+        return fs.search(q, topk=10)
+
+    def make_writer(lock):
+        def writer(stop):
+            k, wrng = 0, np.random.default_rng(1)
+            while not stop.is_set():
+                with lock:
+                    fs.upsert(_unit(wrng.normal(size=(1, args.dim))), [int(wrng.integers(args.n))])
+                    k += 1
+                    if k % 200 == 0:
+                        fs.flush()
+                time.sleep(1.0 / args.writes_per_s)
+        return writer
+
+    for label, writes in (("read-only", False), (f"+{args.writes_per_s:g} writes/s", True)):
+        print(f"  {label}")
+        for th in args.threads:
+            row = f"    threads={th:<3}"
+            for name, fn in (("locked", locked_search), ("snapshot", free_search)):
+                w = make_writer(old_lock if name == "locked" else fs._LOCK) if writes else None
+                qps, p50, p99 = _run(fn, queries, th, args.seconds, w)
+                row += f"  {name}: {qps:8.0f} qps p50={p50:6.2f} p99={p99:7.2f} ms"
+            print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Recall/latency of the FAISS fuzzy lookup vs the dense path in SkillExtractor.
+
+    python -m ml.benchmarks.bench_fuzzy_ann [--canon 5000 20000 50000] [--queries 5000]
+
+Canonical vectors are synthetic unit vectors (384-d, clustered like skill
+families); half of the queries are noisy copies of a canonical skill, half
+are unrelated phrases. Recall is measured on the thresholded hit set, i.e.
+what actually changes extract() output.
+"""
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+
+from ml.src.scoring.skill_extractor import ExtractorConfig, SkillExtractor
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def _synthetic(n_canon: int, n_queries: int, dim: int, rng):
+    centers = rng.normal(size=(max(8, n_canon // 50), dim))
+    canon = _unit(centers[rng.integers(0, len(centers), n_canon)] + 0.9 * rng.normal(size=(n_canon, dim)))
+    near = canon[rng.integers(0, n_canon, n_queries // 2)]
+    near = _unit(near + rng.uniform(0.3, 0.9, size=(len(near), 1)) * rng.normal(size=near.shape) / np.sqrt(dim) * 2.5)
+    far = _unit(rng.normal(size=(n_queries - len(near), dim)))
+    return canon, np.vstack([near, far])
+
+def _extractor(canon: np.ndarray, **cfg) -> SkillExtractor:
+    # only the fuzzy lookup is exercised: skip dictionary/model loading
+    extr = SkillExtractor.__new__(SkillExtractor)
+    extr.cfg = ExtractorConfig(ann_min_canon=0, **cfg)
+    extr.canon_vecs = canon
+    extr._canon_index = extr._build_canon_index()
+    return extr
+
+def _hits(extr, q, thr):
+    t0 = time.perf_counter()
+    idx, sim = extr._best_canon(q)
+    dt = time.perf_counter() - t0
+    return {(i, int(j)) for i, (j, s) in enumerate(zip(idx, sim)) if s >= thr}, dt
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--canon", type=int, nargs="+", default=[5000, 20000, 50000])
+    ap.add_argument("--queries", type=int, default=5000)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--threshold", type=float, default=0.70)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+
+    print(f"{'canon':>6} {'mode':<16} {'ms/1k q':>8} {'recall':>7} {'extra':>6}")
+    for n in args.canon:
+        canon, q = _synthetic(n, args.queries, args.dim, rng)
+        ref, t_ref = _hits(_extractor(canon, fuzzy_index="exact"), q, args.threshold)
+        print(f"{n:>6} {'exact':<16} {1e3 * t_ref / len(q) * 1000:>8.1f} {1.0:>7.3f} {0:>6}")
+        for kind, margin in (("flat", 0.05), ("hnsw", 0.0), ("hnsw", 0.05)):
+            extr = _extractor(canon, fuzzy_index=kind, ann_recheck_margin=margin,
+                              fuzzy_threshold=args.threshold)
+            got, dt = _hits(extr, q, args.threshold)
+            recall = len(got & ref) / max(len(ref), 1)
+            label = f"{kind} m={margin}"
+            print(f"{n:>6} {label:<16} {1e3 * dt / len(q) * 1000:>8.1f} {recall:>7.3f} {len(got - ref):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Segment-based groupwise_norm vs the old per-group mask loop.
+
+    python -m ml.benchmarks.bench_groupwise_norm [--groups 1000 5000] [--per-group 20]
+    python -m ml.benchmarks.bench_groupwise_norm --csv data/train/dataset_train.csv --group-col jd_id
+
+Synthetic mode draws `per-group` rows per JD on average (training-set shape:
+thousands of JDs, tens of CVs each); --csv uses the real group column with
+random scores.
+"""
+from __future__ import annotations
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from ml.src.retrieval.bm25_feature import groupwise_norm
+
+METHODS = ("minmax", "zscore", "softmax", "rank")
+
+
+def _loop_norm(scores: np.ndarray, groups: np.ndarray, method: str) -> np.ndarray:
+    # previous implementation: one boolean mask over all rows per group -> O(N x G)
+    out = np.zeros_like(scores)
+    for gid in np.unique(groups):
+        idx = groups == gid
+        s = scores[idx]
+        if s.size <= 1:
+            continue
+        if method == "minmax":
+            lo, hi = s.min(), s.max()
+            out[idx] = (s - lo) / (hi - lo + 1e-12) if hi > lo else 0.0
+        elif method == "zscore":
+            out[idx] = (s - s.mean()) / (s.std() + 1e-12)
+        elif method == "softmax":
+            ex = np.exp(s - s.max())
+            out[idx] = ex / (ex.sum() + 1e-12)
+        else:
+            r = np.empty(s.size)
+            r[s.argsort(kind="mergesort")] = np.linspace(0.0, 1.0, num=s.size)
+            out[idx] = r
+    return out
+
+def _time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run(groups: np.ndarray, label: str, loop: bool = True):
+    rng = np.random.default_rng(0)
+    scores = rng.gamma(2.0, 3.0, size=len(groups))
+    print(f"\n[{label}] rows={len(groups):,} groups={len(np.unique(groups)):,}")
+    for m in METHODS:
+        t_vec = _time(lambda: groupwise_norm(scores, groups, method=m))
+        line = f"  {m:<8} segment={t_vec*1e3:8.1f} ms"
+        if loop:
+            t_loop = _time(lambda: _loop_norm(scores, groups, m), repeat=1)
+            err = np.abs(groupwise_norm(scores, groups, method=m) - _loop_norm(scores, groups, m)).max()
+            line += f"  loop={t_loop*1e3:9.1f} ms  x{t_loop / t_vec:6.1f}  max|diff|={err:.1e}"
+        print(line)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--groups", type=int, nargs="+", default=[1000, 5000])
+    ap.add_argument("--per-group", type=int, default=20)
+    ap.add_argument("--csv", default=None)
+    ap.add_argument("--group-col", default="jd_id")
+    ap.add_argument("--no-loop", action="store_true", help="skip the O(N x G) baseline")
+    args = ap.parse_args()
+
+    if args.csv:
+        groups = pd.read_csv(args.csv, usecols=[args.group_col])[args.group_col].astype(str).to_numpy()
+        run(groups, args.csv, loop=not args.no_loop)
+        return
+    rng = np.random.default_rng(1)
+    for g in args.groups:
+        groups = np.array([f"jd-{i}" for i in rng.integers(0, g, size=g * args.per_group)])
+        run(groups, f"synthetic {g} JDs", loop=not args.no_loop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+CPU latency: PyTorch SentenceTransformer vs onnxruntime (fp32 / dynamic int8).
+
+    python -m ml.benchmarks.bench_onnx_backend [--docs 128] [--threads 1 2 4] [--model NAME]
+
+Without --model (or offline) a randomly initialised MiniLM-L6-shaped encoder
+with a token_dist.json vocabulary is used (see bench_token_batching): latency
+depends on shape, not on weights. Cosine drift is measured against torch.
+"""
+from __future__ import annotations
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from ml.benchmarks.bench_token_batching import _load_token_dist, _make_texts, _random_minilm
+from ml.src.embedder.onnx_backend import load_onnx_encoder
+
+
+def _time(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def _cos_drift(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return float(np.abs(a @ a.T - b @ b.T).max())
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=128)
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1])
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    import torch
+    torch.manual_seed(args.seed)
+    words, p = _load_token_dist()
+    texts = _make_texts(words, p, args.docs, np.random.default_rng(args.seed))
+    st = None
+    if args.model:
+        try:
+            from sentence_transformers import SentenceTransformer
+            st = SentenceTransformer(args.model, device="cpu")
+        except Exception as e:
+            print(f"cannot load {args.model} ({type(e).__name__}); using random MiniLM-shaped encoder")
+    st = st or _random_minilm(words)
+    out_dir = tempfile.mkdtemp(prefix="onnx_bench_")
+
+    print(f"[onnx] docs={len(texts)} batch={args.batch_size} max_seq_length={st.max_seq_length}")
+    for th in args.threads:
+        torch.set_num_threads(th)
+        ref = st.encode(texts, batch_size=args.batch_size, convert_to_numpy=True)
+        t_torch = _time(lambda: st.encode(texts, batch_size=args.batch_size, convert_to_numpy=True))
+        print(f"  threads={th}  torch      {t_torch * 1e3 / len(texts):7.2f} ms/doc")
+        for quant in (False, True):
+            enc = load_onnx_encoder("bench", onnx_dir=out_dir, quantize=quant, threads=th, st_model=st)
+            got = enc.encode(texts, batch_size=args.batch_size)
+            t = _time(lambda: enc.encode(texts, batch_size=args.batch_size))
+            name = "onnx-int8" if quant else "onnx-fp32"
+            print(f"  threads={th}  {name:<10} {t * 1e3 / len(texts):7.2f} ms/doc  x{t_torch / t:5.2f}"
+                  f"  max|dcos|={_cos_drift(got, ref):.1e}")
+
+
+if __name__ == "__main__":
+    main()
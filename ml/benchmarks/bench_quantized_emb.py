@@ -0,0 +1,74 @@
+"""
+Memory vs ranking-quality drift of quantized embedding storage.
+
+    python -m ml.benchmarks.bench_quantized_emb [--jds 500] [--per-jd 20] [--dim 384]
+    python -m ml.benchmarks.bench_quantized_emb --npz embs.npz
+
+Each JD gets `per-jd` CVs at graded distance (label 0..3 from the latent
+relevance). Pair scores are JD·CV cosines with the CV vectors stored as
+float32 / float16 / int8 (emb_store codecs) or encoded by the faiss_store
+index kinds (sq16 / sq8 / pq, via sa_encode/sa_decode). Quality is the
+per-JD NDCG from ml.src.models.xgb._eval_per_jd, reported next to the float32
+reference. --npz takes real vectors: arrays jd (J x d), cv (N x d), jd_idx (N),
+label (N).
+"""
+from __future__ import annotations
+import argparse
+import numpy as np
+import pandas as pd
+
+from ml.src.embedder.emb_store import CODECS, decode_rows, encode_rows, row_dtype
+from ml.src.models.xgb import _eval_per_jd
+from ml.vectorstore.faiss_store import _create_index, _train_if_needed
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def _synthetic(n_jd: int, per_jd: int, dim: int, rng):
+    jd = _unit(rng.normal(size=(n_jd, dim)))
+    jd_idx = np.repeat(np.arange(n_jd), per_jd)
+    rel = rng.uniform(0, 1, size=len(jd_idx))
+    cv = _unit(jd[jd_idx] * rel[:, None] * 0.35 + rng.normal(size=(len(jd_idx), dim)) / np.sqrt(dim))
+    label = np.digitize(rel + rng.normal(0, 0.1, size=len(rel)), [0.25, 0.5, 0.75])
+    return jd, cv, jd_idx, label
+
+def _ndcg(jd, cv, jd_idx, label) -> dict:
+    df = pd.DataFrame({"jd_id": jd_idx, "label_int": label, "score": (jd[jd_idx] * cv).sum(1)})
+    return _eval_per_jd(df, score_col="score", label_col="label_int", ks=(5, 10))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jds", type=int, default=500)
+    ap.add_argument("--per-jd", type=int, default=20)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--npz", default=None)
+    args = ap.parse_args()
+
+    if args.npz:
+        z = np.load(args.npz)
+        jd, cv, jd_idx, label = _unit(z["jd"]), _unit(z["cv"]), z["jd_idx"], z["label"]
+    else:
+        jd, cv, jd_idx, label = _synthetic(args.jds, args.per_jd, args.dim, np.random.default_rng(0))
+    n, dim = cv.shape
+    ref = _ndcg(jd, cv, jd_idx, label)
+    ref_cos = (jd[jd_idx] * cv).sum(1)
+    print(f"[quantized] CVs={n:,} dim={dim} JDs={len(jd):,}")
+    print(f"  {'storage':<14}{'B/vec':>7}{'MB @1M':>9}{'max|dcos|':>11}{'ndcg@5':>9}{'ndcg@10':>9}{'d@10':>9}")
+
+    def report(name, bytes_per_vec, dec):
+        dcos = np.abs((jd[jd_idx] * dec).sum(1) - ref_cos).max()
+        m = _ndcg(jd, dec, jd_idx, label)
+        print(f"  {name:<14}{bytes_per_vec:>7}{bytes_per_vec * 1e6 / 2**20:>9.0f}{dcos:>11.2e}"
+              f"{m['ndcg@5']:>9.4f}{m['ndcg@10']:>9.4f}{m['ndcg@10'] - ref['ndcg@10']:>+9.4f}")
+
+    for codec in CODECS:
+        report(f"cache:{codec}", row_dtype(codec, dim).itemsize, decode_rows(encode_rows(cv, codec), codec))
+    for kind in ("sq16", "sq8", "pq"):
+        index = _create_index(dim, kind=kind)
+        _train_if_needed(index, cv)
+        report(f"faiss:{kind}", index.sa_code_size(), index.sa_decode(index.sa_encode(cv)))
+
+
+if __name__ == "__main__":
+    main()
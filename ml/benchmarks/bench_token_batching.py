@@ -0,0 +1,109 @@
+"""
+Throughput of token-budget batching in SbertEmbedder.encode vs count batching.
+
+    python -m ml.benchmarks.bench_token_batching [--docs 512] [--budgets 0 4096 8192 16384]
+    python -m ml.benchmarks.bench_token_batching --model sentence-transformers/all-MiniLM-L6-v2
+
+Texts mix short JDs and resumes whose words are drawn from token_dist.json
+(resume token distribution) at log-normal lengths. Without --model (or when it
+cannot be loaded offline) the encoder is a randomly initialised BERT with
+MiniLM-L6 shape (6 layers, 384 hidden, 256 max tokens) and a word-level vocab
+built from token_dist.json: same compute per token, so throughput is comparable.
+budget 0 is the previous behaviour (one model.encode call, count batches).
+"""
+from __future__ import annotations
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+from ml.src.embedder.embedding_feature import SbertConfig, SbertEmbedder, MemEmbCache, make_emb_cache, plan_token_batches
+
+_ROOT = Path(__file__).resolve().parents[2]
+_TOKEN_DIST = _ROOT / "token_dist.json"
+
+
+def _load_token_dist():
+    with _TOKEN_DIST.open("r", encoding="utf-8") as f:
+        dist = json.load(f)
+    words = list(dist.keys())
+    p = np.array([float(dist[w]) for w in words])
+    return words, p / p.sum()
+
+def _make_texts(words, p, n_docs: int, rng):
+    # ~30% JDs (median ~80 words), ~70% resumes (median ~450 words, long tail)
+    is_jd = rng.random(n_docs) < 0.3
+    n_words = np.where(is_jd, rng.lognormal(np.log(80), 0.5, n_docs), rng.lognormal(np.log(450), 0.8, n_docs))
+    n_words = np.clip(n_words, 5, 4000).astype(int)
+    return [" ".join(rng.choice(words, size=k, p=p)) for k in n_words]
+
+def _random_minilm(words):
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    tmp = tempfile.mkdtemp(prefix="minilm_rand_")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(w.lower() for w in words))
+    (Path(tmp) / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    BertTokenizerFast(vocab_file=str(Path(tmp) / "vocab.txt")).save_pretrained(tmp)
+    cfg = BertConfig(vocab_size=len(vocab), hidden_size=384, num_hidden_layers=6, num_attention_heads=12,
+                     intermediate_size=1536, max_position_embeddings=512)
+    BertModel(cfg).save_pretrained(tmp)
+    word = models.Transformer(tmp, max_seq_length=256)
+    return SentenceTransformer(modules=[word, models.Pooling(word.get_word_embedding_dimension(), "mean")], device="cpu")
+
+def _embedder(model, budget: int, batch_size: int) -> SbertEmbedder:
+    cfg = SbertConfig(batch_size=batch_size, token_budget=budget, mem_cache_items=0)
+    e = SbertEmbedder.__new__(SbertEmbedder)       # reuse one loaded model, no cache
+    e.cfg, e.model, e.batch_size, e.normalize = cfg, model, batch_size, True
+    e.cache, e.mem = make_emb_cache(None), MemEmbCache(0)
+    e.dispatcher = None
+    return e
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=512)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--budgets", type=int, nargs="+", default=[0, 4096, 8192, 16384])
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    import torch
+    torch.manual_seed(args.seed)
+    words, p = _load_token_dist()
+    texts = _make_texts(words, p, args.docs, np.random.default_rng(args.seed))
+    model = None
+    if args.model:
+        try:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(args.model, device="cpu")
+        except Exception as e:
+            print(f"cannot load {args.model} ({type(e).__name__}); using random MiniLM-shaped encoder")
+    model = model or _random_minilm(words)
+
+    ref = _embedder(model, 0, args.batch_size)
+    lengths = ref._token_lengths(texts)
+    print(f"[token batching] docs={len(texts)} word pieces: median={int(np.median(lengths))} "
+          f"p90={int(np.percentile(lengths, 90))} truncated@{model.max_seq_length}={np.mean(lengths >= model.max_seq_length):.0%}")
+    base = None
+    for budget in args.budgets:
+        e = _embedder(model, budget, args.batch_size)
+        if budget > 0:
+            batches = plan_token_batches(lengths, budget, args.batch_size)
+            padded = sum(len(b) * int(lengths[b].max()) for b in batches)
+            desc = f"batches={len(batches):>3} pad={padded / lengths.sum() - 1:6.1%}"
+        else:
+            desc = f"batches={-(-len(texts) // args.batch_size):>3} (sorted by chars inside model.encode)"
+        e.encode(texts[:8])                            # warm-up
+        t0 = time.perf_counter()
+        out = e.encode(texts)
+        dt = time.perf_counter() - t0
+        if base is None:
+            base = out
+        print(f"  budget={budget:>6}  {len(texts) / dt:7.1f} docs/s  {dt:6.2f}s  {desc}"
+              f"  max|diff|={np.abs(out - base).max():.1e}")
+
+
+if __name__ == "__main__":
+    main()
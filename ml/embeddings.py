@@ -1,4 +1,5 @@
 # ml/embeddings.py
+from pathlib import Path
 import numpy as np
 
 # Ưu tiên dùng embedder có sẵn của bạn, nếu không có thì fallback SBERT
@@ -10,8 +11,21 @@ try:
         return arr
 except Exception:
     # Fallback: SBERT đa ngôn ngữ nhẹ, đủ tốt cho CV/JD
-    from sentence_transformers import SentenceTransformer
-    _SBERT = SentenceTransformer("all-MiniLM-L6-v2")
+    # (qua registry dùng chung: cùng bản weights với embed_documents/SbertEmbedder, nạp lần gọi đầu;
+    # các request đồng thời với vài câu được gom thành một batch bởi dispatcher của encoder)
+    from ml.src.embedder.registry import get_dispatcher
     def embed_texts(texts: list[str]) -> np.ndarray:
-        arr = _SBERT.encode(texts, batch_size=64, show_progress_bar=False)
+        arr = get_dispatcher("all-MiniLM-L6-v2", max_batch=64, max_wait_ms=5.0).encode(list(texts))
         return np.asarray(arr, dtype="float32")
+
+# CV vectors cho FAISS: CV dài được cắt thành các đoạn chồng lấn (cache theo từng đoạn, sửa một mục
+# chỉ embed lại đoạn đó) rồi mean-pool; query/JD ngắn vẫn dùng embed_texts ở trên.
+DOC_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+DOC_CHUNK_WORDS = 180
+DOC_CACHE_PATH = str(Path(__file__).resolve().parent / "src" / "cache" / "emb_sbert.sqlite")
+
+def embed_documents(texts: list[str]) -> np.ndarray:
+    from ml.src.embedder import SbertConfig, get_sbert_embedder
+    emb = get_sbert_embedder(SbertConfig(model_name=DOC_MODEL_NAME, cache_path=DOC_CACHE_PATH,
+                                         chunk_words=DOC_CHUNK_WORDS, chunk_pool="mean"))
+    return np.asarray(emb.encode(list(texts)), dtype="float32")
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+import numpy as np
+
+_STOP = object()
+
+
+class EmbeddingDispatcher:
+    """
+    In-process micro-batching in front of one encoder.
+
+    Callers (request threads, coroutines via `aencode`) submit a few texts and get
+    a Future; one worker thread takes the first queued request, keeps collecting
+    for up to `max_wait_ms` or until `max_batch` texts, runs a single
+    encoder.encode and resolves every caller with its own rows. Requests that
+    already fill a batch bypass the queue and are encoded in the calling thread.
+    max_wait_ms=0 batches only what is already queued (no added latency when idle).
+
+    Vectors are returned un-normalized (normalize_embeddings=False), float32;
+    callers normalize like they would after a direct encode.
+    """
+
+    def __init__(self, encoder, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.encoder = encoder
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._lock = threading.Lock()
+        self._q: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._dim = 0
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_texts = 0
+
+    # -------- worker --------
+    def _ensure_worker(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():                # forked worker: the parent's thread/queue do not exist here
+                self._q = queue.Queue()
+                self._thread = None
+            if self._thread is None or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._loop, args=(self._q,), name="emb-dispatcher", daemon=True)
+                self._thread.start()
+
+    def _loop(self, q: queue.Queue):
+        carry = None
+        while True:
+            item = carry if carry is not None else q.get()
+            carry = None
+            if item is _STOP:
+                return
+            batch = [item]
+            n = len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            while n < self.max_batch:
+                left = deadline - time.monotonic()
+                try:
+                    nxt = q.get(timeout=left) if left > 0 else q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP or n + len(nxt[0]) > self.max_batch:
+                    carry = nxt                         # starts the next batch
+                    break
+                batch.append(nxt)
+                n += len(nxt[0])
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[List[str], Future]]):
+        live = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+        if not live:
+            return
+        try:
+            vecs = self._run([x for t, _ in live for x in t])
+        except BaseException as e:
+            for _, f in live:
+                f.set_exception(e)
+            return
+        s = 0
+        for t, f in live:
+            f.set_result(vecs[s:s + len(t)])
+            s += len(t)
+
+    def _run(self, texts: List[str]) -> np.ndarray:
+        vecs = np.asarray(self.encoder.encode(texts, batch_size=self.max_batch, convert_to_numpy=True,
+                                              normalize_embeddings=False), dtype=np.float32)
+        self._dim = vecs.shape[1] if vecs.ndim == 2 else self._dim
+        self.n_batches += 1
+        self.n_texts += len(texts)
+        return vecs
+
+    # -------- API --------
+    def submit(self, texts: List[str]) -> Future:
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        fut: Future = Future()
+        self.n_requests += 1
+        if not texts:
+            fut.set_result(np.zeros((0, self._dim), dtype=np.float32))
+        elif len(texts) >= self.max_batch:
+            fut.set_running_or_notify_cancel()
+            try:
+                fut.set_result(self._run(texts))
+            except BaseException as e:
+                fut.set_exception(e)
+        else:
+            self._ensure_worker()
+            self._q.put((texts, fut))
+        return fut
+
+    def encode(self, texts: List[str], timeout: Optional[float] = None) -> np.ndarray:
+        return self.submit(texts).result(timeout)
+
+    async def aencode(self, texts: List[str]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(texts))
+
+    def close(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {"requests": self.n_requests, "batches": self.n_batches, "texts": self.n_texts,
+                "avg_batch": self.n_texts / max(1, self.n_batches), "queued": self._q.qsize()}
@@ -0,0 +1,413 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+
+
+def _norm_text(s: str) -> str:
+    s = (s or "").lower()
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+def emb_key(model: str, text: str) -> str:
+    return hashlib.sha1((model + "|" + _norm_text(text)).encode("utf-8")).hexdigest()
+
+# ---------------- quantized storage ----------------
+# float32: exact; float16: 2 B/dim; int8: 1 B/dim + one float32 scale per vector
+# (symmetric, scale = max|v| / 127), cosine error ~1e-4 on 384-d unit vectors.
+CODECS = ("float32", "float16", "int8")
+
+def row_dtype(codec: str, dim: int) -> np.dtype:
+    if codec == "float32":
+        return np.dtype([("v", "<f4", (dim,))])
+    if codec == "float16":
+        return np.dtype([("v", "<f2", (dim,))])
+    if codec == "int8":
+        return np.dtype([("v", "i1", (dim,)), ("s", "<f4")])
+    raise ValueError(f"Unknown embedding codec={codec}")
+
+def encode_rows(vecs: np.ndarray, codec: str) -> np.ndarray:
+    vecs = np.asarray(vecs, dtype=np.float32)
+    out = np.empty(len(vecs), dtype=row_dtype(codec, vecs.shape[1]))
+    if codec == "int8":
+        scale = np.abs(vecs).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        out["v"] = np.clip(np.rint(vecs / scale[:, None]), -127, 127)
+        out["s"] = scale
+    else:
+        out["v"] = vecs
+    return out
+
+def decode_rows(rows: np.ndarray, codec: str) -> np.ndarray:
+    if codec == "float32":
+        return rows["v"]                                  # view: zero-copy on a memmap
+    v = rows["v"].astype(np.float32)
+    if codec == "int8":
+        v *= np.asarray(rows["s"], dtype=np.float32)[..., None]
+    return v
+
+
+class MemmapEmbCache:
+    """
+    Append-only on-disk embedding cache (same get/put/save API as EmbCache).
+    `path` is a directory holding
+      - meta.json           : {"dim", "gen", "codec"}; replaced atomically
+      - vecs.<gen>.f32      : fixed-size rows (see CODECS), appended, read through np.memmap
+                              (zero-copy for float32)
+      - keys.<gen>.tsv      : "key<TAB>row" lines, appended after the row is written
+    A put is one append to each file (O(1)); re-putting a key appends a new row and
+    the old one becomes dead space. On open, a torn last row / key line (crash
+    mid-write) is ignored. compact() rewrites live rows into generation gen+1 and
+    flips meta.json, so a crash during compaction leaves the old generation intact.
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None, compact_ratio: float = 0.5, codec: str = "float32"):
+        self.path = path
+        self.compact_ratio = float(compact_ratio)
+        self._lock = threading.RLock()
+        self._index: Dict[str, int] = {}
+        self._rows = 0
+        self._mm: Optional[np.memmap] = None
+        self._vf = self._kf = None
+        os.makedirs(path, exist_ok=True)
+        meta = self._read_meta()
+        self.dim: Optional[int] = meta.get("dim") or dim
+        self.gen: int = int(meta.get("gen", 0))
+        self.codec: str = meta.get("codec", codec)       # an existing store keeps its own codec
+        row_dtype(self.codec, 1)
+        if self.dim:
+            self._load()
+
+    # ---------------- files ----------------
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _files(self, gen: Optional[int] = None):
+        g = self.gen if gen is None else gen
+        return os.path.join(self.path, f"vecs.{g}.f32"), os.path.join(self.path, f"keys.{g}.tsv")
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self):
+        tmp = f"{self._meta_path()}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "gen": self.gen, "codec": self.codec}, f)
+        os.replace(tmp, self._meta_path())
+
+    def _row_dtype(self) -> np.dtype:
+        return row_dtype(self.codec, int(self.dim))
+
+    def _row_bytes(self) -> int:
+        return self._row_dtype().itemsize
+
+    def _load(self):
+        vecs, keys = self._files()
+        size = os.path.getsize(vecs) if os.path.exists(vecs) else 0
+        self._rows = size // self._row_bytes()
+        if size != self._rows * self._row_bytes():          # torn row
+            with open(vecs, "r+b") as f:
+                f.truncate(self._rows * self._row_bytes())
+        if os.path.exists(keys):
+            with open(keys, "rb") as f:
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):                              # torn key line
+                with open(keys, "r+b") as f:
+                    f.truncate(end)
+            for line in data[:end].decode("utf-8").splitlines():
+                k, _, r = line.partition("\t")
+                if r.isdigit() and int(r) < self._rows:
+                    self._index[k] = int(r)
+
+    def _open_writers(self):
+        if self._vf is None:
+            if not os.path.exists(self._meta_path()):
+                self._write_meta()
+            vecs, keys = self._files()
+            self._vf = open(vecs, "ab")
+            self._kf = open(keys, "a", encoding="utf-8", newline="\n")
+
+    def _close_writers(self):
+        for f in (self._vf, self._kf):
+            if f is not None:
+                f.close()
+        self._vf = self._kf = None
+
+    def _view(self) -> Optional[np.memmap]:
+        if self._rows == 0:
+            return None
+        if self._mm is None or self._mm.shape[0] < self._rows:
+            if self._vf is not None:
+                self._vf.flush()
+            self._mm = np.memmap(self._files()[0], dtype=self._row_dtype(), mode="r", shape=(self._rows,))
+        return self._mm
+
+    # ---------------- API ----------------
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _key(self, model: str, text: str) -> str:
+        return emb_key(model, text)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        with self._lock:
+            r = self._index.get(self._key(model, text))
+            if r is None:
+                return None
+            return decode_rows(self._view()[r], self.codec)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(model, t) for t in texts]
+
+    def put(self, model: str, text: str, vec: np.ndarray):
+        self.put_many(model, [text], np.asarray(vec)[None, :])
+
+    def put_many(self, model: str, texts: Sequence[str], vecs: np.ndarray):
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        if not len(texts):
+            return
+        with self._lock:
+            if not self.dim:
+                self.dim = int(vecs.shape[1])
+            if vecs.shape[1] != self.dim:
+                raise ValueError(f"MemmapEmbCache: dim {vecs.shape[1]} != {self.dim}")
+            self._open_writers()
+            self._vf.write(encode_rows(vecs, self.codec).tobytes())
+            self._vf.flush()                                  # rows before keys: a key never points past the data
+            lines: List[str] = []
+            for t in texts:
+                k = self._key(model, t)
+                self._index[k] = self._rows
+                lines.append(f"{k}\t{self._rows}\n")
+                self._rows += 1
+            self._kf.write("".join(lines))
+
+    def save(self):
+        """Flush appends; compacts when dead rows exceed `compact_ratio` of the file."""
+        with self._lock:
+            if self._kf is not None:
+                self._vf.flush()
+                self._kf.flush()
+            if self._rows and (self._rows - len(self._index)) > self.compact_ratio * self._rows:
+                self.compact()
+
+    def compact(self):
+        with self._lock:
+            if not self.dim:
+                return
+            view = self._view()
+            live = sorted(self._index.items(), key=lambda kv: kv[1])
+            new_gen = self.gen + 1
+            vecs, keys = self._files(new_gen)
+            with open(vecs, "wb") as vf, open(keys, "w", encoding="utf-8", newline="\n") as kf:
+                for i in range(0, len(live), 4096):
+                    part = live[i:i+4096]
+                    vf.write(np.ascontiguousarray(view[[r for _, r in part]]).tobytes())
+                    kf.write("".join(f"{k}\t{i + j}\n" for j, (k, _) in enumerate(part)))
+            self._close_writers()
+            self._mm = None
+            old = self._files()
+            self.gen = new_gen
+            self._write_meta()                                # commit point
+            for p in old:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            self._index = {k: i for i, (k, _) in enumerate(live)}
+            self._rows = len(live)
+
+
+class SqliteEmbCache:
+    """
+    Embedding cache shared by several worker processes (same get/put/save API as EmbCache).
+    One SQLite file in WAL mode: readers never block the writer, writes are
+    transactional (INSERT OR IGNORE, so two workers embedding the same text is
+    harmless) and a vector written by one worker is a hit in every other.
+    The connection is reopened after fork (gunicorn --preload).
+    `codec` applies to new rows; each row records its own codec.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0, codec: str = "float32"):
+        row_dtype(codec, 1)
+        self.path = path
+        self.timeout = float(timeout)
+        self.codec = codec
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS emb (key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vec BLOB NOT NULL, "
+                         "codec TEXT NOT NULL DEFAULT 'float32')")
+            if "codec" not in {r[1] for r in conn.execute("PRAGMA table_info(emb)")}:
+                conn.execute("ALTER TABLE emb ADD COLUMN codec TEXT NOT NULL DEFAULT 'float32'")
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM emb").fetchone()[0]
+
+    def _key(self, model: str, text: str) -> str:
+        return emb_key(model, text)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        keys = [self._key(model, t) for t in texts]
+        found: Dict[str, np.ndarray] = {}
+        uniq = list(dict.fromkeys(keys))
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(uniq), 500):   # sqlite variable limit
+                part = uniq[i:i+500]
+                q = "SELECT key, dim, codec, vec FROM emb WHERE key IN (%s)" % ",".join("?" * len(part))
+                for k, dim, codec, v in conn.execute(q, part):
+                    found[k] = decode_rows(np.frombuffer(v, dtype=row_dtype(codec, dim)), codec)[0]
+        return [found.get(k) for k in keys]
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: Sequence[str], vecs: np.ndarray):
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        enc = encode_rows(vecs, self.codec) if len(vecs) else []
+        rows = [(self._key(model, t), int(vecs.shape[1]), r.tobytes(), self.codec) for t, r in zip(texts, enc)]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR IGNORE INTO emb (key, dim, vec, codec) VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def put(self, model: str, text: str, vec: np.ndarray):
+        self.put_many(model, [text], np.asarray(vec)[None, :])
+
+    def save(self):
+        """Writes are committed in put_many(); nothing to flush."""
+        return
+
+
+MEM_POLICIES = ("lru", "lfu")
+
+class MemEmbCache:
+    """
+    Bounded in-process key -> vector cache in front of the on-disk backend.
+    Evicts by `policy` ("lru" or "lfu", both O(1)) once either `max_items` or
+    `max_bytes` (vector payload) is exceeded; None / 0 disables that limit.
+    stats() reports hits, misses, evictions, items and bytes held.
+    """
+
+    def __init__(self, max_items: Optional[int] = 20000, max_bytes: Optional[int] = None, policy: str = "lru"):
+        if policy not in MEM_POLICIES:
+            raise ValueError(f"Unknown mem cache policy={policy}")
+        self.max_items = int(max_items or 0)
+        self.max_bytes = int(max_bytes or 0)
+        self.policy = policy
+        self.hits = self.misses = self.evictions = 0
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # lfu: key -> freq, freq -> keys in insertion/touch order, current min freq
+        self._freq: Dict[str, int] = {}
+        self._buckets: Dict[int, "OrderedDict[str, None]"] = defaultdict(OrderedDict)
+        self._min_freq = 0
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0 or self.max_bytes > 0
+
+    def _touch(self, k: str):
+        if self.policy == "lru":
+            self._mem.move_to_end(k)
+            return
+        f = self._freq[k]
+        b = self._buckets[f]
+        del b[k]
+        if not b:
+            del self._buckets[f]
+            if self._min_freq == f:
+                self._min_freq = f + 1
+        self._freq[k] = f + 1
+        self._buckets[f + 1][k] = None
+
+    def _pop_victim(self):
+        if self.policy == "lru":
+            k, v = self._mem.popitem(last=False)
+        else:
+            b = self._buckets[self._min_freq]
+            k, _ = b.popitem(last=False)
+            if not b:
+                del self._buckets[self._min_freq]
+            del self._freq[k]
+            v = self._mem.pop(k)
+        self.nbytes -= v.nbytes
+        self.evictions += 1
+
+    def _over(self, nbytes: int) -> bool:
+        # would adding one more vector of `nbytes` exceed a limit?
+        return bool(self._mem) and ((self.max_items and len(self._mem) + 1 > self.max_items)
+                                    or (self.max_bytes and self.nbytes + nbytes > self.max_bytes))
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for k in keys:
+                v = self._mem.get(k)
+                if v is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._touch(k)
+                out.append(v)
+        return out
+
+    def put_many(self, keys: Sequence[str], vecs: Sequence[np.ndarray]):
+        if not self.enabled:
+            return
+        with self._lock:
+            for k, v in zip(keys, vecs):
+                if k in self._mem:
+                    self._touch(k)
+                    continue
+                v = np.array(v, dtype=np.float32)           # own copy: not a view into a memmap/sqlite buffer
+                if self.max_bytes and v.nbytes > self.max_bytes:
+                    continue
+                # evict before inserting: under LFU the new key (freq 1) would otherwise be its own victim
+                while self._over(v.nbytes):
+                    self._pop_victim()
+                self._mem[k] = v
+                self.nbytes += v.nbytes
+                if self.policy == "lfu":
+                    self._freq[k] = 1
+                    self._buckets[1][k] = None
+                    self._min_freq = 1
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "policy": self.policy, "items": len(self._mem), "bytes": self.nbytes,
+            "max_items": self.max_items, "max_bytes": self.max_bytes,
+            "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -1,20 +1,17 @@
 from __future__ import annotations
 from pyexpat import model
-import os, re, hashlib, pickle
-from dataclasses import dataclass
-from typing import List, Optional, Tuple, Dict
+import os, re, pickle
+from dataclasses import dataclass, astuple
+from typing import List, NamedTuple, Optional, Tuple, Dict, Union
 import numpy as np
-from sentence_transformers import SentenceTransformer
+import pandas as pd
 import threading
+from .emb_store import MemEmbCache, MemmapEmbCache, SqliteEmbCache, emb_key
+from .registry import get_dispatcher, get_encoder
 
 _SBERT_LOCK = threading.RLock()
-_SBERT_MODELS = {}    # key: (model_name, device) -> SentenceTransformer
 _SBERT_WRAPPERS = {}  # optional: cache SbertEmbedder objects per cfg
 
-def _norm_text(s: str) -> str:
-    s = (s or "").lower()
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
 
 class EmbCache:
     def __init__(self, path: Optional[str] = None):
@@ -28,22 +25,94 @@ class EmbCache:
                 self._mem = {}
 
     def _key(self, model: str, text: str) -> str:
-        return hashlib.sha1((model + "|" + _norm_text(text)).encode("utf-8")).hexdigest()
+        return emb_key(model, text)
 
     def get(self, model: str, text: str) -> Optional[np.ndarray]:
         if not self.path: return None
         return self._mem.get(self._key(model, text))
 
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        return [self.get(model, t) for t in texts]
+
     def put(self, model: str, text: str, vec: np.ndarray):
         if not self.path: return
         self._mem[self._key(model, text)] = vec
 
+    def put_many(self, model: str, texts: List[str], vecs: np.ndarray):
+        for t, v in zip(texts, vecs):
+            self.put(model, t, v)
+
     def save(self):
         if not self.path: return
         os.makedirs(os.path.dirname(self.path), exist_ok=True)
         with open(self.path, "wb") as f:
             pickle.dump(self._mem, f)
 
+def make_emb_cache(path: Optional[str], dtype: str = "float32"):
+    """
+    cache_path -> cache backend:
+      None / ""   -> no cache
+      "*.pkl"     -> EmbCache (whole dict pickled on save)
+      "*.sqlite" / "*.db" -> SqliteEmbCache (shared by worker processes)
+      other       -> MemmapEmbCache directory (append-only memmap)
+    `dtype` ("float32" | "float16" | "int8") is the storage codec of the last two.
+    """
+    if not path or path.endswith(".pkl"):
+        return EmbCache(path)
+    if path.endswith((".sqlite", ".db")):
+        return SqliteEmbCache(path, codec=dtype)
+    return MemmapEmbCache(path, codec=dtype)
+
+def plan_token_batches(lengths, token_budget: int, max_batch: int) -> List[np.ndarray]:
+    """
+    Longest-first batches whose padded size (count x longest) stays within
+    `token_budget`, at most `max_batch` texts each; every text gets a batch even
+    if alone it exceeds the budget. Returns index arrays into `lengths`.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    order = np.argsort(-lengths, kind="stable")
+    batches, i, n = [], 0, len(order)
+    while i < n:
+        longest = max(int(lengths[order[i]]), 1)
+        size = max(1, min(max_batch, token_budget // longest, n - i))
+        batches.append(order[i:i + size])
+        i += size
+    return batches
+
+CHUNK_POOLS = ("mean", "max", "weighted")
+_SECTION_RE = re.compile(r"\n\s*\n")
+
+def chunk_text(text: str, max_words: int = 180, overlap: int = 30) -> List[str]:
+    """
+    Split a long document into windows of <= max_words words.
+    Windows never cross a blank-line section boundary, so editing one section of
+    a resume only changes that section's chunks (their cache keys); inside a long
+    section windows overlap by `overlap` words. Short texts stay one chunk.
+    """
+    chunks: List[str] = []
+    step = max(1, max_words - max(0, overlap))
+    for sec in _SECTION_RE.split(text or ""):
+        words = sec.split()
+        if not words:
+            continue
+        if len(words) <= max_words:
+            chunks.append(" ".join(words))
+            continue
+        for i in range(0, len(words) - max(0, overlap), step):
+            chunks.append(" ".join(words[i:i + max_words]))
+    return chunks or [text or ""]
+
+def pool_chunks(vecs: np.ndarray, weights: np.ndarray, method: str = "mean") -> np.ndarray:
+    """Chunk vectors (k x d) -> one document vector; weighted = mean weighted by chunk length."""
+    if method == "mean":
+        return vecs.mean(axis=0)
+    if method == "max":
+        return vecs.max(axis=0)
+    if method == "weighted":
+        w = np.asarray(weights, dtype=np.float32)
+        return (vecs * w[:, None]).sum(axis=0) / max(float(w.sum()), 1e-12)
+    raise ValueError(f"Unknown chunk_pool={method}")
+
 @dataclass
 class SbertConfig:
     model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
@@ -51,19 +120,66 @@ class SbertConfig:
     batch_size: int = 64
     normalize: bool = True
     cache_path: Optional[str] = None
+    cache_dtype: str = "float32"    # on-disk codec: "float32" | "float16" | "int8"
+    token_budget: int = 4096        # padded word pieces per forward batch (0 = count-only batching)
+    # long documents: embed overlapping word windows and pool them (0 = whole text, truncated by the model)
+    chunk_words: int = 0
+    chunk_overlap: int = 30
+    chunk_pool: str = "mean"        # "mean" | "max" | "weighted"
+    # bounded in-process layer in front of cache_path (0/None disables a limit)
+    mem_cache_items: int = 20000
+    mem_cache_bytes: Optional[int] = None
+    mem_cache_policy: str = "lru"   # "lru" | "lfu"
+    # encoder backend: "torch" (SentenceTransformer) | "onnx" (onnxruntime, exported on first use)
+    backend: str = "torch"
+    onnx_quantize: bool = False     # dynamic int8 weights
+    onnx_threads: int = 0           # intra-op threads (0 = onnxruntime default)
+    onnx_dir: Optional[str] = None  # default: ml/models/onnx/<model_name>
+    # small encodes (online requests) go through the encoder's shared micro-batching queue (0 = direct calls)
+    dispatch_max_batch: int = 64
+    dispatch_max_wait_ms: float = 5.0
 
 class SbertEmbedder:
     def __init__(self, cfg: SbertConfig):
         self.cfg = cfg
-        key = (cfg.model_name, cfg.device or 'cpu')
-        with _SBERT_LOCK:
-            self.model = _SBERT_MODELS.get(key)
-            if self.model is None:
-                self.model = SentenceTransformer(cfg.model_name, device=cfg.device)
-                _SBERT_MODELS[key] = self.model
+        # weights live in the process-wide registry: one copy per (model, backend) whatever the cache/batch settings
+        self.model = get_encoder(cfg.model_name, cfg.device, cfg.backend, cfg.onnx_quantize, cfg.onnx_threads, cfg.onnx_dir)
+        self.dispatcher = None
+        if int(cfg.dispatch_max_batch or 0) > 1:
+            self.dispatcher = get_dispatcher(cfg.model_name, cfg.device, cfg.backend, cfg.onnx_quantize,
+                                             cfg.onnx_threads, cfg.onnx_dir, max_batch=cfg.dispatch_max_batch,
+                                             max_wait_ms=cfg.dispatch_max_wait_ms)
         self.batch_size = int(cfg.batch_size)
         self.normalize = bool(cfg.normalize)
-        self.cache = EmbCache(cfg.cache_path)
+        self.cache = make_emb_cache(cfg.cache_path, cfg.cache_dtype)
+        self.mem = MemEmbCache(cfg.mem_cache_items, cfg.mem_cache_bytes, cfg.mem_cache_policy)
+
+    def _token_lengths(self, texts: List[str]) -> np.ndarray:
+        cap = int(getattr(self.model, "max_seq_length", 0) or 512)
+        tok = getattr(self.model, "tokenizer", None)
+        if tok is None:
+            return np.array([min(cap, len(t.split()) * 4 // 3 + 2) for t in texts])
+        ids = tok(list(texts), add_special_tokens=True, truncation=True, max_length=cap)["input_ids"]
+        return np.fromiter((len(x) for x in ids), dtype=np.int64, count=len(texts))
+
+    def _encode_model(self, texts: List[str]) -> np.ndarray:
+        """model.encode, batched by token length: misses are sorted by word-piece count and cut into
+        token_budget batches, so a 2k-word resume does not pad a batch of short JDs; order is restored."""
+        dispatcher = self.dispatcher
+        if dispatcher is not None and len(texts) < dispatcher.max_batch:
+            return dispatcher.encode(texts)               # coalesced with concurrent callers
+        budget = int(self.cfg.token_budget or 0)
+        if budget <= 0 or len(texts) <= 1:
+            return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                     normalize_embeddings=False).astype(np.float32)
+        out = None
+        for idx in plan_token_batches(self._token_lengths(texts), budget, self.batch_size):
+            vecs = self.model.encode([texts[i] for i in idx], batch_size=len(idx), convert_to_numpy=True,
+                                     normalize_embeddings=False)
+            if out is None:
+                out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+            out[idx] = vecs
+        return out
 
     @staticmethod
     def _l2norm(x: np.ndarray, eps: float = 1e-12) -> np.ndarray:
@@ -72,33 +188,105 @@ class SbertEmbedder:
         return x / nrm
 
     def encode(self, texts: List[str]) -> np.ndarray:
-        outs: List[Optional[np.ndarray]] = [None] * len(texts)
-        todo_idx, todo_txt = [], []
-        for i, t in enumerate(texts):
-            v = self.cache.get(self.cfg.model_name, t) if self.cache.path else None
-            if v is not None:
+        if int(self.cfg.chunk_words or 0) > 0:
+            return self._encode_chunked(texts)
+        return self._encode_flat(texts)
+
+    def _encode_chunked(self, texts: List[str]) -> np.ndarray:
+        """Chunks of every text go through _encode_flat together (one batched call, cached per chunk),
+        then are pooled back into one vector per text."""
+        if self.cfg.chunk_pool not in CHUNK_POOLS:
+            raise ValueError(f"Unknown chunk_pool={self.cfg.chunk_pool}")
+        per_doc = [chunk_text(t, self.cfg.chunk_words, self.cfg.chunk_overlap) for t in texts]
+        uniq = list(dict.fromkeys(c for cs in per_doc for c in cs))
+        if not uniq:
+            return np.zeros((0, 0), dtype=np.float32)
+        pos = {c: i for i, c in enumerate(uniq)}
+        V = self._l2norm(self._encode_flat(uniq, normalize=False))   # chunks on equal footing before pooling
+        out = np.stack([
+            pool_chunks(V[[pos[c] for c in cs]], np.array([len(c.split()) for c in cs]), self.cfg.chunk_pool)
+            for cs in per_doc
+        ]).astype(np.float32)
+        return self._l2norm(out) if self.normalize else out
+
+    def _encode_flat(self, texts: List[str], normalize: Optional[bool] = None) -> np.ndarray:
+        model = self.cfg.model_name
+        keys = [emb_key(model, t) for t in texts]
+        outs: List[Optional[np.ndarray]] = self.mem.get_many(keys)
+
+        # memory miss -> on-disk cache -> model
+        miss = [i for i, v in enumerate(outs) if v is None]
+        if miss and self.cache.path:
+            found = self.cache.get_many(model, [texts[i] for i in miss])
+            hit = [(i, v) for i, v in zip(miss, found) if v is not None]
+            for i, v in hit:
                 outs[i] = v
-            else:
-                todo_idx.append(i); todo_txt.append(t)
-
-        if todo_txt:
-            vecs = self.model.encode(
-                todo_txt, batch_size=self.batch_size,
-                convert_to_numpy=True, normalize_embeddings=False
-            ).astype(np.float32)
-            for i, v in zip(todo_idx, vecs):
+            self.mem.put_many([keys[i] for i, _ in hit], [v for _, v in hit])
+            miss = [i for i in miss if outs[i] is None]
+
+        if miss:
+            todo_txt = [texts[i] for i in miss]
+            vecs = self._encode_model(todo_txt)
+            for i, v in zip(miss, vecs):
                 outs[i] = v
-                if self.cache.path: self.cache.put(self.cfg.model_name, texts[i], v)
-            if self.cache.path: self.cache.save()
+            self.mem.put_many([keys[i] for i in miss], vecs)
+            if self.cache.path:
+                self.cache.put_many(model, todo_txt, vecs)
+                self.cache.save()
 
         arr = np.stack(outs, axis=0).astype(np.float32)
-        if self.normalize:
+        if (self.normalize if normalize is None else normalize):
             arr = self._l2norm(arr)
         return arr
+
+    def cache_stats(self) -> Dict[str, float]:
+        return self.mem.stats()
+
     def encode_texts(self, texts, normalize=True):
         embs = self.model.encode(texts, normalize_embeddings=normalize, batch_size=32)
         return np.array(embs).astype("float32")
 
+class PairEmbeddings(NamedTuple):
+    """
+    Embeddings behind a pair frame, reusable without re-encoding:
+    E_jd[k] is the vector of jd_ids[k] (same for CVs), and jd_idx/cv_idx map
+    every df row to its rows in E_jd/E_cv.
+    """
+    E_jd: np.ndarray
+    E_cv: np.ndarray
+    jd_ids: pd.Index
+    cv_ids: pd.Index
+    jd_idx: np.ndarray
+    cv_idx: np.ndarray
+
+def _unique_rows(ids) -> Tuple[np.ndarray, pd.Index, np.ndarray]:
+    """Row codes per id (first-appearance order, like drop_duplicates), the ids, and each id's first row."""
+    codes, uniques = pd.factorize(ids, use_na_sentinel=False)
+    first = np.flatnonzero(~pd.Series(codes).duplicated().to_numpy())
+    return codes.astype(np.int64), pd.Index(uniques), first
+
+def rowwise_dot(A: np.ndarray, B: np.ndarray, a_idx: np.ndarray, b_idx: np.ndarray,
+                chunk: int = 65536) -> np.ndarray:
+    """out[i] = A[a_idx[i]] . B[b_idx[i]]; gathers `chunk` rows at a time to bound memory."""
+    out = np.empty(len(a_idx), dtype=np.float32)
+    for s in range(0, len(a_idx), chunk):
+        out[s:s + chunk] = np.einsum("ij,ij->i", A[a_idx[s:s + chunk]], B[b_idx[s:s + chunk]])
+    return out
+
+def segment_minmax(x: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """(x - min) / (max - min + 1e-12) within each code; single-row / flat groups map to 0."""
+    if x.size == 0:
+        return x.astype(np.float32)
+    order = np.argsort(codes, kind="stable")
+    sizes = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))[sizes > 0]
+    lo = np.zeros(sizes.size, dtype=x.dtype)
+    hi = np.zeros(sizes.size, dtype=x.dtype)
+    lo[sizes > 0] = np.minimum.reduceat(x[order], starts)
+    hi[sizes > 0] = np.maximum.reduceat(x[order], starts)
+    lo, hi = lo[codes], hi[codes]
+    return ((x - lo) / (hi - lo + 1e-12)).astype(np.float32)
+
 def add_sbert_similarity_feature(
     df,
     embedder: SbertEmbedder,
@@ -106,31 +294,31 @@ def add_sbert_similarity_feature(
     cv_col: str = "resume_text",
     out_col: str = "emb_cosine",
     per_jd_norm: bool = True,
-) -> Tuple[np.ndarray, np.ndarray]:
-    jd_tbl = df[["jd_id", jd_col]].drop_duplicates("jd_id")
-    cv_tbl = df[["cv_id", cv_col]].drop_duplicates("cv_id")
-
-    E_jd = embedder.encode(jd_tbl[jd_col].astype(str).tolist())
-    E_cv = embedder.encode(cv_tbl[cv_col].astype(str).tolist())
-
-    jd2row = {j: i for i, j in enumerate(jd_tbl["jd_id"].tolist())}
-    cv2row = {c: i for i, c in enumerate(cv_tbl["cv_id"].tolist())}
+    return_index: bool = False,
+) -> Union[Tuple[np.ndarray, np.ndarray], PairEmbeddings]:
+    """
+    df[out_col] = cosine(JD, CV) per row (vectors are normalized by the embedder),
+    plus per-JD min-max in out_col + "_norm". Each distinct JD/CV is encoded once;
+    pairs are scored by gathering rows (factorize codes) and a row-wise einsum.
+    Returns (E_jd, E_cv) (one row per distinct JD/CV, first-seen order), or
+    PairEmbeddings with the id/row mapping when return_index=True.
+    """
+    jd_idx, jd_ids, jd_first = _unique_rows(df["jd_id"])
+    cv_idx, cv_ids, cv_first = _unique_rows(df["cv_id"])
 
-    sims = np.empty(len(df), dtype=np.float32)
-    for i, r in enumerate(df.itertuples(index=False)):
-        j = jd2row[getattr(r, "jd_id")]
-        c = cv2row[getattr(r, "cv_id")]
-        sims[i] = float((E_jd[j] * E_cv[c]).sum())
+    E_jd = np.ascontiguousarray(embedder.encode(df[jd_col].iloc[jd_first].astype(str).tolist()), dtype=np.float32)
+    E_cv = np.ascontiguousarray(embedder.encode(df[cv_col].iloc[cv_first].astype(str).tolist()), dtype=np.float32)
 
+    sims = rowwise_dot(E_jd, E_cv, jd_idx, cv_idx)
     df[out_col] = sims
     if per_jd_norm:
-        df[out_col + "_norm"] = df.groupby("jd_id")[out_col].transform(
-            lambda x: (x - x.min()) / (x.max() - x.min() + 1e-12)
-        )
+        df[out_col + "_norm"] = segment_minmax(sims, jd_idx)
+    if return_index:
+        return PairEmbeddings(E_jd, E_cv, jd_ids, cv_ids, jd_idx, cv_idx)
     return E_jd, E_cv
 
 def get_sbert_embedder(cfg: SbertConfig) -> "SbertEmbedder":
-    key = (cfg.model_name, cfg.device or 'cpu', int(cfg.batch_size), bool(cfg.normalize), cfg.cache_path or '')
+    key = astuple(cfg)
     with _SBERT_LOCK:
         inst = _SBERT_WRAPPERS.get(key)
         if inst is None:
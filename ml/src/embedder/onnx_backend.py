@@ -0,0 +1,152 @@
+from __future__ import annotations
+import json
+import os
+import re
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    _HAS_ORT = True
+except Exception:
+    _HAS_ORT = False
+
+_DEFAULT_ONNX_DIR = Path(__file__).resolve().parents[2] / "models" / "onnx"
+
+
+def _pooling_mode(st_model) -> str:
+    for m in st_model:
+        if type(m).__name__ != "Pooling":
+            continue
+        mode = getattr(m, "pooling_mode", None)                      # sentence-transformers >= 5
+        if isinstance(mode, str):
+            return mode
+        if getattr(m, "pooling_mode_cls_token", False):
+            return "cls"
+        if getattr(m, "pooling_mode_max_tokens", False):
+            return "max"
+        return "mean"
+    return "mean"
+
+def export_onnx(st_model, out_dir: str, quantize: bool = False, opset: int = 17) -> str:
+    """
+    Export the transformer of a SentenceTransformer to out_dir/model.onnx
+    (+ tokenizer and pooling metadata). With `quantize`, also writes
+    model.int8.onnx (onnxruntime dynamic int8 quantization of the MatMul weights).
+    Returns the path of the model to load.
+    """
+    import torch
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    model_path = out / "model.onnx"
+    if not model_path.exists():
+        hf = st_model[0].auto_model.eval()
+        attn = getattr(hf.config, "_attn_implementation", None)
+        if attn and hasattr(hf, "set_attn_implementation"):        # sdpa does not trace cleanly to ONNX
+            hf.set_attn_implementation("eager")
+        tok = st_model.tokenizer
+        names = [n for n in ("input_ids", "attention_mask", "token_type_ids")
+                 if n in tok("warm up", return_tensors="pt")]
+        dummy = tok(["warm up text", "a second, longer warm up text"], padding=True, return_tensors="pt")
+        dyn = {n: {0: "batch", 1: "seq"} for n in names}
+        dyn["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+        class _Wrap(torch.nn.Module):
+            def __init__(self, m):
+                super().__init__()
+                self.m = m
+            def forward(self, *args):
+                return self.m(**dict(zip(names, args))).last_hidden_state
+
+        tmp = model_path.with_suffix(f".tmp{os.getpid()}")
+        with torch.no_grad():
+            torch.onnx.export(_Wrap(hf), tuple(dummy[n] for n in names), str(tmp), input_names=names,
+                              output_names=["last_hidden_state"], dynamic_axes=dyn, opset_version=opset,
+                              dynamo=False)
+        if attn and hasattr(hf, "set_attn_implementation"):
+            hf.set_attn_implementation(attn)                         # the torch model may still be in use
+        os.replace(tmp, model_path)
+        tok.save_pretrained(str(out))
+        meta = {"inputs": names, "pooling": _pooling_mode(st_model), "max_seq_length": int(st_model.max_seq_length),
+                "normalize": any(type(m).__name__ == "Normalize" for m in st_model)}
+        (out / "onnx_meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    if not quantize:
+        return str(model_path)
+    q_path = out / "model.int8.onnx"
+    if not q_path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp = q_path.with_suffix(f".tmp{os.getpid()}")
+        quantize_dynamic(str(model_path), str(tmp), weight_type=QuantType.QInt8)
+        os.replace(tmp, q_path)
+    return str(q_path)
+
+
+class OnnxSentenceEncoder:
+    """
+    onnxruntime stand-in for SentenceTransformer.encode (tokenizer + session +
+    the same pooling/normalization as the exported model). Exposes `tokenizer`
+    and `max_seq_length` like SentenceTransformer.
+    """
+
+    def __init__(self, model_path: str, threads: int = 0):
+        if not _HAS_ORT:
+            raise RuntimeError("backend='onnx' cần onnxruntime: pip install onnxruntime")
+        from transformers import AutoTokenizer
+        d = Path(model_path).parent
+        meta = json.loads((d / "onnx_meta.json").read_text(encoding="utf-8"))
+        self.tokenizer = AutoTokenizer.from_pretrained(str(d))
+        self.max_seq_length = int(meta["max_seq_length"])
+        self.pooling = meta["pooling"]
+        self.normalize = bool(meta["normalize"])
+        self.input_names = list(meta["inputs"])
+        so = ort.SessionOptions()
+        if threads:
+            so.intra_op_num_threads = int(threads)
+            so.inter_op_num_threads = 1
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=so, providers=["CPUExecutionProvider"])
+
+    def _pool(self, h: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return h[:, 0]
+        m = mask[..., None].astype(h.dtype)
+        if self.pooling == "max":
+            return np.where(m > 0, h, -1e9).max(axis=1)
+        return (h * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+
+    def encode(self, texts: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        out: List[np.ndarray] = []
+        order = np.argsort([-len(t) for t in texts], kind="stable")   # like SentenceTransformer: less padding
+        for i in range(0, len(texts), max(1, int(batch_size))):
+            idx = order[i:i + batch_size]
+            enc = self.tokenizer([texts[j] for j in idx], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feeds = {n: enc[n].astype(np.int64) for n in self.input_names}
+            h = self.session.run(None, feeds)[0]
+            out.append(self._pool(h, enc["attention_mask"]))
+        if not out:
+            return np.zeros((0, 0), dtype=np.float32)
+        emb = np.empty((len(texts), out[0].shape[1]), dtype=np.float32)
+        emb[order] = np.concatenate(out)
+        if self.normalize or normalize_embeddings:
+            emb /= np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+        return emb
+
+
+def onnx_dir_for(model_name: str, base: Optional[str] = None) -> str:
+    return str(Path(base) if base else _DEFAULT_ONNX_DIR / re.sub(r"[^A-Za-z0-9._-]+", "__", model_name))
+
+def load_onnx_encoder(model_name: str, onnx_dir: Optional[str] = None, quantize: bool = False,
+                      threads: int = 0, st_model=None) -> OnnxSentenceEncoder:
+    """Export `model_name` once (needs the torch model only the first time) and open it with onnxruntime."""
+    d = onnx_dir_for(model_name, onnx_dir)
+    target = Path(d) / ("model.int8.onnx" if quantize else "model.onnx")
+    if not target.exists():
+        if st_model is None:
+            from sentence_transformers import SentenceTransformer
+            st_model = SentenceTransformer(model_name, device="cpu")
+        export_onnx(st_model, d, quantize=quantize)
+    return OnnxSentenceEncoder(str(target), threads=threads)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from .dispatcher import EmbeddingDispatcher
+
+try:
+    from sentence_transformers import SentenceTransformer
+    _HAS_ST = True
+except Exception:
+    _HAS_ST = False
+
+# One copy of each encoder per process. Every consumer (SbertEmbedder, ml.embeddings,
+# SkillExtractor fuzzy tier, SkillAutoExpander, ner/sbert.py) resolves through
+# get_encoder(), so "all-MiniLM-L6-v2" and "sentence-transformers/all-MiniLM-L6-v2"
+# are the same weights, loaded and warmed up once.
+_REGISTRY_LOCK = threading.RLock()
+_ENCODERS: Dict[Tuple, object] = {}     # key: encoder_key(...)
+_WARM: set = set()
+_DISPATCHERS: Dict[Tuple, EmbeddingDispatcher] = {}   # one batching queue per encoder
+
+ENCODER_BACKENDS = ("torch", "onnx")
+
+
+def canonical_model_name(name: str) -> str:
+    """Hub short names of sentence-transformers models get their org prefix; local paths are absolute."""
+    if os.path.exists(name):
+        return os.path.abspath(name)
+    return name if "/" in name else f"sentence-transformers/{name}"
+
+def encoder_key(model_name: str, device: Optional[str] = None, backend: str = "torch",
+                onnx_quantize: bool = False, onnx_threads: int = 0, onnx_dir: Optional[str] = None) -> Tuple:
+    name = canonical_model_name(model_name)
+    if backend == "torch":
+        return (name, device or "cpu")
+    return (name, backend, bool(onnx_quantize), int(onnx_threads), onnx_dir or "")
+
+def _load(model_name: str, device: Optional[str], backend: str, onnx_quantize: bool, onnx_threads: int,
+          onnx_dir: Optional[str]):
+    if backend == "torch":
+        if not _HAS_ST:
+            raise RuntimeError("sentence-transformers not installed")
+        return SentenceTransformer(model_name, device=device)
+    if backend == "onnx":
+        from .onnx_backend import load_onnx_encoder
+        st = _ENCODERS.get(encoder_key(model_name, device))     # reuse loaded torch weights for the export
+        return load_onnx_encoder(canonical_model_name(model_name), onnx_dir, onnx_quantize, onnx_threads, st_model=st)
+    raise ValueError(f"Unknown encoder backend={backend}")
+
+def get_encoder(model_name: str, device: Optional[str] = None, backend: str = "torch",
+                onnx_quantize: bool = False, onnx_threads: int = 0, onnx_dir: Optional[str] = None):
+    key = encoder_key(model_name, device, backend, onnx_quantize, onnx_threads, onnx_dir)
+    with _REGISTRY_LOCK:
+        enc = _ENCODERS.get(key)
+        if enc is None:
+            enc = _load(key[0], device, backend, onnx_quantize, onnx_threads, onnx_dir)
+            _ENCODERS[key] = enc
+            print(f"[encoder-registry] loaded {key}")
+        return enc
+
+def get_dispatcher(model_name: str, device: Optional[str] = None, backend: str = "torch",
+                   onnx_quantize: bool = False, onnx_threads: int = 0, onnx_dir: Optional[str] = None,
+                   max_batch: int = 64, max_wait_ms: float = 5.0) -> EmbeddingDispatcher:
+    """Shared micro-batching queue of an encoder; max_batch/max_wait_ms apply when it is first created."""
+    key = encoder_key(model_name, device, backend, onnx_quantize, onnx_threads, onnx_dir)
+    with _REGISTRY_LOCK:
+        d = _DISPATCHERS.get(key)
+        if d is None:
+            enc = get_encoder(model_name, device, backend, onnx_quantize, onnx_threads, onnx_dir)
+            d = _DISPATCHERS[key] = EmbeddingDispatcher(enc, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        return d
+
+def register_encoder(model_name: str, encoder, device: Optional[str] = None, backend: str = "torch", **kwargs):
+    """Put an already-built encoder (fine-tuned model, test double) under a registry key."""
+    with _REGISTRY_LOCK:
+        key = encoder_key(model_name, device, backend, **kwargs)
+        _ENCODERS[key] = encoder
+        d = _DISPATCHERS.pop(key, None)
+    if d is not None:
+        d.close()
+
+def unregister_encoder(model_name: str, device: Optional[str] = None, backend: str = "torch", **kwargs):
+    key = encoder_key(model_name, device, backend, **kwargs)
+    with _REGISTRY_LOCK:
+        _ENCODERS.pop(key, None)
+        _WARM.discard(key)
+        d = _DISPATCHERS.pop(key, None)
+    if d is not None:
+        d.close()
+
+def warmup(model_name: str, device: Optional[str] = None, backend: str = "torch", **kwargs):
+    """Load + run one tiny batch (first-call allocations) once per encoder."""
+    key = encoder_key(model_name, device, backend, **kwargs)
+    enc = get_encoder(model_name, device, backend, **kwargs)
+    with _REGISTRY_LOCK:
+        if key in _WARM:
+            return enc
+        _WARM.add(key)
+    enc.encode(["warm up sentence for the encoder", "python developer"], batch_size=2, convert_to_numpy=True)
+    return enc
+
+def loaded_encoders() -> List[Tuple]:
+    with _REGISTRY_LOCK:
+        return list(_ENCODERS)
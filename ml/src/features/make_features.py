@@ -2,8 +2,8 @@ from __future__ import annotations
 from typing import List, Set
 import numpy as np
 import pandas as pd
-from ml.src.scoring import SkillExtractor
-from ml.src.retrieval import bm25_full_groupwise, bm25_skills_groupwise, groupwise_minmax
+from ml.src.scoring import get_skill_extractor, get_skill_store
+from ml.src.retrieval import bm25_full_groupwise, bm25_skills_groupwise, groupwise_minmax, get_bm25_index
 from ml.src.embedder import SbertConfig, SbertEmbedder, add_sbert_similarity_feature, get_sbert_embedder
 
 
@@ -23,6 +23,10 @@ def build_features(
     emb_batch_size: int = 64,
     emb_cache_path: str = None,
     emb_per_jd_norm: bool = True,
+    emb_chunk_words: int = 0,
+    emb_chunk_pool: str = "mean",
+    skill_store_path: str = None,
+    bm25_index_path: str = None,
 ) -> pd.DataFrame:
     required = {"jd_id", "job_description_text", "cv_id", "resume_text"}
     miss = required - set(df.columns)
@@ -35,7 +39,7 @@ def build_features(
         n_hit = len(hit_set & req_set); n_req = len(req_set)
         return (n_hit + laplace_a) / (n_req + laplace_a + laplace_b) if n_req else 0.0
 
-    extr = SkillExtractor(
+    extr = get_skill_extractor(
         fuzzy_threshold=fuzzy_vendor,
         max_alias_len=max_alias_len,
         use_fuzzy=True,
@@ -46,13 +50,23 @@ def build_features(
     cv_skills: List[Set[str]] = [set() for _ in range(n)]
     jd_skills: List[Set[str]] = [set() for _ in range(n)]
 
-    for gid, g in feats.groupby("jd_id"):
+    # one batched extraction for every distinct JD/CV text in the slate
+    groups = list(feats.groupby("jd_id"))
+    jd_texts = [str(g["job_description_text"].iloc[0]) for _, g in groups]
+    cv_texts = feats["resume_text"].astype(str).tolist()
+    uniq_texts = list(dict.fromkeys(jd_texts + cv_texts))
+    if skill_store_path:
+        found = get_skill_store(skill_store_path).extract_many(extr, uniq_texts)
+    else:
+        found = extr.extract_many(uniq_texts)
+    skills_of = dict(zip(uniq_texts, found))
+
+    for (gid, g), jd_text in zip(groups, jd_texts):
         idx = g.index.values
-        jd_text = str(g["job_description_text"].iloc[0])
-        jd_all = set(extr.extract(jd_text))
+        jd_all = set(skills_of[jd_text])
         for row in idx:
             cv_text = str(feats.at[row, "resume_text"])
-            cv_set  = set(extr.extract(cv_text))
+            cv_set  = set(skills_of[cv_text])
             vendor_cov[row] = _cov_smooth(cv_set, jd_all)
             cv_skills[row]  = cv_set
             jd_skills[row]  = jd_all
@@ -61,8 +75,9 @@ def build_features(
     feats["skill_score"] = vendor_cov 
 
     tmp = feats.copy()
+    bm25_kw = {"index": get_bm25_index(bm25_index_path)} if bm25_index_path else {}
     tmp["bm25_full"] = bm25_full_groupwise(
-        tmp, resume_col="resume_text", jd_col="job_description_text", group_col="jd_id"
+        tmp, resume_col="resume_text", jd_col="job_description_text", group_col="jd_id", **bm25_kw
     )
     tmp["bm25_skills"] = bm25_skills_groupwise(
         tmp,
@@ -88,6 +103,8 @@ def build_features(
             batch_size=emb_batch_size,
             normalize=True,
             cache_path=emb_cache_path,
+            chunk_words=emb_chunk_words,
+            chunk_pool=emb_chunk_pool,
         )
         embedder = get_sbert_embedder(cfg)
         add_sbert_similarity_feature(
@@ -133,6 +133,10 @@ class FeatureConfig:
     emb_batch_size: int = 64
     emb_cache_path: str | None = "cache/emb_sbert.pkl"
     emb_per_jd_norm: bool = True
+    emb_chunk_words: int = 0             # >0: chunked long-CV embeddings (e.g. 180 words, pooled)
+    emb_chunk_pool: str = "mean"
+    skill_store_path: str | None = None  # opt-in persistent CV skill cache, e.g. "cache/skills.sqlite" (serving)
+    bm25_index_path: str | None = None   # opt-in, e.g. "cache/bm25_index": global-IDF bm25_full (retrain the ranker first)
 
 @dataclass
 class RankerConfig:
@@ -192,6 +196,10 @@ class CVJDXGBRanker:
             emb_batch_size=self.feat_cfg.emb_batch_size,
             emb_cache_path=self.feat_cfg.emb_cache_path,
             emb_per_jd_norm=self.feat_cfg.emb_per_jd_norm,
+            emb_chunk_words=self.feat_cfg.emb_chunk_words,
+            emb_chunk_pool=self.feat_cfg.emb_chunk_pool,
+            skill_store_path=self.feat_cfg.skill_store_path,
+            bm25_index_path=self.feat_cfg.bm25_index_path,
         )
         missing = [c for c in self.feature_names_ if c not in feats.columns]
         if missing:
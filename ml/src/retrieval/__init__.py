@@ -1 +1,2 @@
-from .bm25_feature import *
\ No newline at end of file
+from .bm25_feature import *
+from .bm25_index import BM25Index, get_bm25_index
\ No newline at end of file
@@ -1,69 +1,20 @@
 from __future__ import annotations
 from typing import List, Dict, Iterable, Optional, Sequence, Tuple
-import re
 import numpy as np
 import pandas as pd
 from rank_bm25 import BM25Okapi
 
-EN_STOP = {
-    # function words
-    "the","a","an","and","or","in","on","for","of","to","with","at","as","by","is","are","was","were",
-    "be","been","being","this","that","these","those","from","into","within","via","using","use","it",
-    "we","you","they","our","their","your","i","he","she","his","her","them","me","my","us","also",
-    # cv/jd common noise
-    "responsible","responsibilities","experienced","experience","experiences","familiar","knowledge",
-    "skills","skill","ability","abilities","proficient","expert","strong","good","excellent","great",
-    "working","work","worked","team","teams","environment","environments","company","companies",
-    "project","projects","role","roles","tasks","task","duties","duty","objective","objectives",
-    "summary","description","descriptions","requirement","requirements","preferred","plus","nice",
-    "including","etc","etc.","eg","e.g","ie","i.e","based","per","performs","perform","performing",
-    "developing","develop","developed","build","building","built","design","designing","designed",
-    "implement","implementation","implemented","maintain","maintaining","maintained","support",
-    "supporting","supported","lead","leading","led","manage","managing","managed","mentor","mentoring",
-    "coordinate","coordinating","coordinated","collaborate","collaboration","collaborated",
-    "degree","bachelor","master","phd","university","college","certification","certificate",
-    "junior","senior","intern","internship","full-time","part-time","contract","freelance","remote",
-    # time/date
-    "monday","tuesday","wednesday","thursday","friday","saturday","sunday",
-    "january","february","march","april","may","june","july","august","september","october","november","december",
-    "jan","feb","mar","apr","jun","jul","aug","sep","sept","oct","nov","dec","year","years","month","months",
-}
-
-CANON_REPLACEMENTS = {
-    r"\bk8s\b": "kubernetes",
-    r"\bgolang\b": "go",
-    r"\bci/?cd\b": "ci cd",
-    r"\bnode\.?js\b": "node.js",
-    r"\breact\.?js\b": "react.js",
-    r"\bnext\.?js\b": "next.js",
-    r"\b\.net\b": ".net",
-    r"\bc#\b": "c#",
-    r"\bc\+\+\b": "c++",
-}
-
-TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+._/#-]*", re.IGNORECASE)
-URL_RE   = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.IGNORECASE)
-TAG_RE   = re.compile(r"<[^>]+>")
-
-def _clean_text(s: str) -> str:
-    s = str(s or "")
-    # html/url/email removal
-    s = TAG_RE.sub(" ", s)
-    s = URL_RE.sub(" ", s)
-    s = EMAIL_RE.sub(" ", s)
-    # whitespace & lowercase
-    s = re.sub(r"\s+", " ", s).strip().lower()
-    # light canonicalization
-    for pat, rep in CANON_REPLACEMENTS.items():
-        s = re.sub(pat, rep, s)
-    return s
-
-def tokenize(text: str, stop: Optional[set] = None) -> List[str]:
-    stop = EN_STOP if stop is None else stop
-    s = _clean_text(text)
-    toks = TOKEN_RE.findall(s)
-    return [t for t in toks if t not in stop]
+try:
+    from .bm25_sparse import bm25_okapi_groupwise
+    _HAS_SPARSE = True
+except ImportError:  # scipy missing -> rank_bm25 loop only
+    _HAS_SPARSE = False
+
+BM25_BACKENDS = ("sparse", "rank_bm25")
+
+# compiled/memoized BM25 cleaner from utils.text_norm; it is deliberately not the
+# skill extractor's clean_text (the ranker's bm25_* features were fit on this one)
+from ..utils.text_norm import tokenize_bm25 as tokenize
 
 # ---------------------------------------------------------------------
 # Core BM25 builders
@@ -82,6 +33,31 @@ def _bm25_scores_for_group(
     bm25 = BM25Okapi(corpus_tokens, k1=k1, b=b)
     return bm25.get_scores(query_tokens).astype(float)
 
+def _bm25_groupwise(df, group_col, make_corpus, make_query, k1, b, backend) -> np.ndarray:
+    """
+    Shared group loop: make_corpus(g) -> token lists of the rows, make_query(gid, g) -> query tokens.
+    backend="rank_bm25": one BM25Okapi per group.
+    backend="sparse"   : all groups scored together by bm25_sparse (same numbers, few matrix ops).
+    """
+    if backend not in BM25_BACKENDS:
+        raise ValueError(f"Unknown backend={backend}")
+    scores = np.zeros(len(df), dtype=float)
+    if len(df) == 0:
+        return scores
+    if backend == "sparse" and _HAS_SPARSE:
+        pos, corpus, codes, queries = [], [], [], []
+        for code, (gid, g) in enumerate(df.groupby(group_col)):
+            docs = make_corpus(g)
+            pos.append(g.index.values); corpus.extend(docs); codes.extend([code] * len(docs))
+            queries.append(make_query(gid, g))
+        s = bm25_okapi_groupwise(corpus, queries, np.asarray(codes), k1=k1, b=b)
+        scores[np.concatenate(pos)] = s
+        return scores
+    for gid, g in df.groupby(group_col):
+        s = _bm25_scores_for_group(make_corpus(g), make_query(gid, g), k1=k1, b=b)
+        scores[g.index.values] = s if len(s) else 0.0
+    return scores
+
 def bm25_full_groupwise(
     df: pd.DataFrame,
     resume_col: str = "resume_text",
@@ -91,22 +67,41 @@ def bm25_full_groupwise(
     analyzer=tokenize,
     k1: float = 1.5,
     b: float = 0.75,
+    index=None,
+    id_col: str = "cv_id",
+    backend: str = "sparse",
 ) -> np.ndarray:
     """
     BM25 (Okapi) per JD group.
     - corpus: tokenized resumes within each group
     - query : tokenized JD (first row in group)
+    - index : optional BM25Index -> score by postings lookup with global IDF
+              (CVs are looked up by `id_col`); groups with a CV the index does not
+              hold yet (empty / not backfilled index) fall back to slate BM25
+    - backend: "sparse" (vectorized, default) | "rank_bm25"
     Returns: np.ndarray aligned to df.index
     """
-    scores = np.zeros(len(df), dtype=float)
-    if len(df) == 0:
+    if index is not None:
+        scores = np.zeros(len(df), dtype=float)
+        slate = []
+        for gid, pos in df.groupby(group_col).indices.items():
+            g = df.iloc[pos]
+            ids = g[id_col].tolist()
+            if len(index) == 0 or not all(d in index for d in ids):
+                slate.append(pos)
+                continue
+            scores[pos] = index.score(analyzer(str(g[jd_col].iloc[0])), ids)
+        if slate:
+            pos = np.concatenate(slate)
+            scores[pos] = bm25_full_groupwise(df.iloc[pos].reset_index(drop=True), resume_col, jd_col, group_col,
+                                              analyzer=analyzer, k1=k1, b=b, backend=backend)
         return scores
-    for gid, g in df.groupby(group_col):
-        corpus = [analyzer(x) for x in g[resume_col].tolist()]
-        query  = analyzer(str(g[jd_col].iloc[0]))
-        s = _bm25_scores_for_group(corpus, query, k1=k1, b=b)
-        scores[g.index.values] = s if len(s) else 0.0
-    return scores
+    return _bm25_groupwise(
+        df, group_col,
+        make_corpus=lambda g: [analyzer(x) for x in g[resume_col].tolist()],
+        make_query=lambda gid, g: analyzer(str(g[jd_col].iloc[0])),
+        k1=k1, b=b, backend=backend,
+    )
 
 def bm25_skills_groupwise(
     df: pd.DataFrame,
@@ -117,6 +112,7 @@ def bm25_skills_groupwise(
     k1: float = 1.5,
     b: float = 0.75,
     sort_skills: bool = True,
+    backend: str = "sparse",
 ) -> np.ndarray:
     """
     BM25 on skills only.
@@ -125,32 +121,17 @@ def bm25_skills_groupwise(
     Notes:
       * if values are sets, we convert to sorted lists for stable scoring.
     """
-    scores = np.zeros(len(df), dtype=float)
-    if len(df) == 0:
-        return scores
-    for gid, g in df.groupby(group_col):
-        idx = g.index
-        # normalize corpus skills
-        corpus = []
-        for x in cv_skills.loc[idx]:
-            if isinstance(x, (set, frozenset)):
-                lst = sorted(x) if sort_skills else list(x)
-            elif isinstance(x, list):
-                lst = x
-            else:
-                lst = []
-            corpus.append(lst)
-        # normalize query skills
-        qraw = jd_skills.loc[idx].iloc[0] if len(idx) else []
-        if isinstance(qraw, (set, frozenset)):
-            query = sorted(qraw) if sort_skills else list(qraw)
-        elif isinstance(qraw, list):
-            query = qraw
-        else:
-            query = []
-        s = _bm25_scores_for_group(corpus, query, k1=k1, b=b)
-        scores[idx] = s if len(s) else 0.0
-    return scores
+    def _as_list(x):
+        if isinstance(x, (set, frozenset)):
+            return sorted(x) if sort_skills else list(x)
+        return x if isinstance(x, list) else []
+
+    return _bm25_groupwise(
+        df, group_col,
+        make_corpus=lambda g: [_as_list(x) for x in cv_skills.loc[g.index]],
+        make_query=lambda gid, g: _as_list(jd_skills.loc[g.index].iloc[0]) if len(g) else [],
+        k1=k1, b=b, backend=backend,
+    )
 
 def bm25_weighted_groupwise(
     df: pd.DataFrame,
@@ -162,6 +143,7 @@ def bm25_weighted_groupwise(
     analyzer=tokenize,
     k1: float = 1.5,
     b: float = 0.75,
+    backend: str = "sparse",
 ) -> np.ndarray:
     """
     Weighted BM25: up-weight important JD terms by repeating them in the query.
@@ -169,7 +151,7 @@ def bm25_weighted_groupwise(
       if None -> falls back to bm25_full_groupwise
     """
     if term_weights_map is None:
-        return bm25_full_groupwise(df, resume_col, jd_col, group_col, analyzer=analyzer, k1=k1, b=b)
+        return bm25_full_groupwise(df, resume_col, jd_col, group_col, analyzer=analyzer, k1=k1, b=b, backend=backend)
 
     def apply_weights(tokens: List[str], weights: Dict[str, float]) -> List[str]:
         out: List[str] = []
@@ -178,73 +160,77 @@ def bm25_weighted_groupwise(
             out.extend([t] * max(1, w))
         return out
 
-    scores = np.zeros(len(df), dtype=float)
-    if len(df) == 0:
-        return scores
-    for gid, g in df.groupby(group_col):
-        corpus = [analyzer(x) for x in g[resume_col].tolist()]
+    def make_query(gid, g):
         base_query = analyzer(str(g[jd_col].iloc[0]))
         tw = term_weights_map.get(str(gid)) or term_weights_map.get(gid) or {}
-        query = apply_weights(base_query, tw) if tw else base_query
-        s = _bm25_scores_for_group(corpus, query, k1=k1, b=b)
-        scores[g.index.values] = s if len(s) else 0.0
-    return scores
+        return apply_weights(base_query, tw) if tw else base_query
+
+    return _bm25_groupwise(
+        df, group_col,
+        make_corpus=lambda g: [analyzer(x) for x in g[resume_col].tolist()],
+        make_query=make_query,
+        k1=k1, b=b, backend=backend,
+    )
 
 # ---------------------------------------------------------------------
 # Normalization utilities
 # ---------------------------------------------------------------------
 
+NORM_METHODS = ("minmax", "zscore", "softmax", "rank", "none")
+
+def _segments(scores: np.ndarray, groups: Iterable):
+    """
+    Factorize `groups` and sort rows by (group, score) once.
+    Returns codes, order (rows sorted by group then score, stable), segment starts
+    (into `order`) and group sizes.
+    """
+    if not isinstance(groups, (pd.Series, pd.Index, np.ndarray)):
+        groups = np.asarray(list(groups), dtype=object)
+    codes, _ = pd.factorize(groups, use_na_sentinel=False)
+    order = np.lexsort((scores, codes))                 # stable: ties keep input order
+    sizes = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    return codes, order, starts, sizes
+
 def groupwise_minmax(scores: np.ndarray, groups: Iterable) -> np.ndarray:
     """Min–max per group → [0..1]."""
-    scores = np.asarray(scores, dtype=float).copy()
-    groups = np.asarray(list(groups))
-    if scores.size == 0:
-        return scores
-    for gid in np.unique(groups):
-        idx = (groups == gid)
-        if idx.sum() <= 1:
-            scores[idx] = 0.0
-            continue
-        s = scores[idx]
-        lo, hi = float(np.min(s)), float(np.max(s))
-        scores[idx] = (s - lo) / (hi - lo + 1e-12) if hi > lo else 0.0
-    return scores
+    return groupwise_norm(scores, groups, method="minmax")
 
 def groupwise_norm(scores: np.ndarray, groups: Iterable, method: str = "minmax") -> np.ndarray:
     """
     General group-wise normalization.
     method ∈ {"minmax", "zscore", "softmax", "rank", "none"}
+    Segment-based (one factorize + one sort, then reduceat/bincount), O(N log N);
+    groups of size 1 map to 0.
     """
+    if method not in NORM_METHODS:
+        raise ValueError(f"Unknown method={method}")
     scores = np.asarray(scores, dtype=float).copy()
-    groups = np.asarray(list(groups))
     if method == "none" or scores.size == 0:
         return scores
 
-    out = np.zeros_like(scores)
-    for gid in np.unique(groups):
-        idx = (groups == gid)
-        s = scores[idx]
-        if s.size <= 1:
-            out[idx] = 0.0
-            continue
-        if method == "minmax":
-            lo, hi = float(np.min(s)), float(np.max(s))
-            out[idx] = (s - lo) / (hi - lo + 1e-12) if hi > lo else 0.0
-        elif method == "zscore":
-            mu, sd = float(np.mean(s)), float(np.std(s) + 1e-12)
-            out[idx] = (s - mu) / sd
-        elif method == "softmax":
-            x = s - float(np.max(s))
-            ex = np.exp(x)
-            out[idx] = ex / (ex.sum() + 1e-12)
-        elif method == "rank":
-            # normalized rank in [0,1]
-            order = s.argsort(kind="mergesort")  # stable
-            r = np.empty_like(order, dtype=float)
-            r[order] = np.linspace(0.0, 1.0, num=s.size, endpoint=True)
-            out[idx] = r
-        else:
-            raise ValueError(f"Unknown method={method}")
+    codes, order, starts, sizes = _segments(scores, groups)
+    n = sizes[codes]
+    if method == "minmax":
+        s_sorted = scores[order]
+        lo = np.minimum.reduceat(s_sorted, starts)[codes]
+        hi = np.maximum.reduceat(s_sorted, starts)[codes]
+        with np.errstate(invalid="ignore"):
+            out = np.where(hi > lo, (scores - lo) / (hi - lo + 1e-12), 0.0)
+    elif method == "zscore":
+        mu = (np.bincount(codes, weights=scores) / sizes)[codes]
+        sd = np.sqrt(np.bincount(codes, weights=(scores - mu) ** 2) / sizes)[codes]
+        out = (scores - mu) / (sd + 1e-12)
+    elif method == "softmax":
+        mx = np.maximum.reduceat(scores[order], starts)[codes]
+        ex = np.exp(scores - mx)
+        out = ex / (np.bincount(codes, weights=ex)[codes] + 1e-12)
+    else:  # rank: normalized position in the stable in-group sort, in [0,1]
+        pos = np.empty(scores.size, dtype=float)
+        pos[order] = np.arange(scores.size) - np.repeat(starts, sizes)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = pos / (n - 1)
+    out[n <= 1] = 0.0
     return out
 
 # ---------------------------------------------------------------------
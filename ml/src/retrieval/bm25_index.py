@@ -0,0 +1,305 @@
+from __future__ import annotations
+import json
+import math
+import os
+import pickle
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single worker only
+    fcntl = None
+
+_INDEX_LOCK = threading.RLock()
+_INDEXES: Dict[str, "BM25Index"] = {}  # key: abs dir
+
+
+class BM25Index:
+    """
+    Incremental BM25 (Okapi) statistics over the whole CV pool.
+    - postings: term -> {doc_id: tf}, doc_len, global document frequencies
+    - idf is global (same formula/epsilon floor as rank_bm25.BM25Okapi), so a
+      CV's score no longer depends on who else is in the slate
+    Persistence (optional `path` dir): snapshot.pkl + append-only ops.jsonl,
+    replayed on load and folded into the snapshot every `compact_every` ops.
+    Several processes (gunicorn workers) may share one dir: ops.jsonl is the
+    common log, appended and compacted under a file lock; each worker tails it
+    before writing and scoring, and reloads when another worker compacted.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.5, b: float = 0.75,
+                 epsilon: float = 0.25, compact_every: int = 1000, analyzer=None):
+        from .bm25_feature import tokenize
+        self.path = Path(path) if path else None
+        self.k1, self.b, self.epsilon = float(k1), float(b), float(epsilon)
+        self.compact_every = int(compact_every)
+        self.analyzer = analyzer or tokenize
+        self._lock = threading.RLock()
+        self._reset()
+        if self.path:
+            self.path.mkdir(parents=True, exist_ok=True)
+            with self._lock, self._file_lock():
+                self._load()
+
+    def _reset(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.total_len = 0
+        self._idf: Optional[Dict[str, float]] = None
+        self._n_ops = 0         # ops in ops.jsonl (not yet in the snapshot)
+        self._ops_off = 0       # bytes of ops.jsonl already applied
+        self._snap_id = None    # snapshot.pkl identity at load
+
+    # ---------------- stats ----------------
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def __contains__(self, doc_id) -> bool:
+        return str(doc_id) in self.doc_len
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_len / len(self.doc_len) if self.doc_len else 0.0
+
+    def idf(self) -> Dict[str, float]:
+        with self._lock:
+            if self._idf is None:
+                n = len(self.doc_len)
+                idf = {t: math.log(n - len(p) + 0.5) - math.log(len(p) + 0.5) for t, p in self.postings.items()}
+                if idf:
+                    eps = self.epsilon * (sum(idf.values()) / len(idf))
+                    idf = {t: (v if v >= 0 else eps) for t, v in idf.items()}
+                self._idf = idf
+            return self._idf
+
+    # ---------------- updates ----------------
+    def _apply_upsert(self, doc_id: str, tf: Dict[str, int]):
+        self._apply_remove(doc_id)
+        for t, c in tf.items():
+            self.postings.setdefault(t, {})[doc_id] = c
+        dl = sum(tf.values())
+        self.doc_len[doc_id] = dl
+        self.doc_terms[doc_id] = tuple(tf)
+        self.total_len += dl
+        self._idf = None
+
+    def _apply_remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for t in terms:
+            p = self.postings.get(t)
+            if p is not None:
+                p.pop(doc_id, None)
+                if not p:
+                    del self.postings[t]
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+        self._idf = None
+
+    def _apply(self, rec: dict):
+        if rec["op"] == "upsert":
+            self._apply_upsert(rec["id"], rec["tf"])
+        else:
+            self._apply_remove(rec["id"])
+
+    def upsert(self, doc_id, text: str):
+        doc_id = str(doc_id)
+        tf = dict(Counter(self.analyzer(text)))
+        with self._lock, self._file_lock():
+            self._sync_locked()             # other workers' ops first: the log order is the truth
+            self._apply_upsert(doc_id, tf)
+            self._log({"op": "upsert", "id": doc_id, "tf": tf})
+        self._maybe_compact()
+
+    def upsert_many(self, items: Iterable[Tuple[object, str]]):
+        for doc_id, text in items:
+            self.upsert(doc_id, text)
+
+    def remove(self, doc_id):
+        doc_id = str(doc_id)
+        with self._lock, self._file_lock():
+            self._sync_locked()
+            if doc_id in self.doc_len:
+                self._apply_remove(doc_id)
+                self._log({"op": "remove", "id": doc_id})
+        self._maybe_compact()
+
+    def rebuild(self, items: Iterable[Tuple[object, str]]) -> int:
+        """
+        Replace the whole index with `items` (backfill from the DB) and write it as the snapshot.
+        Ops other workers log while this runs are replayed on top before the swap.
+        """
+        with self._lock, self._file_lock():
+            self._sync_locked()
+            start_snap, start_off = self._snap_id, self._ops_off
+        fresh = BM25Index(None, k1=self.k1, b=self.b, epsilon=self.epsilon, analyzer=self.analyzer)
+        for doc_id, text in items:
+            fresh._apply_upsert(str(doc_id), dict(Counter(self.analyzer(text or ""))))
+        with self._lock, self._file_lock():
+            self.postings, self.doc_len, self.doc_terms = fresh.postings, fresh.doc_len, fresh.doc_terms
+            self.total_len, self._idf = fresh.total_len, None
+            if self.path:
+                # compacted meanwhile: the whole current log is newer than our DB read
+                self._ops_off = start_off if self._snap_sig() == start_snap else 0
+                self._replay_ops()
+                self._write_snapshot()
+            return len(self.doc_len)
+
+    # ---------------- scoring ----------------
+    def score(self, query_tokens: Sequence[str], doc_ids: Sequence, texts: Optional[Sequence[str]] = None) -> np.ndarray:
+        """
+        BM25 of `query_tokens` for each doc id, by postings lookup.
+        Docs missing from the index are scored from `texts` (if given) with the global stats.
+        """
+        ids = [str(d) for d in doc_ids]
+        out = np.zeros(len(ids), dtype=float)
+        if not ids or not query_tokens:
+            return out
+        self.sync()
+        with self._lock:
+            idf = self.idf()
+            avgdl = self.avgdl
+            extra: Dict[int, Counter] = {}
+            if texts is not None:
+                for i, (d, t) in enumerate(zip(ids, texts)):
+                    if d not in self.doc_len:
+                        extra[i] = Counter(self.analyzer(t))
+            if avgdl <= 0:
+                return out
+            dl = np.array([self.doc_len.get(d, sum(extra[i].values()) if i in extra else 0)
+                           for i, d in enumerate(ids)], dtype=float)
+            norm = self.k1 * (1 - self.b + self.b * dl / avgdl)
+            for q, q_cnt in Counter(query_tokens).items():
+                w = idf.get(q)
+                if not w:
+                    continue
+                post = self.postings.get(q, {})
+                tf = np.array([post.get(d, 0) if i not in extra else extra[i].get(q, 0)
+                               for i, d in enumerate(ids)], dtype=float)
+                out += q_cnt * w * (tf * (self.k1 + 1) / (tf + norm))
+        return out
+
+    # ---------------- persistence ----------------
+    def _files(self):
+        return self.path / "snapshot.pkl", self.path / "ops.jsonl"
+
+    @contextmanager
+    def _file_lock(self):
+        if not self.path or fcntl is None:
+            yield
+            return
+        with open(self.path / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _snap_sig(self):
+        try:
+            st = self._files()[0].stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self):
+        self._reset()
+        snap, _ = self._files()
+        if snap.exists():
+            with snap.open("rb") as f:
+                st = pickle.load(f)
+            self.postings, self.doc_len, self.doc_terms = st["postings"], st["doc_len"], st["doc_terms"]
+            self.total_len = sum(self.doc_len.values())
+        self._snap_id = self._snap_sig()
+        self._replay_ops()
+
+    def _replay_ops(self):
+        """Apply ops.jsonl from the last applied offset; a torn tail (crash mid-write) is cut off the file."""
+        _, ops = self._files()
+        if not ops.exists():
+            return
+        with ops.open("r+b") as f:
+            f.seek(self._ops_off)
+            data = f.read()
+            pos = 0
+            while pos < len(data):
+                end = data.find(b"\n", pos)
+                try:
+                    if end < 0:
+                        raise ValueError("no newline")
+                    rec = json.loads(data[pos:end])
+                except ValueError:
+                    f.truncate(self._ops_off + pos)     # later appends must not land behind a bad line
+                    print(f"[bm25] cut torn ops.jsonl tail at byte {self._ops_off + pos}")
+                    break
+                self._apply(rec)
+                self._n_ops += 1
+                pos = end + 1
+            self._ops_off += pos
+
+    def _sync_locked(self):
+        if not self.path:
+            return
+        if self._snap_sig() != self._snap_id:
+            self._load()                    # another worker compacted: its snapshot has all our ops
+        else:
+            self._replay_ops()
+
+    def sync(self):
+        """Pick up writes of other processes sharing the index dir (cheap stat when nothing changed)."""
+        if not self.path:
+            return
+        ops = self._files()[1]
+        size = ops.stat().st_size if ops.exists() else 0
+        if self._snap_sig() == self._snap_id and size == self._ops_off:
+            return
+        with self._lock, self._file_lock():
+            self._sync_locked()
+
+    def _log(self, rec: dict):
+        # caller holds _lock + file lock and has synced, so our offset is the end of the file
+        if not self.path:
+            return
+        line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self._files()[1], "ab") as f:
+            f.write(line)
+        self._ops_off += len(line)
+        self._n_ops += 1
+
+    def _maybe_compact(self):
+        if self.path and self._n_ops >= self.compact_every:
+            self.compact()
+
+    def _write_snapshot(self):
+        snap, ops = self._files()
+        tmp = snap.with_suffix(f".tmp{os.getpid()}")
+        with tmp.open("wb") as f:
+            pickle.dump({"postings": self.postings, "doc_len": self.doc_len, "doc_terms": self.doc_terms},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snap)
+        ops.write_bytes(b"")
+        self._n_ops, self._ops_off, self._snap_id = 0, 0, self._snap_sig()
+
+    def compact(self):
+        """Fold the op log (every worker's ops, replayed from disk first) into a fresh snapshot."""
+        if not self.path:
+            return
+        with self._lock, self._file_lock():
+            self._sync_locked()
+            self._write_snapshot()
+
+
+def get_bm25_index(path: str, **kwargs) -> BM25Index:
+    key = os.path.abspath(path)
+    with _INDEX_LOCK:
+        inst = _INDEXES.get(key)
+        if inst is None:
+            inst = BM25Index(path, **kwargs)
+            _INDEXES[key] = inst
+        return inst
@@ -0,0 +1,78 @@
+from __future__ import annotations
+from collections import Counter
+from typing import Dict, List, Sequence
+import numpy as np
+import scipy.sparse as sp
+
+
+def _csr_counts(docs: Sequence[Sequence[str]], vocab: Dict[str, int], grow: bool = True) -> sp.csr_matrix:
+    indptr = [0]
+    indices: List[int] = []
+    data: List[int] = []
+    for toks in docs:
+        for t, c in Counter(toks).items():
+            j = vocab.get(t)
+            if j is None:
+                if not grow:
+                    continue
+                j = vocab[t] = len(vocab)
+            indices.append(j)
+            data.append(c)
+        indptr.append(len(indices))
+    return sp.csr_matrix((np.asarray(data, dtype=float), np.asarray(indices, dtype=np.int64), indptr),
+                         shape=(len(docs), max(len(vocab), 1)))
+
+
+def bm25_okapi_groupwise(
+    corpus: Sequence[Sequence[str]],
+    queries: Sequence[Sequence[str]],
+    group_codes: np.ndarray,
+    k1: float = 1.5,
+    b: float = 0.75,
+    epsilon: float = 0.25,
+) -> np.ndarray:
+    """
+    BM25Okapi for many groups at once, numerically identical to building one
+    rank_bm25.BM25Okapi per group.
+    - corpus     : tokens of every row (row i belongs to group group_codes[i])
+    - queries    : query tokens per group (len = n_groups, indexed by code)
+    - group_codes: int codes in [0, n_groups)
+    Per group: document frequencies, avgdl and the epsilon-floored IDF are
+    computed from that group's rows only, like the per-group BM25Okapi.
+    """
+    g = np.asarray(group_codes, dtype=np.int64)
+    n, n_groups = len(corpus), len(queries)
+    if n == 0:
+        return np.zeros(0, dtype=float)
+
+    vocab: Dict[str, int] = {}
+    X = _csr_counts(corpus, vocab)                                   # N x V term frequencies
+    Q = _csr_counts(queries, vocab, grow=False)                      # G x V query term counts
+
+    # group stats
+    dl = np.asarray(X.sum(axis=1)).ravel()
+    n_docs = np.bincount(g, minlength=n_groups).astype(float)
+    avgdl = np.bincount(g, weights=dl, minlength=n_groups) / np.maximum(n_docs, 1)
+
+    # document frequency per (group, term) -> idf on the non-zeros only
+    G = sp.csr_matrix((np.ones(n), (g, np.arange(n))), shape=(n_groups, n))
+    Xb = X.copy(); Xb.data[:] = 1.0
+    DF = (G @ Xb).tocsr()
+    DF.sum_duplicates()
+    rows = np.repeat(np.arange(n_groups), np.diff(DF.indptr))
+    idf = np.log(n_docs[rows] - DF.data + 0.5) - np.log(DF.data + 0.5)
+    nnz = np.diff(DF.indptr)
+    avg_idf = np.bincount(rows, weights=idf, minlength=n_groups) / np.maximum(nnz, 1)
+    idf = np.where(idf < 0, epsilon * avg_idf[rows], idf)
+    IDF = sp.csr_matrix((idf, DF.indices, DF.indptr), shape=DF.shape)
+
+    # query weight per (group, term), gathered to rows
+    W = Q.multiply(IDF).tocsr()[g]
+
+    # saturation on the non-zeros of X
+    row_of = np.repeat(np.arange(n), np.diff(X.indptr))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        norm = k1 * (1 - b + b * dl / avgdl[g])
+    tf = X.data
+    sat = sp.csr_matrix((tf * (k1 + 1) / (tf + norm[row_of]), X.indices, X.indptr), shape=X.shape)
+    return np.asarray(sat.multiply(W).sum(axis=1)).ravel().astype(float)
@@ -1,2 +1,3 @@
-from .skill_extractor import SkillExtractor
+from .skill_extractor import SkillExtractor, get_skill_extractor
+from .skill_store import SkillStore, get_skill_store
 from .location_bonus import *
\ No newline at end of file
@@ -0,0 +1,126 @@
+from __future__ import annotations
+import re
+import string
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Same boundary as the regex engine: (?<![A-Za-z0-9_]) ... (?![A-Za-z0-9_])
+_WORD = frozenset(string.ascii_letters + string.digits + "_")
+
+
+class RegexAliasMatcher:
+    """One big alternation regex; kept as the reference engine."""
+
+    name = "regex"
+
+    def __init__(self, aliases: Iterable[str]):
+        pats: List[str] = []
+        for a in aliases:
+            a = a.strip()
+            if not a:
+                continue
+            pats.append(rf"(?<![A-Za-z0-9_]){re.escape(a)}(?![A-Za-z0-9_])")
+        self._re: Optional[re.Pattern] = re.compile("|".join(pats), re.IGNORECASE) if pats else None
+
+    def find(self, text: str) -> List[str]:
+        if self._re is None:
+            return []
+        return [m.group(0).lower() for m in self._re.finditer(text)]
+
+
+class AhoCorasickAliasMatcher:
+    """
+    Aho-Corasick automaton over alias characters.
+    All occurrences are found in one pass over the text, filtered by the
+    word boundary, then resolved leftmost-first in alias order, which is
+    exactly what re.finditer does on the alternation (same matches).
+    """
+
+    name = "aho"
+
+    def __init__(self, aliases: Iterable[str]):
+        self.aliases: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[int] = [-1]   # alias index ending at node (lowest order wins)
+        for a in aliases:
+            a = a.strip().lower()
+            if not a:
+                continue
+            node = 0
+            for ch in a:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(-1)
+                node = nxt
+            if self._out[node] < 0:
+                self._out[node] = len(self.aliases)
+                self.aliases.append(a)
+        self._lens = [len(a) for a in self.aliases]
+        self._fail, self._dict = self._build_links()
+
+    def _build_links(self) -> Tuple[List[int], List[int]]:
+        goto, out = self._goto, self._out
+        fail = [0] * len(goto)
+        dlink = [0] * len(goto)   # nearest proper suffix node that ends an alias
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]; head += 1
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[nxt] = f if f != nxt else 0
+                dlink[nxt] = fail[nxt] if out[fail[nxt]] >= 0 else dlink[fail[nxt]]
+                queue.append(nxt)
+        return fail, dlink
+
+    def _occurrences(self, text: str) -> List[Tuple[int, int, int]]:
+        goto, fail, out, dlink, lens = self._goto, self._fail, self._out, self._dict, self._lens
+        hits: List[Tuple[int, int, int]] = []
+        n = len(text)
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not node:
+                continue
+            end = i + 1
+            if end < n and text[end] in _WORD:
+                continue
+            m = node if out[node] >= 0 else dlink[node]
+            while m:
+                k = out[m]
+                s = end - lens[k]
+                if s == 0 or text[s - 1] not in _WORD:
+                    hits.append((s, k, end))
+                m = dlink[m]
+        return hits
+
+    def find(self, text: str) -> List[str]:
+        hits = self._occurrences(text.lower())
+        hits.sort()
+        found: List[str] = []
+        pos = 0
+        for s, k, end in hits:
+            if s < pos:
+                continue
+            found.append(self.aliases[k])
+            pos = end
+        return found
+
+
+ALIAS_ENGINES = {
+    "regex": RegexAliasMatcher,
+    "aho": AhoCorasickAliasMatcher,
+}
+
+def make_alias_matcher(engine: str, aliases: Iterable[str]):
+    cls = ALIAS_ENGINES.get(engine)
+    if cls is None:
+        raise ValueError(f"Unknown alias engine={engine!r}; expected one of {sorted(ALIAS_ENGINES)}")
+    return cls(aliases)
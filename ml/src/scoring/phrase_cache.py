@@ -0,0 +1,99 @@
+from __future__ import annotations
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+_CACHE_LOCK = threading.RLock()
+_PHRASE_CACHES: Dict[Tuple[str, str], "PhraseVecCache"] = {}  # key: (model_name, path)
+
+
+class PhraseVecCache:
+    """
+    Bounded LRU phrase -> unit vector cache for the fuzzy tier.
+    With `path`, entries are loaded from / saved to an .npz file
+    (saved on save() and at interpreter exit).
+    """
+
+    def __init__(self, max_items: int = 20000, path: Optional[str] = None):
+        self.max_items = int(max_items)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with np.load(path, allow_pickle=False) as z:
+                    for k, v in zip(z["phrases"].tolist(), z["vecs"]):
+                        self._mem[k] = v
+                self._trim()
+            except Exception:
+                self._mem.clear()
+        if path:
+            atexit.register(self.save)
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+    def _trim(self):
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def get_many(self, phrases: Sequence[str]) -> List[Optional[np.ndarray]]:
+        out: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for p in phrases:
+                v = self._mem.get(p)
+                if v is None:
+                    self.misses += 1
+                else:
+                    self._mem.move_to_end(p)
+                    self.hits += 1
+                out.append(v)
+        return out
+
+    def put_many(self, phrases: Sequence[str], vecs: np.ndarray):
+        if self.max_items <= 0:
+            return
+        vecs = np.asarray(vecs, dtype=np.float32)
+        with self._lock:
+            for p, v in zip(phrases, vecs):
+                self._mem[p] = v
+                self._mem.move_to_end(p)
+            self._trim()
+            self._dirty = True
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._mem), "max_items": self.max_items,
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            phrases = np.array(list(self._mem.keys()), dtype=str)
+            vecs = np.stack(list(self._mem.values())) if self._mem else np.empty((0, 0), np.float32)
+            self._dirty = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp{os.getpid()}.npz"
+        np.savez(tmp, phrases=phrases, vecs=vecs)
+        os.replace(tmp, self.path)
+
+
+def get_phrase_cache(model_name: str, max_items: int = 20000, path: Optional[str] = None) -> PhraseVecCache:
+    """One cache per (model, path): vectors only depend on the encoder, not on thresholds."""
+    key = (model_name, path or "")
+    with _CACHE_LOCK:
+        inst = _PHRASE_CACHES.get(key)
+        if inst is None:
+            inst = PhraseVecCache(max_items=max_items, path=path)
+            _PHRASE_CACHES[key] = inst
+        return inst
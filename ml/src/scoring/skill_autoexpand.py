@@ -7,6 +7,10 @@ try:
 except Exception:
     SentenceTransformer = None
 
+def _encoder(model_name: str):
+    from ml.src.embedder.registry import get_encoder   # same weights as SbertEmbedder/SkillExtractor
+    return get_encoder(model_name)
+
 # ===== Helper =====
 def strip_accents(s: str) -> str:
     return "".join(ch for ch in unicodedata.normalize("NFD", s)
@@ -42,7 +46,7 @@ class SkillAutoExpander:
         with open(self.skills_path, "r", encoding="utf-8") as f:
             self.skills = json.load(f)
 
-        self.model = SentenceTransformer(model_name) if SentenceTransformer else None
+        self.model = _encoder(model_name) if SentenceTransformer else None
         self.skill_id_to_text = {}
         self.skill_id_to_vec = {}
         if self.model:
@@ -1,15 +1,17 @@
 from __future__ import annotations
-import html
+import hashlib
 import json
-import re
+import pickle
+import threading
 import time
-import unicodedata
 import itertools
-from dataclasses import dataclass
-from typing import Dict, List, Set, Tuple, Iterable, Optional
+from dataclasses import dataclass, astuple
+from typing import Dict, List, Set, Tuple, Iterable, Optional, Sequence
 import os
 from pathlib import Path
 import numpy as np
+from .alias_matcher import make_alias_matcher
+from .phrase_cache import get_phrase_cache
 
 
 try:
@@ -18,66 +20,18 @@ try:
 except Exception:
     _HAS_ST = False
 
+try:
+    import faiss
+    _HAS_FAISS = True
+except Exception:
+    _HAS_FAISS = False
 
-EN_STOP = {
-    # base function words
-    "the","a","an","and","or","in","on","for","of","to","with","at","as","by","is","are","was","were",
-    "be","been","being","this","that","these","those","from","into","within","via","using","use","it",
-    "we","you","they","our","their","your","i","he","she","his","her","them","me","my","us","also",
-    # cv/jd common noise
-    "responsible","responsibilities","experienced","experience","experiences","familiar","knowledge",
-    "skills","skill","ability","abilities","proficient","expert","strong","good","excellent","great",
-    "working","work","worked","team","teams","environment","environments","company","companies",
-    "project","projects","role","roles","tasks","task","duties","duty","objective","objectives",
-    "summary","description","descriptions","requirement","requirements","preferred","plus","nice",
-    "including","etc","etc.","eg","e.g","ie","i.e","based","per","performs","perform","performing",
-    "developing","develop","developed","build","building","built","design","designing","designed",
-    "implement","implementation","implemented","maintain","maintaining","maintained","support",
-    "supporting","supported","lead","leading","led","manage","managing","managed","mentor","mentoring",
-    "coordinate","coordinating","coordinated","collaborate","collaboration","collaborated",
-    "degree","bachelor","master","phd","university","college","certification","certificate",
-    "junior","senior","intern","internship","full-time","part-time","contract","freelance","remote",
-    # time/date
-    "monday","tuesday","wednesday","thursday","friday","saturday","sunday",
-    "january","february","march","april","may","june","july","august","september","october","november","december",
-    "jan","feb","mar","apr","jun","jul","aug","sep","sept","oct","nov","dec","year","years","month","months",
-}
-
-# helpful canonical replacements before matching
-CANON_REPLACEMENTS = {
-    r"\bk8s\b": "kubernetes",
-    r"\bgolang\b": "go",
-    r"\bci/?cd\b": "ci cd",
-    r"\bnode\.?js\b": "node.js",
-    r"\breact\.?js\b": "react.js",
-    r"\bnext\.?js\b": "next.js",
-    r"\b\.net\b": ".net",
-    r"\bc#\b": "c#",
-    r"\bc\+\+\b": "c++",
-}
-
-TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+._/#-]*", re.IGNORECASE)
-URL_RE   = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.IGNORECASE)
-TAG_RE   = re.compile(r"<[^>]+>")
-
-def clean_text(s: str) -> str:
-    s = html.unescape(str(s or ""))
-    s = TAG_RE.sub(" ", s)
-    s = URL_RE.sub(" ", s)
-    s = EMAIL_RE.sub(" ", s)
-    s = unicodedata.normalize("NFKC", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch)[0] != "C" or ch in ("\n", "\t"))
-    s = s.replace("\r", " ").replace("\n", " ")
-    s = re.sub(r"\s+", " ", s).strip().lower()
-    for pat, rep in CANON_REPLACEMENTS.items():
-        s = re.sub(pat, rep, s)
-    return s
+
+# text normalization is shared with BM25 (utils.text_norm): compiled once, memoized per text
+from ..utils.text_norm import EN_STOP, clean_text, token_stream
 
 def tokens(text: str) -> List[str]:
-    text = clean_text(text)
-    toks = TOKEN_RE.findall(text)
-    return [t for t in toks if t not in EN_STOP]
+    return [t for t in token_stream(text) if t not in EN_STOP]
 
 def ngrams(seq: List[str], n: int) -> List[str]:
     return [" ".join(seq[i:i+n]) for i in range(len(seq) - n + 1)]
@@ -180,15 +134,22 @@ def get_skill_dict(path_or_dir: str, english_only: bool = False):
     return merged
 
 
-_MODEL_CACHE: Dict[str, "SentenceTransformer"] = {}
 _CANON_VEC_CACHE: Dict[Tuple[str, Tuple[str, ...]], np.ndarray] = {}
 
 def _load_model(model_name: str) -> Optional["SentenceTransformer"]:
     if not _HAS_ST:
         return None
-    if model_name not in _MODEL_CACHE:
-        _MODEL_CACHE[model_name] = SentenceTransformer(model_name)
-    return _MODEL_CACHE[model_name]
+    from ..embedder.registry import get_encoder      # shared with SbertEmbedder: one copy of the weights
+    return get_encoder(model_name)
+
+
+_ARTIFACT_VERSION = 1
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_DEFAULT_DATA_PATH = os.path.join(_SCRIPT_DIR, "data", "vendor")
+_DEFAULT_ARTIFACT_DIR = os.path.join(_SCRIPT_DIR, "data", "compiled")
+
+_EXTRACTOR_LOCK = threading.RLock()
+_EXTRACTORS: Dict[tuple, "SkillExtractor"] = {}  # key: astuple(ExtractorConfig)
 
 
 @dataclass
@@ -198,24 +159,118 @@ class ExtractorConfig:
     max_alias_len: int = 4
     use_fuzzy: bool = True
     max_fuzzy_candidates: int = 500
+    data_path: Optional[str] = None      # vendor json dir/file; None -> data/vendor
+    artifact_dir: Optional[str] = None   # compiled artifacts; None -> data/compiled
+    use_artifact: bool = True
+    alias_engine: str = "aho"            # "aho" | "regex" (see alias_matcher.py)
+    phrase_cache_size: int = 20000       # fuzzy n-gram vectors kept in memory (0 = off)
+    phrase_cache_path: Optional[str] = None
+    fuzzy_index: str = "exact"           # "exact" | "flat" | "hnsw" (faiss, top-1 over canon_vecs)
+    ann_min_canon: int = 2000            # smaller dictionaries always use the exact path
+    ann_recheck_margin: float = 0.05     # ANN scores within thr +/- margin are re-scored exactly
+    hnsw_m: int = 32
+    hnsw_ef_search: int = 64
+
+
+def _vendor_files(data_path: str) -> List[Path]:
+    p = Path(data_path)
+    if p.is_dir():
+        return sorted(p.glob("*.json"))
+    return [p] if p.is_file() else []
+
+def _artifact_fingerprint(cfg: ExtractorConfig, data_path: str) -> str:
+    """Hash of vendor json contents + embedding model: changes whenever the artifact would."""
+    h = hashlib.sha1(f"v{_ARTIFACT_VERSION}|{cfg.model_name if cfg.use_fuzzy else ''}".encode("utf-8"))
+    for f in _vendor_files(data_path):
+        h.update(f.name.encode("utf-8"))
+        h.update(f.read_bytes())
+    return h.hexdigest()[:16]
+
+def _load_artifact(path: Path) -> Optional[dict]:
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            art = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(art, dict) or art.get("version") != _ARTIFACT_VERSION:
+        return None
+    return art
+
+def _save_artifact(path: Path, art: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + f".tmp{os.getpid()}")
+    with tmp.open("wb") as f:
+        pickle.dump(art, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
 
 class SkillExtractor:
     def __init__(self,**kwargs):
         init_time = time.time()
         self.cfg = ExtractorConfig(**kwargs)
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        data_path = os.path.join(script_dir, 'data', 'vendor')
-        skill_dict = get_skill_dict(data_path)
-        self.skill_dict = self._normalize_skill_dict(skill_dict)
-        self.alias2canon: Dict[str, str] = {}
-        self._alias_re = self._build_alias_regex()
-        self.canonical_names = sorted(self.skill_dict.keys())
+        data_path = self.cfg.data_path or _DEFAULT_DATA_PATH
+
+        art, art_path = None, None
+        if self.cfg.use_artifact and _vendor_files(data_path):
+            art_dir = Path(self.cfg.artifact_dir or _DEFAULT_ARTIFACT_DIR)
+            art_path = art_dir / f"skills_{_artifact_fingerprint(self.cfg, data_path)}.pkl"
+            art = _load_artifact(art_path)
+
+        if art is not None:
+            self.skill_dict = art["skill_dict"]
+            self.alias2canon: Dict[str, str] = art["alias2canon"]
+            self.canonical_names = art["canonical_names"]
+        else:
+            skill_dict = get_skill_dict(data_path)
+            self.skill_dict = self._normalize_skill_dict(skill_dict)
+            self.alias2canon = self._build_alias_map()
+            self.canonical_names = sorted(self.skill_dict.keys())
+        self.alias_matcher = self._build_alias_matcher()
 
         # Fuzzy backend
         self.model = _load_model(self.cfg.model_name) if self.cfg.use_fuzzy else None
-        self.canon_vecs = self._embed_canon_skills() if (self.cfg.use_fuzzy and self.model is not None) else None
+        self.canon_vecs = None
+        self.phrase_cache = None
+        if self.cfg.use_fuzzy and self.model is not None:
+            self.phrase_cache = get_phrase_cache(
+                self.cfg.model_name, self.cfg.phrase_cache_size, self.cfg.phrase_cache_path
+            )
+            if art is not None and art.get("canon_vecs") is not None:
+                self.canon_vecs = art["canon_vecs"]
+                _CANON_VEC_CACHE[(self.cfg.model_name, tuple(self.canonical_names))] = self.canon_vecs
+            else:
+                self.canon_vecs = self._embed_canon_skills()
+
+        self._canon_index = self._build_canon_index()
+        self.fingerprint = self._config_fingerprint()
+
+        stale = art is None or (self.canon_vecs is not None and art.get("canon_vecs") is None)
+        if stale and art_path is not None:
+            try:
+                _save_artifact(art_path, self.to_artifact())
+            except OSError as e:
+                print(f"[WARN] Could not write skill artifact {art_path}: {e}")
         print(f"[SkillExtractor] Model loading took: {time.time() - init_time:.4f} seconds")
 
+    def _config_fingerprint(self) -> str:
+        """Identifies everything that changes extract() output: dictionary + matching config."""
+        c = self.cfg
+        h = hashlib.sha1(json.dumps(self.skill_dict, sort_keys=True).encode("utf-8"))
+        fuzzy = (c.model_name, c.fuzzy_threshold, c.max_fuzzy_candidates, c.fuzzy_index) if self._fuzzy_ready() else ()
+        h.update(repr((c.max_alias_len, fuzzy)).encode("utf-8"))
+        return h.hexdigest()[:16]
+
+    def to_artifact(self) -> dict:
+        return {
+            "version": _ARTIFACT_VERSION,
+            "model_name": self.cfg.model_name,
+            "skill_dict": self.skill_dict,
+            "alias2canon": self.alias2canon,
+            "canonical_names": self.canonical_names,
+            "canon_vecs": self.canon_vecs,
+        }
 
     def _normalize_skill_dict(self, sd: Dict[str, List[str]]) -> Dict[str, List[str]]:
         out: Dict[str, List[str]] = {}
@@ -225,16 +280,18 @@ class SkillExtractor:
             out[canon] = unique_keep_order(aliases)
         return out
 
-    def _build_alias_regex(self) -> Optional[re.Pattern]:
-        pats: List[str] = []
+    def _build_alias_map(self) -> Dict[str, str]:
+        alias2canon: Dict[str, str] = {}
         for canon, aliases in self.skill_dict.items():
             for a in aliases:
                 a = a.strip()
-                if not a:
-                    continue
-                self.alias2canon[a] = canon
-                pats.append(rf"(?<![A-Za-z0-9_]){re.escape(a)}(?![A-Za-z0-9_])")
-        return re.compile("|".join(pats), re.IGNORECASE) if pats else None
+                if a:
+                    alias2canon[a] = canon
+        return alias2canon
+
+    def _build_alias_matcher(self):
+        aliases = [a for al in self.skill_dict.values() for a in al]
+        return make_alias_matcher(self.cfg.alias_engine, aliases)
 
     def _embed_canon_skills(self) -> np.ndarray:
         key = (self.cfg.model_name, tuple(self.canonical_names))
@@ -256,6 +313,19 @@ class SkillExtractor:
         _CANON_VEC_CACHE[key] = mat
         return mat
 
+    def _encode_phrases(self, phrases: List[str]) -> np.ndarray:
+        """Unit vectors for phrases; only phrases missing from the phrase cache hit the model."""
+        if self.phrase_cache is None:
+            return self.model.encode(phrases, convert_to_numpy=True, normalize_embeddings=True)
+        vecs = self.phrase_cache.get_many(phrases)
+        miss = [p for p, v in zip(phrases, vecs) if v is None]
+        if miss:
+            enc = self.model.encode(miss, convert_to_numpy=True, normalize_embeddings=True)
+            self.phrase_cache.put_many(miss, enc)
+            fresh = dict(zip(miss, enc))
+            vecs = [fresh[p] if v is None else v for p, v in zip(phrases, vecs)]
+        return np.vstack(vecs).astype(np.float32, copy=False)
+
     def _gen_candidates(self, text: str) -> List[str]:
         toks = tokens(text)
         grams: List[str] = []
@@ -278,37 +348,115 @@ class SkillExtractor:
             good = good[: self.cfg.max_fuzzy_candidates]
         return good
 
-    def extract(self, text: str) -> Set[str]:
-        t0 = time.time()
-        txt = clean_text(text)
+    def _alias_skills(self, txt: str) -> Set[str]:
         out: Set[str] = set()
+        for alias in self.alias_matcher.find(txt):
+            canon = self.alias2canon.get(alias)
+            if canon:
+                out.add(canon)
+        return out
+
+    def _build_canon_index(self):
+        kind = self.cfg.fuzzy_index
+        if kind == "exact" or self.canon_vecs is None or not self.canon_vecs.size:
+            return None
+        if kind not in ("flat", "hnsw"):
+            raise ValueError(f"Unknown fuzzy_index={kind!r}")
+        if not _HAS_FAISS or len(self.canon_vecs) < self.cfg.ann_min_canon:
+            return None
+        vecs = np.ascontiguousarray(self.canon_vecs, dtype=np.float32)
+        dim = vecs.shape[1]
+        if kind == "flat":
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.IndexHNSWFlat(dim, self.cfg.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.cfg.hnsw_ef_search
+        index.add(vecs)
+        return index
+
+    def _best_canon(self, cand_vecs: np.ndarray, chunk: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-1 canonical index + cosine per candidate (vectors are unit-normalized)."""
+        if self._canon_index is not None:
+            return self._best_canon_ann(cand_vecs)
+        return self._best_canon_exact(cand_vecs, chunk)
+
+    def _best_canon_ann(self, cand_vecs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Index stores the full vectors, so a returned score is the exact cosine of the
+        # returned canonical; HNSW may still miss the argmax and return a lower-scoring
+        # canonical, so far from the threshold the pick is approximate. Rows within the
+        # margin on either side (and -1 misses) are re-scored densely, so the hit/miss
+        # decision and the canonical picked there match the exact path.
+        sims, idx = self._canon_index.search(np.ascontiguousarray(cand_vecs, dtype=np.float32), 1)
+        best_idx, best_sim = idx[:, 0].astype(np.int64), sims[:, 0].astype(np.float32)
+        thr = float(self.cfg.fuzzy_threshold)
+        recheck = (best_idx < 0) | (np.abs(best_sim - thr) < self.cfg.ann_recheck_margin)
+        if recheck.any():
+            rows = np.flatnonzero(recheck)
+            ex_idx, ex_sim = self._best_canon_exact(cand_vecs[rows])
+            best_idx[rows], best_sim[rows] = ex_idx, ex_sim
+        return best_idx, best_sim
+
+    def _best_canon_exact(self, cand_vecs: np.ndarray, chunk: int = 4096) -> Tuple[np.ndarray, np.ndarray]:
+        best_idx = np.empty(len(cand_vecs), dtype=np.int64)
+        best_sim = np.empty(len(cand_vecs), dtype=np.float32)
+        for i in range(0, len(cand_vecs), chunk):
+            sims = cand_vecs[i:i+chunk] @ self.canon_vecs.T
+            best_idx[i:i+chunk] = sims.argmax(axis=1)
+            best_sim[i:i+chunk] = sims.max(axis=1)
+        return best_idx, best_sim
+
+    def _fuzzy_ready(self) -> bool:
+        return bool(self.cfg.use_fuzzy and self.model is not None and self.canon_vecs is not None and self.canon_vecs.size)
+
+    def _extract_batch(self, texts: Sequence[str]) -> List[Set[str]]:
+        txts = [clean_text(t) for t in texts]
+        outs = [self._alias_skills(t) for t in txts]
+        if not self._fuzzy_ready():
+            return outs
+
+        # fuzzy: dedupe candidates across all documents -> one encode + one similarity pass
+        cands_per_doc = [self._gen_candidates(t) for t in texts]   # raw text -> memoized token stream shared with BM25
+        uniq = unique_keep_order(itertools.chain.from_iterable(cands_per_doc))
+        if not uniq:
+            return outs
+        best_idx, best_sim = self._best_canon(self._encode_phrases(uniq))
+        thr = float(self.cfg.fuzzy_threshold)
+        hit = {c: self.canonical_names[j] for c, j, s in zip(uniq, best_idx, best_sim) if s >= thr}
+        for out, cands in zip(outs, cands_per_doc):
+            out.update(hit[c] for c in cands if c in hit)
+        return outs
 
-        if self._alias_re:
-            for m in self._alias_re.finditer(txt):
-                alias = m.group(0).lower()
-                canon = self.alias2canon.get(alias)
-                if canon:
-                    out.add(canon)
-
-        if self.cfg.use_fuzzy and self.model is not None and self.canon_vecs is not None and self.canon_vecs.size:
-            cands = self._gen_candidates(txt)
-            if cands:
-                cand_vecs = self.model.encode(cands, convert_to_numpy=True, normalize_embeddings=True)
-                sims = np.einsum("ij,kj->ik", cand_vecs, self.canon_vecs)  # cosine (vectors are unit-normalized)
-                best_idx = sims.argmax(axis=1)
-                best_sim = sims.max(axis=1)
-                thr = float(self.cfg.fuzzy_threshold)
-                for cand, j, s in zip(cands, best_idx, best_sim):
-                    if s >= thr:
-                        out.add(self.canonical_names[j])
+    def extract(self, text: str) -> Set[str]:
+        t0 = time.time()
+        out = self._extract_batch([text])[0]
         print(f"[SkillExtractor] found={len(out)} in {time.time()-t0:.3f}s")
         return out
 
+    def extract_many(self, texts: Sequence[str]) -> List[Set[str]]:
+        """extract() for a whole slate; identical texts are only processed once."""
+        t0 = time.time()
+        texts = [str(t or "") for t in texts]
+        uniq = unique_keep_order(texts)
+        found = dict(zip(uniq, self._extract_batch(uniq)))
+        outs = [set(found[t]) for t in texts]
+        print(f"[SkillExtractor] docs={len(texts)} (unique={len(uniq)}) in {time.time()-t0:.3f}s")
+        return outs
+
     def overlap(self, cv_text: str, jd_text: str) -> Tuple[Set[str], Set[str], Set[str]]:
         cv = self.extract(cv_text)
         jd = self.extract(jd_text)
         return cv, jd, (cv & jd)
 
+def get_skill_extractor(**kwargs) -> "SkillExtractor":
+    """Process-wide SkillExtractor per config (fuzzy threshold, max_alias_len, model, ...)."""
+    key = astuple(ExtractorConfig(**kwargs))
+    with _EXTRACTOR_LOCK:
+        inst = _EXTRACTORS.get(key)
+        if inst is None:
+            inst = SkillExtractor(**kwargs)
+            _EXTRACTORS[key] = inst
+        return inst
+
 def test_sep():
 
     jd = """
@@ -318,7 +466,7 @@ Experienced in PYTHON3 and Fast API; using Postgres + Docker on Amazon Web Servi
 SRE with Kubernetes, Docker, GitOps; strong AWS and Terraform. Automated deployments and used IaC with Terraform.
     """
 
-    extr = SkillExtractor(fuzzy_threshold=0.70, max_alias_len=4)
+    extr = get_skill_extractor(fuzzy_threshold=0.70, max_alias_len=4)
     cv_skills, jd_skills, common = extr.overlap(cv, jd)
     print("CV skills     :", sorted(cv_skills))
     print("JD skills     :", sorted(jd_skills))
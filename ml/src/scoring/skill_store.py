@@ -0,0 +1,90 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Set
+
+from .skill_extractor import SkillExtractor, clean_text
+
+_STORE_LOCK = threading.RLock()
+_STORES: Dict[str, "SkillStore"] = {}  # key: abs path
+
+
+def text_key(text: str, fingerprint: str) -> str:
+    """sha1(extractor fingerprint | normalized text): same text + same extractor -> same skills."""
+    return hashlib.sha1((fingerprint + "|" + clean_text(text)).encode("utf-8")).hexdigest()
+
+
+class SkillStore:
+    """
+    Content-addressed cache of extracted skill sets in a local SQLite file.
+    Safe to share between threads; WAL mode lets several worker processes read
+    while one writes. The connection is reopened after fork (gunicorn --preload).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS skills (key TEXT PRIMARY KEY, skills TEXT NOT NULL, created_at INTEGER)"
+            )
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Set[str]]:
+        keys = list(dict.fromkeys(keys))
+        out: Dict[str, Set[str]] = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(keys), 500):   # sqlite variable limit
+                part = keys[i:i+500]
+                q = "SELECT key, skills FROM skills WHERE key IN (%s)" % ",".join("?" * len(part))
+                for k, v in conn.execute(q, part):
+                    out[k] = set(json.loads(v))
+        return out
+
+    def put_many(self, items: Dict[str, Iterable[str]]):
+        if not items:
+            return
+        now = int(time.time())
+        rows = [(k, json.dumps(sorted(v), ensure_ascii=False), now) for k, v in items.items()]
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO skills VALUES (?, ?, ?)", rows)
+            conn.commit()
+
+    def extract_many(self, extr: SkillExtractor, texts: Sequence[str]) -> List[Set[str]]:
+        """extr.extract_many() that only runs the extractor for texts not seen before."""
+        texts = [str(t or "") for t in texts]
+        keys = [text_key(t, extr.fingerprint) for t in texts]
+        found = self.get_many(keys)
+        todo = {k: t for k, t in zip(keys, texts) if k not in found}
+        if todo:
+            fresh = dict(zip(todo.keys(), extr.extract_many(list(todo.values()))))
+            self.put_many(fresh)
+            found.update(fresh)
+        return [set(found[k]) for k in keys]
+
+
+def get_skill_store(path: str) -> SkillStore:
+    key = os.path.abspath(path)
+    with _STORE_LOCK:
+        inst = _STORES.get(key)
+        if inst is None:
+            inst = SkillStore(path)
+            _STORES[key] = inst
+        return inst
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import html
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Normalization shared by BM25 (retrieval.bm25_feature) and the skill extractor
+# (scoring.skill_extractor): every pattern is compiled once and clean/tokenize
+# results are memoized, so a CV/JD text seen by several requests is only cleaned
+# and tokenized once. BM25 keeps its own lighter cleaner (clean_text_bm25): the
+# bm25_* features of the trained ranker were fit on it.
+
+EN_STOP = {
+    # base function words
+    "the","a","an","and","or","in","on","for","of","to","with","at","as","by","is","are","was","were",
+    "be","been","being","this","that","these","those","from","into","within","via","using","use","it",
+    "we","you","they","our","their","your","i","he","she","his","her","them","me","my","us","also",
+    # cv/jd common noise
+    "responsible","responsibilities","experienced","experience","experiences","familiar","knowledge",
+    "skills","skill","ability","abilities","proficient","expert","strong","good","excellent","great",
+    "working","work","worked","team","teams","environment","environments","company","companies",
+    "project","projects","role","roles","tasks","task","duties","duty","objective","objectives",
+    "summary","description","descriptions","requirement","requirements","preferred","plus","nice",
+    "including","etc","etc.","eg","e.g","ie","i.e","based","per","performs","perform","performing",
+    "developing","develop","developed","build","building","built","design","designing","designed",
+    "implement","implementation","implemented","maintain","maintaining","maintained","support",
+    "supporting","supported","lead","leading","led","manage","managing","managed","mentor","mentoring",
+    "coordinate","coordinating","coordinated","collaborate","collaboration","collaborated",
+    "degree","bachelor","master","phd","university","college","certification","certificate",
+    "junior","senior","intern","internship","full-time","part-time","contract","freelance","remote",
+    # time/date
+    "monday","tuesday","wednesday","thursday","friday","saturday","sunday",
+    "january","february","march","april","may","june","july","august","september","october","november","december",
+    "jan","feb","mar","apr","jun","jul","aug","sep","sept","oct","nov","dec","year","years","month","months",
+}
+
+# helpful canonical replacements before matching
+CANON_REPLACEMENTS = {
+    r"\bk8s\b": "kubernetes",
+    r"\bgolang\b": "go",
+    r"\bci/?cd\b": "ci cd",
+    r"\bnode\.?js\b": "node.js",
+    r"\breact\.?js\b": "react.js",
+    r"\bnext\.?js\b": "next.js",
+    r"\b\.net\b": ".net",
+    r"\bc#\b": "c#",
+    r"\bc\+\+\b": "c++",
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+._/#-]*", re.IGNORECASE)
+URL_RE   = re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE)
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", re.IGNORECASE)
+TAG_RE   = re.compile(r"<[^>]+>")
+WS_RE    = re.compile(r"\s+")
+
+# all CANON_REPLACEMENTS as one alternation: the patterns never overlap and no
+# replacement can be matched by another pattern, so one pass equals the old re.sub loop
+_CANON_RE = re.compile("|".join(f"(?P<g{i}>{p})" for i, p in enumerate(CANON_REPLACEMENTS)))
+_CANON_REP = {f"g{i}": r for i, r in enumerate(CANON_REPLACEMENTS.values())}
+_LINE_WS = str.maketrans({"\r": None, "\n": " ", "\t": " "})
+
+MEMO_SIZE = 4096
+
+
+def _canon_sub(m: re.Match) -> str:
+    return _CANON_REP[m.lastgroup]
+
+@lru_cache(maxsize=MEMO_SIZE)
+def clean_text(s: str) -> str:
+    s = html.unescape(str(s or ""))
+    s = TAG_RE.sub(" ", s)
+    s = URL_RE.sub(" ", s)
+    s = EMAIL_RE.sub(" ", s)
+    s = unicodedata.normalize("NFKC", s)
+    s = s.translate(_LINE_WS)           # \r is a control char (dropped), \n/\t collapse to spaces below
+    if not s.isprintable():             # slow path only when control/format chars remain
+        s = "".join(ch for ch in s if unicodedata.category(ch)[0] != "C")
+    s = WS_RE.sub(" ", s).strip().lower()
+    return _CANON_RE.sub(_canon_sub, s)
+
+@lru_cache(maxsize=MEMO_SIZE)
+def token_stream(text: str) -> Tuple[str, ...]:
+    """All tokens of clean_text(text), stopwords included (callers filter with their own list)."""
+    return tuple(TOKEN_RE.findall(clean_text(text)))
+
+def tokenize(text: str, stop: Optional[set] = None) -> List[str]:
+    stop = EN_STOP if stop is None else stop
+    return [t for t in token_stream(text) if t not in stop]
+
+@lru_cache(maxsize=MEMO_SIZE)
+def clean_text_bm25(s: str) -> str:
+    """BM25 cleaner: tags/urls/emails, whitespace, lowercase, canonical rewrites (no unescape/NFKC/control pass)."""
+    s = str(s or "")
+    s = TAG_RE.sub(" ", s)
+    s = URL_RE.sub(" ", s)
+    s = EMAIL_RE.sub(" ", s)
+    s = WS_RE.sub(" ", s).strip().lower()
+    return _CANON_RE.sub(_canon_sub, s)
+
+@lru_cache(maxsize=MEMO_SIZE)
+def bm25_token_stream(text: str) -> Tuple[str, ...]:
+    return tuple(TOKEN_RE.findall(clean_text_bm25(text)))
+
+def tokenize_bm25(text: str, stop: Optional[set] = None) -> List[str]:
+    stop = EN_STOP if stop is None else stop
+    return [t for t in bm25_token_stream(text) if t not in stop]
+
+def memo_info() -> dict:
+    return {"clean_text": clean_text.cache_info()._asdict(), "token_stream": token_stream.cache_info()._asdict(),
+            "clean_text_bm25": clean_text_bm25.cache_info()._asdict(),
+            "bm25_token_stream": bm25_token_stream.cache_info()._asdict()}
@@ -0,0 +1,38 @@
+import random
+import pytest
+from ml.src.scoring.alias_matcher import make_alias_matcher
+
+ALIASES = [
+    "java", "javascript", "java script", "c", "c++", "c#", ".net", "asp.net",
+    "node.js", "node", "react.js", "react", "ci cd", "ci", "go", "sql", "postgre sql",
+    "postgres", "machine learning", "learning", "aws", "amazon web services", "web services",
+    "java",  # duplicate alias keeps the first position
+]
+
+@pytest.mark.parametrize("text", [
+    "",
+    "java javascript java script",
+    "c++ and c# on .net, asp.net core; node.js/react.js",
+    "ci cd pipelines, cicd, ci/cd",
+    "postgre sql vs postgres sql; machine learning engineer",
+    "amazon web services web services aws_lambda javax",
+    "go-lang golang go",
+])
+def test_aho_matches_regex(text):
+    rx = make_alias_matcher("regex", ALIASES)
+    ac = make_alias_matcher("aho", ALIASES)
+    assert ac.find(text) == rx.find(text)
+
+def test_aho_matches_regex_random():
+    rng = random.Random(7)
+    words = ALIASES + ["the", "x", "+", "/", "-", ".", "script", "services", "_"]
+    rx = make_alias_matcher("regex", ALIASES)
+    ac = make_alias_matcher("aho", ALIASES)
+    for _ in range(300):
+        seps = [" ", "", ",", "/", " "]
+        text = "".join(rng.choice(words) + rng.choice(seps) for _ in range(rng.randint(1, 30)))
+        assert ac.find(text) == rx.find(text), text
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        make_alias_matcher("nope", ALIASES)
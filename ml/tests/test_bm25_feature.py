@@ -72,3 +72,70 @@ def test_bm25_skills_groupwise(df_bm25):
     ranked_cv = df_bm25.iloc[order]["cv_id"].tolist()
     assert ranked_cv[0] == "cv-1"
     assert ranked_cv[-1] == "cv-3"
+
+
+def test_bm25_index_matches_okapi_on_same_corpus(df_bm25, tmp_path):
+    from rank_bm25 import BM25Okapi
+    idx = bm25.BM25Index(str(tmp_path / "bm25"))
+    idx.upsert_many(zip(df_bm25["cv_id"], df_bm25["resume_text"]))
+    query = bm25.tokenize(df_bm25["job_description_text"].iloc[0])
+    ref = BM25Okapi([bm25.tokenize(t) for t in df_bm25["resume_text"]]).get_scores(query)
+    got = bm25.bm25_full_groupwise(df_bm25, index=idx)
+    assert np.allclose(got, ref)
+
+    # persistence: op log replay + compaction cho kết quả giống hệt
+    again = bm25.BM25Index(str(tmp_path / "bm25"))
+    assert np.allclose(again.score(query, df_bm25["cv_id"]), ref)
+    again.compact()
+    assert np.allclose(bm25.BM25Index(str(tmp_path / "bm25")).score(query, df_bm25["cv_id"]), ref)
+
+def test_bm25_index_update_and_remove(df_bm25):
+    idx = bm25.BM25Index()
+    idx.upsert_many(zip(df_bm25["cv_id"], df_bm25["resume_text"]))
+    query = bm25.tokenize("python fastapi")
+    before = idx.score(query, ["cv-3"])[0]
+    idx.upsert("cv-3", "Python FastAPI Python")
+    assert idx.score(query, ["cv-3"])[0] > before
+    idx.remove("cv-3")
+    assert "cv-3" not in idx and len(idx) == 2
+    # id chưa index: chấm từ text với thống kê toàn cục (không đổi IDF)
+    adhoc = idx.score(query, ["cv-1", "cv-x"], texts=["", "Python FastAPI Python"])
+    assert adhoc[0] == idx.score(query, ["cv-1"])[0]
+    assert adhoc[1] != 0 and len(idx) == 2
+
+def test_bm25_index_shared_dir_keeps_other_workers_ops(df_bm25, tmp_path):
+    # 2 worker cùng thư mục: compact của một bên không được làm mất op của bên kia
+    path = str(tmp_path / "bm25")
+    a, b = bm25.BM25Index(path), bm25.BM25Index(path)
+    a.upsert("cv-1", df_bm25["resume_text"].iloc[0])
+    b.upsert("cv-2", df_bm25["resume_text"].iloc[1])
+    a.compact()
+    b.upsert("cv-3", df_bm25["resume_text"].iloc[2])
+    assert len(a) == 2          # a chưa sync
+    query = bm25.tokenize("python fastapi")
+    assert np.allclose(a.score(query, ["cv-1", "cv-2", "cv-3"]), b.score(query, ["cv-1", "cv-2", "cv-3"]))
+    assert len(a) == 3 and len(b) == 3
+    b.compact()
+    a.remove("cv-2")
+    assert set(bm25.BM25Index(path).doc_len) == {"cv-1", "cv-3"}
+
+def test_bm25_index_cuts_torn_op(df_bm25, tmp_path):
+    path = tmp_path / "bm25"
+    idx = bm25.BM25Index(str(path))
+    idx.upsert("cv-1", df_bm25["resume_text"].iloc[0])
+    with open(path / "ops.jsonl", "ab") as f:
+        f.write(b'{"op": "upsert", "id": "cv-2", "tf"')     # crash giữa lúc ghi
+    again = bm25.BM25Index(str(path))
+    assert len(again) == 1
+    again.upsert("cv-3", df_bm25["resume_text"].iloc[2])
+    assert set(bm25.BM25Index(str(path)).doc_len) == {"cv-1", "cv-3"}
+
+def test_bm25_full_groupwise_index_falls_back_to_slate(df_bm25, tmp_path):
+    slate = bm25.bm25_full_groupwise(df_bm25)
+    idx = bm25.BM25Index(str(tmp_path / "bm25"))
+    assert np.allclose(bm25.bm25_full_groupwise(df_bm25, index=idx), slate)     # index rỗng
+    idx.upsert("cv-1", df_bm25["resume_text"].iloc[0])
+    assert np.allclose(bm25.bm25_full_groupwise(df_bm25, index=idx), slate)     # thiếu CV
+    assert idx.rebuild(zip(df_bm25["cv_id"], df_bm25["resume_text"])) == len(df_bm25)
+    assert not (tmp_path / "bm25" / "ops.jsonl").read_bytes()
+    assert np.allclose(bm25.bm25_full_groupwise(df_bm25, index=bm25.BM25Index(str(tmp_path / "bm25"))), slate)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+import ml.src.retrieval as bm25
+
+VOCAB = ["python", "java", "docker", "aws", "kubernetes", "sql", "react", "go", "spark", "kafka", "linux", "git"]
+
+@pytest.fixture
+def df_groups():
+    rng = np.random.default_rng(3)
+    rows = []
+    for j in range(12):
+        jd = " ".join(rng.choice(VOCAB, size=rng.integers(1, 8)))
+        for c in range(rng.integers(1, 9)):
+            cv = " ".join(rng.choice(VOCAB, size=rng.integers(1, 25)))
+            rows.append({"jd_id": f"jd-{j}", "job_description_text": jd, "cv_id": f"cv-{j}-{c}", "resume_text": cv})
+    df = pd.DataFrame(rows).sample(frac=1.0, random_state=0).reset_index(drop=True)  # groups interleaved
+    return df
+
+def test_full_parity(df_groups):
+    ref = bm25.bm25_full_groupwise(df_groups, backend="rank_bm25")
+    got = bm25.bm25_full_groupwise(df_groups, backend="sparse")
+    assert np.allclose(got, ref, rtol=1e-9, atol=1e-12)
+
+def test_skills_parity(df_groups):
+    cv_sk = df_groups["resume_text"].map(lambda t: set(t.split()[:4]))
+    jd_sk = df_groups["job_description_text"].map(lambda t: set(t.split()))
+    ref = bm25.bm25_skills_groupwise(df_groups, cv_sk, jd_sk, backend="rank_bm25")
+    got = bm25.bm25_skills_groupwise(df_groups, cv_sk, jd_sk, backend="sparse")
+    assert np.allclose(got, ref, rtol=1e-9, atol=1e-12)
+
+def test_weighted_parity(df_groups):
+    tw = {"jd-0": {"python": 3.0, "docker": 2.0}, "jd-5": {"aws": 4.0}}
+    ref = bm25.bm25_weighted_groupwise(df_groups, term_weights_map=tw, backend="rank_bm25")
+    got = bm25.bm25_weighted_groupwise(df_groups, term_weights_map=tw, backend="sparse")
+    assert np.allclose(got, ref, rtol=1e-9, atol=1e-12)
+
+def test_unknown_backend(df_groups):
+    with pytest.raises(ValueError):
+        bm25.bm25_full_groupwise(df_groups, backend="nope")
+
+def _norm_loop(scores, groups, method):
+    # bản cũ: vòng lặp theo từng group
+    out = np.zeros_like(scores)
+    for gid in np.unique(groups):
+        idx = groups == gid
+        s = scores[idx]
+        if s.size <= 1:
+            continue
+        if method == "minmax":
+            lo, hi = s.min(), s.max()
+            out[idx] = (s - lo) / (hi - lo + 1e-12) if hi > lo else 0.0
+        elif method == "zscore":
+            out[idx] = (s - s.mean()) / (s.std() + 1e-12)
+        elif method == "softmax":
+            ex = np.exp(s - s.max())
+            out[idx] = ex / (ex.sum() + 1e-12)
+        else:
+            r = np.empty(s.size)
+            r[s.argsort(kind="mergesort")] = np.linspace(0.0, 1.0, num=s.size)
+            out[idx] = r
+    return out
+
+@pytest.mark.parametrize("method", ["minmax", "zscore", "softmax", "rank"])
+def test_groupwise_norm_matches_loop(method):
+    rng = np.random.default_rng(7)
+    groups = rng.choice([f"jd-{i}" for i in range(40)], size=600)
+    scores = rng.integers(0, 6, size=600).astype(float)   # nhiều giá trị trùng -> kiểm tra tie/rank
+    scores[groups == "jd-0"] = 2.0                         # group hằng số
+    got = bm25.groupwise_norm(scores, pd.Series(groups), method=method)
+    np.testing.assert_allclose(got, _norm_loop(scores, groups, method), atol=1e-12)
+    assert bm25.groupwise_norm([3.0], ["solo"], method=method).tolist() == [0.0]
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import pytest
+
+from ml.src.embedder.dispatcher import EmbeddingDispatcher
+
+
+class _Enc:
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+    def encode(self, texts, **kw):
+        self.batches.append(len(texts))
+        time.sleep(self.delay)
+        if any(t == "boom" for t in texts):
+            raise RuntimeError("boom")
+        return np.array([[len(t), ord(t[0])] for t in texts], dtype=np.float32)
+
+def _expect(texts):
+    return np.array([[len(t), ord(t[0])] for t in texts], dtype=np.float32)
+
+def test_concurrent_callers_share_batches():
+    enc = _Enc(delay=0.005)
+    d = EmbeddingDispatcher(enc, max_batch=16, max_wait_ms=20)
+    results, barrier = {}, threading.Barrier(12)
+    def call(i):
+        texts = [f"t{i}-{k}" * (i + 1) for k in range(i % 3 + 1)]
+        barrier.wait()
+        results[i] = (texts, d.encode(texts, timeout=5))
+    th = [threading.Thread(target=call, args=(i,)) for i in range(12)]
+    [t.start() for t in th]
+    [t.join() for t in th]
+    d.close()
+    for texts, got in results.values():
+        np.testing.assert_array_equal(got, _expect(texts))      # mỗi caller nhận đúng các dòng của mình
+    assert len(enc.batches) < 12 and max(enc.batches) <= 16
+    assert sum(enc.batches) == sum(len(t) for t, _ in results.values())
+
+def test_large_request_bypasses_queue_and_errors_propagate():
+    enc = _Enc()
+    d = EmbeddingDispatcher(enc, max_batch=4, max_wait_ms=1)
+    big = [f"x{i}" for i in range(10)]
+    np.testing.assert_array_equal(d.encode(big), _expect(big))
+    assert enc.batches == [10] and d._thread is None
+    with pytest.raises(RuntimeError):
+        d.encode(["boom"], timeout=5)
+    np.testing.assert_array_equal(d.encode(["ok"], timeout=5), _expect(["ok"]))   # worker vẫn sống sau lỗi
+    assert d.encode([]).shape[0] == 0
+    d.close()
+
+def test_aencode_from_coroutines():
+    enc = _Enc()
+    d = EmbeddingDispatcher(enc, max_batch=32, max_wait_ms=10)
+    async def main():
+        return await asyncio.gather(*(d.aencode([f"q{i}"]) for i in range(8)))
+    out = asyncio.run(main())
+    d.close()
+    for i, got in enumerate(out):
+        np.testing.assert_array_equal(got, _expect([f"q{i}"]))
+    assert sum(enc.batches) == 8 and len(enc.batches) <= 2
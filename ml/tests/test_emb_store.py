@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pytest
+from ml.src.embedder.emb_store import MemmapEmbCache
+
+M = "mini"
+
+def _vecs(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+def test_memmap_roundtrip_and_reopen(tmp_path):
+    path = str(tmp_path / "emb")
+    c = MemmapEmbCache(path)
+    V = _vecs(5)
+    c.put_many(M, [f"cv {i}" for i in range(5)], V)
+    c.put(M, "jd", V[0] * 2)
+    c.save()
+    assert c.get(M, "CV  3") is not None            # key dùng text đã chuẩn hoá
+    np.testing.assert_array_equal(c.get(M, "cv 3"), V[3])
+    assert c.get("other-model", "cv 3") is None
+
+    c2 = MemmapEmbCache(path)
+    assert len(c2) == 6 and c2.dim == 8
+    np.testing.assert_array_equal(c2.get(M, "jd"), V[0] * 2)
+
+def test_memmap_ignores_torn_tail(tmp_path):
+    path = str(tmp_path / "emb")
+    c = MemmapEmbCache(path)
+    c.put_many(M, ["a", "b"], _vecs(2))
+    c.save()
+    vecs, keys = c._files()
+    c._close_writers()
+    with open(vecs, "ab") as f:                     # nửa vector (crash giữa lúc ghi)
+        f.write(b"\0" * 12)
+    with open(keys, "a", encoding="utf-8") as f:
+        f.write("deadbeef\t")
+    c2 = MemmapEmbCache(path)
+    assert len(c2) == 2 and os.path.getsize(vecs) == 2 * 8 * 4
+    c2.put(M, "c", _vecs(1, seed=1)[0])
+    c2.save()
+    assert len(MemmapEmbCache(path)) == 3
+
+def test_memmap_compaction(tmp_path):
+    path = str(tmp_path / "emb")
+    c = MemmapEmbCache(path)
+    for i in range(4):                              # ghi đè cùng key -> dead rows
+        c.put_many(M, ["x", "y"], _vecs(2, seed=i))
+    last = _vecs(2, seed=3)
+    c.save()
+    assert c.gen == 1 and c._rows == 2
+    c2 = MemmapEmbCache(path)
+    np.testing.assert_array_equal(c2.get(M, "y"), last[1])
+    assert sorted(os.listdir(path)) == ["keys.1.tsv", "meta.json", "vecs.1.f32"]
+
+def test_make_emb_cache_by_suffix(tmp_path):
+    from ml.src.embedder.embedding_feature import EmbCache, make_emb_cache
+    assert isinstance(make_emb_cache(str(tmp_path / "emb_sbert.pkl")), EmbCache)
+    assert make_emb_cache(None).path is None
+    assert isinstance(make_emb_cache(str(tmp_path / "emb_sbert")), MemmapEmbCache)
+    assert make_emb_cache(str(tmp_path / "emb_sbert.sqlite")).__class__.__name__ == "SqliteEmbCache"
+
+def _worker_put(path, i):
+    from ml.src.embedder.emb_store import SqliteEmbCache
+    c = SqliteEmbCache(path)
+    c.put_many(M, ["shared", f"w{i}"], _vecs(2, seed=i))
+
+def test_sqlite_cache_shared_between_processes(tmp_path):
+    import multiprocessing as mp
+    from ml.src.embedder.emb_store import SqliteEmbCache
+    path = str(tmp_path / "emb.sqlite")
+    c = SqliteEmbCache(path)
+    ctx = mp.get_context("spawn")
+    procs = [ctx.Process(target=_worker_put, args=(path, i)) for i in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+    assert len(c) == 4                               # "shared" chỉ ghi một lần
+    got = c.get_many(M, ["w0", "w2", "missing"])
+    np.testing.assert_array_equal(got[1], _vecs(2, seed=2)[1])
+    assert got[2] is None
+
+def test_mem_cache_lru_and_lfu():
+    from ml.src.embedder.emb_store import MemEmbCache
+    V = _vecs(4)
+    lru = MemEmbCache(max_items=3, policy="lru")
+    lru.put_many(["a", "b", "c"], V[:3])
+    lru.get_many(["a"])                              # a mới dùng -> b bị loại
+    lru.put_many(["d"], V[3:])
+    assert [v is None for v in lru.get_many(["a", "b", "c", "d"])] == [False, True, False, False]
+
+    lfu = MemEmbCache(max_items=3, policy="lfu")
+    lfu.put_many(["a", "b", "c"], V[:3])
+    lfu.get_many(["a", "a", "c"])                    # b có tần suất thấp nhất
+    lfu.put_many(["d"], V[3:])
+    assert lfu.get_many(["b"]) == [None]
+    st = lfu.stats()
+    assert st["evictions"] == 1 and st["items"] == 3 and st["bytes"] == 3 * V[0].nbytes
+
+def test_mem_cache_lfu_admits_new_key_over_frequent_residents():
+    from ml.src.embedder.emb_store import MemEmbCache
+    V = _vecs(6)
+    c = MemEmbCache(max_items=2, policy="lfu")
+    c.put_many(["a", "b"], V[:2])
+    c.get_many(["a", "b"])                           # mọi key đang giữ có tần suất 2
+    for i, k in enumerate("cdef"):
+        c.put_many([k], V[2 + i:3 + i])
+        assert c.get_many([k])[0] is not None        # key mới được nhận, không tự bị loại
+    assert len(c) == 2 and c.evictions == 4
+
+def test_mem_cache_byte_bound():
+    from ml.src.embedder.emb_store import MemEmbCache
+    c = MemEmbCache(max_items=0, max_bytes=2 * 8 * 4 + 1)
+    c.put_many([f"k{i}" for i in range(5)], _vecs(5))
+    assert len(c) == 2 and c.nbytes <= c.max_bytes and c.evictions == 3
+
+@pytest.mark.parametrize("codec,tol", [("float32", 0.0), ("float16", 1e-3), ("int8", 1e-2)])
+def test_quantized_codecs(tmp_path, codec, tol):
+    from ml.src.embedder.emb_store import SqliteEmbCache
+    V = _vecs(20, dim=384)
+    V /= np.linalg.norm(V, axis=1, keepdims=True)
+    mm = MemmapEmbCache(str(tmp_path / "emb"), codec=codec)
+    sq = SqliteEmbCache(str(tmp_path / "emb.sqlite"), codec=codec)
+    texts = [f"t{i}" for i in range(20)]
+    for c in (mm, sq):
+        c.put_many(M, texts, V)
+        c.save()
+    mm2 = MemmapEmbCache(str(tmp_path / "emb"))     # codec đọc lại từ meta.json
+    assert mm2.codec == codec
+    for c in (mm2, sq):
+        got = np.stack(c.get_many(M, texts))
+        assert got.dtype == np.float32
+        assert np.abs(got - V).max() <= tol
+        cos = (got * V).sum(1) / np.linalg.norm(got, axis=1)
+        assert cos.min() > 1 - max(tol, 1e-6)
+    bytes_per_row = {"float32": 384 * 4, "float16": 384 * 2, "int8": 384 + 4}[codec]
+    assert os.path.getsize(mm2._files()[0]) == 20 * bytes_per_row
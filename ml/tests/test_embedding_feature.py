@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+from ml.src.embedder.embedding_feature import (
+    MemEmbCache, SbertConfig, SbertEmbedder, add_sbert_similarity_feature, chunk_text, make_emb_cache,
+    plan_token_batches,
+)
+
+
+@pytest.fixture
+def sbert_stub(tmp_path):
+    """SbertEmbedder quanh một model giả (không tải SentenceTransformer), cache sqlite trong tmp_path."""
+    def make(model, **cfg):
+        cfg = SbertConfig(cache_path=str(tmp_path / "emb.sqlite"), **cfg)
+        e = SbertEmbedder.__new__(SbertEmbedder)
+        e.cfg, e.model, e.dispatcher = cfg, model, None
+        e.batch_size, e.normalize = 8, True
+        e.cache = make_emb_cache(cfg.cache_path, cfg.cache_dtype)
+        e.mem = MemEmbCache(cfg.mem_cache_items, cfg.mem_cache_bytes, cfg.mem_cache_policy)
+        return e
+    return make
+
+def test_sbert_encode_uses_mem_layer(sbert_stub):
+    class _Model:
+        calls = 0
+        def encode(self, texts, **kw):
+            _Model.calls += len(texts)
+            return np.array([[len(t), 1.0, 2.0] for t in texts], dtype=np.float32)
+
+    e = sbert_stub(_Model(), mem_cache_items=2)
+    a = e.encode(["python", "java", "go"])
+    b = e.encode(["go", "python"])                   # go: từ RAM, python: từ sqlite
+    np.testing.assert_allclose(a[[2, 0]], b)
+    assert _Model.calls == 3
+    st = e.cache_stats()
+    assert st["hits"] == 1 and st["items"] == 2 and st["evictions"] >= 1
+
+def test_plan_token_batches_budget_and_order():
+    lengths = [10, 256, 12, 256, 40, 5, 256, 30]
+    batches = plan_token_batches(lengths, token_budget=512, max_batch=4)
+    flat = np.concatenate(batches)
+    assert sorted(flat.tolist()) == list(range(len(lengths)))     # mỗi text đúng một lần
+    for b in batches:
+        assert len(b) <= 4 and (len(b) == 1 or len(b) * max(lengths[i] for i in b) <= 512)
+    assert [lengths[i] for i in batches[0]] == [256, 256]         # dài nhất đi trước
+
+def test_chunk_text_sections_and_overlap():
+    long_sec = " ".join(f"w{i}" for i in range(400))
+    chunks = chunk_text(f"Summary: python dev\n\n{long_sec}\n\nSkills: docker aws", max_words=180, overlap=30)
+    assert chunks[0] == "Summary: python dev" and chunks[-1] == "Skills: docker aws"
+    mid = chunks[1:-1]
+    assert [c.split()[0] for c in mid] == ["w0", "w150", "w300"]       # bước 150, chồng 30 từ
+    assert mid[-1].split()[-1] == "w399"
+    assert chunk_text("", 180, 30) == [""]
+
+def test_chunked_encode_reembeds_only_edited_section(sbert_stub):
+    class _Model:
+        seen = []
+        def encode(self, texts, **kw):
+            _Model.seen.extend(texts)
+            rng = np.random.default_rng(len(_Model.seen))
+            return rng.normal(size=(len(texts), 16)).astype(np.float32)
+
+    e = sbert_stub(_Model(), chunk_words=50, chunk_overlap=10, chunk_pool="weighted", mem_cache_items=100)
+    cv = "Experience: " + " ".join(f"job{i}" for i in range(120)) + "\n\nSkills: python docker"
+    v1 = e.encode([cv, "short jd"])
+    assert v1.shape == (2, 16) and np.allclose(np.linalg.norm(v1, axis=1), 1.0)
+    n_first = len(_Model.seen)
+    v2 = e.encode([cv.replace("python docker", "python kubernetes")])
+    assert _Model.seen[n_first:] == ["Skills: python kubernetes"]      # chỉ đoạn bị sửa
+    assert not np.allclose(v1[0], v2[0])
+
+def test_add_sbert_similarity_feature_matches_loop():
+    class _Hash:
+        def encode(self, texts):
+            E = np.stack([np.random.default_rng(abs(hash(t)) % 2**32).normal(size=16) for t in texts]).astype(np.float32)
+            return E / np.linalg.norm(E, axis=1, keepdims=True)
+
+    rng = np.random.default_rng(0)
+    jd = rng.integers(0, 30, size=400)
+    cv = rng.integers(0, 120, size=400)
+    df = pd.DataFrame({"jd_id": [f"j{j}" for j in jd], "cv_id": cv, "job_description_text": [f"jd text {j}" for j in jd],
+                       "resume_text": [f"cv text {c}" for c in cv]})
+    df.loc[df["jd_id"] == "j0", ["jd_id", "job_description_text"]] = ["solo", "only one"]
+    df = df.drop_duplicates(["jd_id", "cv_id"]).reset_index(drop=True)
+    df = pd.concat([df, df.iloc[:1].assign(jd_id="single", job_description_text="single")], ignore_index=True)
+
+    # cách cũ: vòng lặp itertuples + transform theo nhóm
+    ref = df.copy()
+    E = _Hash()
+    jd_tbl, cv_tbl = ref.drop_duplicates("jd_id"), ref.drop_duplicates("cv_id")
+    Ej, Ec = E.encode(jd_tbl["job_description_text"].tolist()), E.encode(cv_tbl["resume_text"].tolist())
+    j2, c2 = {j: i for i, j in enumerate(jd_tbl["jd_id"])}, {c: i for i, c in enumerate(cv_tbl["cv_id"])}
+    ref["emb_cosine"] = [float((Ej[j2[r.jd_id]] * Ec[c2[r.cv_id]]).sum()) for r in ref.itertuples()]
+    ref["emb_cosine_norm"] = ref.groupby("jd_id")["emb_cosine"].transform(lambda x: (x - x.min()) / (x.max() - x.min() + 1e-12))
+
+    E_jd, E_cv = add_sbert_similarity_feature(df.copy(), embedder=E)       # mặc định: cặp (E_jd, E_cv) như trước
+    res = add_sbert_similarity_feature(df, embedder=E, return_index=True)
+    np.testing.assert_allclose(df["emb_cosine"], ref["emb_cosine"], atol=1e-6)
+    np.testing.assert_allclose(df["emb_cosine_norm"], ref["emb_cosine_norm"], atol=1e-5)
+    np.testing.assert_allclose(res.E_jd, Ej, atol=1e-6)
+    assert list(res.jd_ids) == list(jd_tbl["jd_id"]) and list(res.cv_ids) == list(cv_tbl["cv_id"])
+    np.testing.assert_allclose(np.einsum("ij,ij->i", res.E_jd[res.jd_idx], res.E_cv[res.cv_idx]), df["emb_cosine"], atol=1e-6)
+    np.testing.assert_allclose(E_jd, res.E_jd)
+    np.testing.assert_allclose(E_cv, res.E_cv)
+    assert E_cv.shape == (len(cv_tbl), 16)
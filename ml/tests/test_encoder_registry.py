@@ -0,0 +1,41 @@
+import numpy as np
+
+from ml.src.embedder import registry as reg
+
+
+class _Fake:
+    def __init__(self):
+        self.calls = 0
+        self.tokenizer = None
+        self.max_seq_length = 128
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        self.calls += 1
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+def test_short_and_full_name_share_one_encoder():
+    fake = _Fake()
+    reg.register_encoder("fake-minilm", fake)
+    try:
+        assert reg.get_encoder("fake-minilm") is fake
+        assert reg.get_encoder("sentence-transformers/fake-minilm") is fake
+        assert reg.get_encoder("fake-minilm", device="cpu") is fake
+        reg.warmup("fake-minilm")
+        reg.warmup("sentence-transformers/fake-minilm")
+        assert fake.calls == 1                                   # warm-up chỉ chạy một lần
+    finally:
+        reg.unregister_encoder("fake-minilm")
+    assert ("sentence-transformers/fake-minilm", "cpu") not in reg.loaded_encoders()
+
+def test_sbert_embedder_and_skill_extractor_resolve_through_registry():
+    from ml.src.embedder.embedding_feature import SbertConfig, SbertEmbedder
+    from ml.src.scoring import skill_extractor as sx
+    fake = _Fake()
+    reg.register_encoder("fake-minilm", fake)
+    try:
+        e1 = SbertEmbedder(SbertConfig(model_name="fake-minilm", batch_size=8))
+        e2 = SbertEmbedder(SbertConfig(model_name="sentence-transformers/fake-minilm", batch_size=64))
+        assert e1.model is fake and e2.model is fake
+        if sx._HAS_ST:
+            assert sx._load_model("fake-minilm") is fake
+    finally:
+        reg.unregister_encoder("fake-minilm")
@@ -0,0 +1,349 @@
+import json
+import time
+from pathlib import Path
+import numpy as np
+import pytest
+
+fs = pytest.importorskip("ml.vectorstore.faiss_store")
+import faiss
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(fs, "_base_dir", lambda: tmp_path)
+    monkeypatch.setattr(fs, "FLUSH_ROWS", 10**9)
+    monkeypatch.setattr(fs, "FLUSH_SECONDS", 10**9)
+    yield fs
+    _reset(fs)
+
+def _reset(store):
+    store._SNAP, store._OFFSET = None, {}
+    store._GEN, store._META, store._WAL_SEQ, store._PENDING, store._PENDING_SINCE = 0, {}, 0, 0, None
+    store._WAL_OFF = 0
+
+def _restart(store):
+    # mô phỏng process mới: bỏ trạng thái RAM, đọc lại từ đĩa
+    _reset(store)
+    assert store.load()
+
+def _vecs(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype("float32")
+
+def _ids_of(store):
+    s = store._SNAP
+    live = [int(i) for o, i in enumerate(s.labels) if (o if s.is_hnsw else int(i)) not in s.dead]
+    return sorted(live + s.seg_live()[0].tolist() + s.delta_ids.tolist())
+
+def test_add_goes_to_wal_and_is_replayed(store, tmp_path):
+    store.build_new(_vecs(5), list(range(5)), kind="flat")
+    idx_bytes = store._paths()["index"].read_bytes()
+    new = _vecs(3, seed=1)
+    store.add(new[:1], [10])
+    store.add(new[1:], [11, 12])
+    assert store._paths()["index"].read_bytes() == idx_bytes           # không ghi lại cả index
+    assert (tmp_path / "wal.bin").stat().st_size > 0
+    _restart(store)
+    assert store._SNAP.live_count() == 8 and _ids_of(store) == [0, 1, 2, 3, 4, 10, 11, 12]
+    assert store.search(new[2:3], topk=1)[0][0][0] == 12
+
+def _worker(base, wid, barrier):
+    # worker gunicorn (process spawn riêng): cùng thư mục index, WAL chung
+    fs._base_dir = lambda: Path(base)
+    fs.FLUSH_ROWS, fs.FLUSH_SECONDS = 10**9, 10**9
+    assert fs.load()
+    fs.upsert(_vecs(3, seed=wid), [100 * wid, 100 * wid + 1, 100 * wid + 2])
+    barrier.wait()
+    if wid == 1:
+        assert fs.flush()                   # checkpoint phải gộp cả bản ghi chưa checkpoint của worker 2
+    barrier.wait()
+    fs.remove([100 * wid + 1])
+    fs.upsert(_vecs(1, seed=10 + wid), [100 * wid + 10])
+    barrier.wait()
+    if wid == 2:
+        assert fs.flush()
+    barrier.wait()
+
+def test_workers_share_wal_across_checkpoints(store, tmp_path):
+    import multiprocessing as mp
+    store.build_new(_vecs(10), list(range(10)), kind="flat")
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(2)
+    procs = [ctx.Process(target=_worker, args=(str(tmp_path), wid, barrier)) for wid in (1, 2)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(120)
+    assert [p.exitcode for p in procs] == [0, 0]
+    assert (tmp_path / "wal.bin").stat().st_size == 0
+    _restart(store)
+    assert _ids_of(store) == list(range(10)) + [100, 102, 110, 200, 202, 210]
+
+def _idle_worker(base, ready, saved, result):
+    fs._base_dir = lambda: Path(base)
+    assert fs.load()
+    ready.set()
+    saved.wait(60)
+    deadline = time.time() + 20
+    while time.time() < deadline:           # không upsert/remove gì: chỉ flusher nền nạp thế hệ mới
+        hits = fs.search(_vecs(1, seed=31), topk=1)[0]
+        if hits and hits[0][0] == 900:
+            result.value = fs._GEN
+            return
+        time.sleep(0.1)
+
+def test_idle_worker_picks_up_saved_generation(store, tmp_path):
+    import multiprocessing as mp
+    store.build_new(_vecs(10), list(range(10)), kind="flat")
+    ctx = mp.get_context("spawn")
+    ready, saved, result = ctx.Event(), ctx.Event(), ctx.Value("i", 0)
+    p = ctx.Process(target=_idle_worker, args=(str(tmp_path), ready, saved, result))
+    p.start()
+    assert ready.wait(120)
+    store.save(store.build_flat(_vecs(1, seed=31), [900]))
+    saved.set()
+    p.join(120)
+    assert p.exitcode == 0 and result.value == store._GEN
+
+def test_checkpoint_keeps_base_until_merge_ratio(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "MERGE_RATIO", 0.5)
+    X = _vecs(20, seed=40)
+    store.build_new(X, list(range(20)), kind="hnsw")
+    base, base_file = store._SNAP.index, store._paths()["index"]
+    store.upsert(_vecs(3, seed=41), [3, 30, 31])
+    store.remove([5])
+    assert store.flush()
+    # không sao chép base: delta thành segment, meta trỏ file base cũ
+    assert store._SNAP.index is base and base_file.exists() and store._GEN == 2
+    assert sorted(p.name for p in tmp_path.glob("index.*.faiss")) == [base_file.name]
+    assert store._SNAP.seg is not None and sorted(store._SNAP.seg.ids.tolist()) == [3, 30, 31]
+    store.upsert(_vecs(1, seed=42), [30])                             # sửa một dòng của segment
+    store.remove([31])
+    hits = [i for i, _ in store.search(X[4:5], topk=30)[0]]
+    assert hits.count(30) == 1 and 31 not in hits and 5 not in hits and len(hits) == 20
+    store.flush()
+    _restart(store)
+    assert _ids_of(store) == [i for i in range(20) if i != 5] + [30]
+    assert store._SNAP.index.ntotal == 20 and store._BASE_GEN == 1
+    # segment + tombstone vượt MERGE_RATIO·ntotal: gộp vào base mới
+    store.upsert(_vecs(10, seed=43), list(range(40, 50)))
+    store.flush()
+    assert store._SNAP.index is not base and store._SNAP.seg is None and store._BASE_GEN == store._GEN
+    assert not base_file.exists() and not list(tmp_path.glob("seg.*.npz"))
+    _restart(store)
+    assert _ids_of(store) == [i for i in range(20) if i != 5] + [30] + list(range(40, 50))
+
+def test_flush_checkpoints_and_clears_wal(store, tmp_path):
+    store.build_new(_vecs(4), [0, 1, 2, 3], kind="flat")
+    store.add(_vecs(2, seed=2), [4, 5])
+    assert store.flush() and not store.flush()
+    assert (tmp_path / "wal.bin").stat().st_size == 0
+    assert sorted(p.name for p in tmp_path.glob("index.*.faiss")) == [store._paths()["index"].name]
+    _restart(store)
+    assert store._SNAP.index.ntotal == 6 and _ids_of(store) == [0, 1, 2, 3, 4, 5]
+
+def test_torn_wal_tail_and_uncleared_wal_after_commit(store, tmp_path):
+    store.build_new(_vecs(4), [0, 1, 2, 3], kind="flat")
+    store.add(_vecs(2, seed=3), [4, 5])
+    good = (tmp_path / "wal.bin").stat().st_size
+    with open(tmp_path / "wal.bin", "ab") as f:
+        f.write(b"FWAL\x01garbage")                                   # crash giữa lúc append
+    _restart(store)
+    assert _ids_of(store) == [0, 1, 2, 3, 4, 5]
+    assert (tmp_path / "wal.bin").stat().st_size == good
+    # meta đã commit nhưng WAL chưa kịp xoá: seq <= wal_seq bị bỏ qua, không nhân đôi
+    wal = (tmp_path / "wal.bin").read_bytes()
+    store.flush()
+    (tmp_path / "wal.bin").write_bytes(wal)
+    _restart(store)
+    assert store._SNAP.index.ntotal == 6 and store._PENDING == 0
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+def test_upsert_and_remove(store, kind):
+    X = _vecs(50, seed=5)
+    store.build_new(X, list(range(100, 150)), kind=kind)
+    v = _vecs(1, seed=6)
+    store.upsert(v, [120])                                             # sửa CV: thay, không thêm bản sao
+    store.upsert(v, [120])
+    hits = store.search(v, topk=5)[0]
+    assert hits[0][0] == 120 and [i for i, _ in hits].count(120) == 1
+    assert store.remove([101, 102, 999]) == 2
+    for q in (1, 2):
+        assert all(i not in (101, 102) for i, _ in store.search(X[q:q + 1], topk=50)[0])
+    if kind == "hnsw":
+        assert len(store._SNAP.dead) == 3                              # 1 bản bị ghi đè + 2 bản xoá
+    assert store._SNAP.live_count() == len(_ids_of(store)) == 48
+    store.flush()
+    assert json.loads((store._paths()["meta"]).read_text())["count"] == 48
+    _restart(store)
+    got = [i for i, _ in store.search(X[1:2], topk=60)[0]]
+    assert 101 not in got and 102 not in got and len(got) == 48 and got.count(120) == 1
+
+def test_hnsw_compaction_drops_tombstones(store, monkeypatch):
+    X = _vecs(40, seed=7)
+    store.build_new(X, list(range(40)), kind="hnsw")
+    store.remove(list(range(0, 40, 2)))
+    store.upsert(_vecs(3, seed=8), [1, 3, 41])
+    assert len(store._SNAP.dead) == 22
+    assert store.compact() == 22
+    assert store._SNAP.index.ntotal == 21 and not store._SNAP.dead and not store._paths()["tomb"].exists()
+    _restart(store)
+    assert _ids_of(store) == sorted(list(range(1, 40, 2)) + [41])
+    assert store.search(X[5:6], topk=1)[0][0][0] == 5
+    # checkpoint tự compact khi tombstone vượt COMPACT_RATIO
+    monkeypatch.setattr(store, "COMPACT_RATIO", 0.1)
+    store.remove([5, 7, 9])
+    store.flush()
+    assert store._SNAP.index.ntotal == 18 and not store._SNAP.dead
+
+def test_legacy_layout_is_migrated(store, tmp_path):
+    X = fs._normalize(_vecs(6, seed=9))
+    old = faiss.IndexFlatIP(8)
+    old.add(np.vstack([X, X[2:3] * 0.5 + X[3:4] * 0.5]))
+    faiss.write_index(old, str(tmp_path / "index.faiss"))
+    (tmp_path / "ids.jsonl").write_text("".join(json.dumps(i) + "\n" for i in [0, 1, 2, 3, 4, 5, 2]), encoding="utf-8")
+    (tmp_path / "meta.json").write_text(json.dumps({"dim": 8, "index_kind": "flat"}), encoding="utf-8")
+    assert store.load()
+    assert store._SNAP.index.ntotal == 6 and _ids_of(store) == [0, 1, 2, 3, 4, 5]     # bản sửa trùng id: giữ bản cuối
+    np.testing.assert_allclose(store._SNAP.index.reconstruct(2), X[2] * 0.5 + X[3] * 0.5, atol=1e-6)
+    assert not (tmp_path / "ids.jsonl").exists() and json.loads((tmp_path / "meta.json").read_text())["gen"] == 1
+
+def test_background_flusher_on_row_threshold(store, tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "FLUSH_ROWS", 3)
+    store.build_new(_vecs(4), [0, 1, 2, 3], kind="flat")
+    store.add(_vecs(3, seed=4), [4, 5, 6])
+    deadline = time.time() + 5
+    while store._PENDING and time.time() < deadline:
+        time.sleep(0.05)
+    assert store._PENDING == 0 and (tmp_path / "wal.bin").stat().st_size == 0
+
+def test_search_runs_on_snapshot_during_writes(store):
+    import threading
+    X = _vecs(200, seed=10)
+    store.build_new(X, list(range(200)), kind="hnsw")
+    old = store._SNAP
+    errors, stop = [], threading.Event()
+    def reader():
+        while not stop.is_set():
+            try:
+                for row in store.search(X[:4], topk=5):
+                    assert len({i for i, _ in row}) == len(row)        # không bao giờ thấy id trùng
+            except Exception as e:                                     # pragma: no cover
+                errors.append(e)
+    th = [threading.Thread(target=reader) for _ in range(4)]
+    [t.start() for t in th]
+    for k in range(30):
+        store.upsert(_vecs(2, seed=100 + k), [k, 1000 + k])
+        if k % 10 == 9:
+            store.flush()
+    store.remove(list(range(100, 150)))
+    stop.set()
+    [t.join() for t in th]
+    assert not errors
+    assert old.index.ntotal == 200 and not old.dead                    # snapshot cũ không bị sửa
+    assert store.search(X[120:121], topk=1)[0][0][0] != 120
+
+def test_pq_overfetch_filters_removed(store):
+    X = _vecs(300, dim=16, seed=11)
+    store.build_new(X, list(range(300)), kind="pq")
+    top = [i for i, _ in store.search(X[7:8], topk=5)[0]]
+    store.remove(top[:3])
+    got = [i for i, _ in store.search(X[7:8], topk=5)[0]]
+    assert len(got) == 5 and not set(got) & set(top[:3])
+
+def _stream(X, ids, size):
+    for st in range(0, len(ids), size):
+        yield ids[st:st + size], X[st:st + size]
+
+def test_build_ivf_streamed_with_train_sample(store):
+    X, ids = _vecs(2000, dim=16, seed=20), np.arange(1000, 3000)
+    train = X[np.random.default_rng(0).choice(2000, 800, replace=False)]
+    index = store.build_ivf(_stream(X, ids, 300), train=train, n_total=2000, nlist=16, nprobe=4)
+    assert isinstance(index, faiss.IndexIVFFlat) and (index.nlist, index.nprobe, index.ntotal) == (16, 4, 2000)
+    assert sorted(store._labels_of(index).tolist()) == ids.tolist()
+    # không truyền mẫu: các lô đầu được giữ lại làm mẫu train rồi vẫn được add
+    index = store.build_ivf(_stream(X, ids, 300), n_total=2000, train_size=700)
+    assert index.ntotal == 2000 and index.nlist == 700 // 39
+    store.save(index)
+    _restart(store)
+    assert store._SNAP.index.nprobe == index.nprobe and store._META["index_kind"] == "ivf"
+    store.upsert(X[:1] * -1, [1000])
+    assert store.remove([1001]) == 1
+    hits = [i for i, _ in store.search(X[:2], topk=3)[0]]
+    assert 1000 not in hits and 1001 not in hits
+
+def test_build_hnsw_params(store):
+    X = _vecs(300, seed=21)
+    index = store.build_hnsw(_stream(X, np.arange(300), 128), M=8, efConstruction=40, efSearch=77)
+    store.save(index)
+    _restart(store)
+    hnsw = store._hnsw_of(store._SNAP.index)
+    assert (hnsw.efConstruction, hnsw.efSearch) == (40, 77)
+    assert store._META["M"] == 8 and store.search(X[5:6], topk=1)[0][0][0] == 5
+
+def test_save_swaps_rebuild_under_running_store(store, tmp_path):
+    store.build_new(_vecs(20, seed=22), list(range(20)), kind="hnsw")
+    old_gen = store._GEN
+    v = _vecs(1, seed=23)
+    store.upsert(v, [500])                                             # chưa checkpoint, chỉ nằm trong WAL
+    # process khác (build_faiss_index) build lại và swap trong lúc server đang chạy
+    server = (store._SNAP, store._OFFSET, store._GEN, store._META, store._WAL_SEQ, store._PENDING,
+              store._PENDING_SINCE)
+    _reset(store)
+    path = store.save(store.build_flat(_vecs(30, seed=24), np.arange(100, 130)))
+    assert store._SNAP is None and sorted(p.name for p in tmp_path.glob("index.*.faiss")) == [Path(path).name]
+    assert not list(tmp_path.glob(".build-*")) and (tmp_path / "wal.bin").stat().st_size > 0
+    (store._SNAP, store._OFFSET, store._GEN, store._META, store._WAL_SEQ, store._PENDING,
+     store._PENDING_SINCE) = server
+    assert store.search(v, topk=1)[0][0][0] == 500                     # vẫn phục vụ trên snapshot cũ
+    # checkpoint thấy thế hệ mới hơn: nạp bản rebuild, replay WAL của mình lên rồi mới commit
+    assert store.flush() and store._GEN > old_gen + 1
+    assert _ids_of(store) == list(range(100, 130)) + [500] and store._META["index_kind"] == "flat"
+    _restart(store)
+    assert _ids_of(store) == list(range(100, 130)) + [500]
+
+def test_save_to_path_writes_standalone_store(store, tmp_path, monkeypatch):
+    X = _vecs(10, seed=25)
+    path = store.save(store.build_flat(X, list(range(10))), path=str(tmp_path / "out"))
+    assert not list(tmp_path.glob("meta.json"))                        # store đang dùng không bị đụng tới
+    monkeypatch.setattr(fs, "_base_dir", lambda: tmp_path / "out")
+    _restart(store)
+    assert path.endswith("index.1.faiss") and store.search(X[3:4], topk=1)[0][0][0] == 3
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf", "pq"])
+def test_filtered_search_keeps_topk_under_selective_filter(store, kind):
+    X, ids = _vecs(3000, dim=16, seed=30), np.arange(1, 3001)
+    store.build_new(X, ids, kind=kind)
+    allowed = ids[::150]                                               # 20 id, ~0.7%: post-filter top-10 sẽ rỗng
+    flt = store.IdFilter(allowed)
+    store.remove([int(allowed[0])])                                    # tombstone + filter cùng áp dụng
+    store.upsert(X[1:2], [int(allowed[1])])                            # bản trong delta cũng qua filter
+    store.upsert(X[2:3], [5])                                          # ngoài filter: không được trả về
+    hits = store.search(X[2:4], topk=10, id_filter=flt)
+    for row in hits:
+        got = [i for i, _ in row]
+        assert len(got) == 10 and len(set(got)) == 10
+        assert set(got) <= set(allowed.tolist()) - {int(allowed[0])}
+    assert store.search(X[2:3], topk=10, id_filter=store.IdFilter([999999])) == [[]]
+
+def test_filtered_search_after_removing_non_base_id(store):
+    X = _vecs(20, seed=34)
+    store.build_new(X, list(range(20)), kind="flat")
+    store.upsert(_vecs(1, seed=35), [500])                             # id mới: vào segment, không có trong base
+    store.flush()
+    store.remove([500])
+    assert not store._SNAP.dead
+    hits = store.search(X[3:4], topk=5, id_filter=store.IdFilter([3, 500]))
+    assert [i for i, _ in hits[0]] == [3]
+
+def test_filtered_search_reuses_offset_bitmap_per_base(store, monkeypatch):
+    monkeypatch.setattr(store, "MERGE_RATIO", 0.0)                    # mỗi checkpoint gộp vào base mới
+    store.build_new(_vecs(200, seed=31), list(range(200)), kind="hnsw")
+    flt = store.IdFilter(range(0, 200, 2))
+    store.search(_vecs(1, seed=32), topk=5, id_filter=flt)
+    cached = flt._base
+    store.upsert(_vecs(1, seed=33), [400])                             # snapshot mới, cùng base: giữ bitmap
+    store.search(_vecs(1, seed=32), topk=5, id_filter=flt)
+    assert flt._base is cached
+    store.flush()                                                      # base mới sau checkpoint: dựng lại
+    got = [i for i, _ in store.search(_vecs(1, seed=32), topk=5, id_filter=flt)[0]]
+    assert flt._base is not cached and all(i % 2 == 0 and i < 200 for i in got)
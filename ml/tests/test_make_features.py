@@ -14,7 +14,7 @@ class _FakeSkillExtractor:
         return skills
 
 def test_build_features_minimal(monkeypatch, tiny_pairs):
-    monkeypatch.setattr(mf, "SkillExtractor", _FakeSkillExtractor)
+    monkeypatch.setattr(mf, "get_skill_extractor", lambda **kw: _FakeSkillExtractor(**kw))
 
     def fake_bm25_full_groupwise(df, resume_col, jd_col, group_col):
         vals = []
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+ort = pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+TEXTS = ["python fastapi docker", "java spring boot microservices", "w1 w2 w3 python", "docker kubernetes aws",
+         "senior data engineer spark kafka " * 20, "react typescript frontend", "python"]
+
+@pytest.fixture(scope="module")
+def tiny_st(tmp_path_factory):
+    # BERT nhỏ khởi tạo ngẫu nhiên (không cần tải model): Transformer + mean Pooling + Normalize như MiniLM
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    import torch
+    torch.manual_seed(0)
+    d = tmp_path_factory.mktemp("tiny_bert")
+    words = sorted({w for t in TEXTS for w in t.split()} | {f"w{i}" for i in range(50)})
+    (d / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words), encoding="utf-8")
+    BertTokenizerFast(vocab_file=str(d / "vocab.txt")).save_pretrained(str(d))
+    BertModel(BertConfig(vocab_size=len(words) + 5, hidden_size=64, num_hidden_layers=2, num_attention_heads=4,
+                         intermediate_size=128)).save_pretrained(str(d))
+    word = models.Transformer(str(d), max_seq_length=64)
+    return SentenceTransformer(modules=[word, models.Pooling(64, "mean"), models.Normalize()], device="cpu")
+
+def _cos(E):
+    E = E / np.linalg.norm(E, axis=1, keepdims=True)
+    return E @ E.T
+
+@pytest.mark.parametrize("quantize,atol", [(False, 1e-4), (True, 5e-2)])
+def test_onnx_cosine_parity(tiny_st, tmp_path, quantize, atol):
+    from ml.src.embedder.onnx_backend import load_onnx_encoder
+    ref = tiny_st.encode(TEXTS, convert_to_numpy=True)
+    enc = load_onnx_encoder("tiny", onnx_dir=str(tmp_path), quantize=quantize, threads=1, st_model=tiny_st)
+    got = enc.encode(TEXTS, batch_size=3)
+    assert got.shape == ref.shape
+    np.testing.assert_allclose(_cos(got), _cos(ref), atol=atol)
+    if not quantize:
+        np.testing.assert_allclose(got, ref, atol=1e-4)
+
+def test_sbert_embedder_onnx_backend(tiny_st, tmp_path):
+    from ml.src.embedder.embedding_feature import SbertConfig, SbertEmbedder
+    from ml.src.embedder.registry import register_encoder, unregister_encoder
+    register_encoder("tiny", tiny_st)                            # export từ model torch đã nạp
+    try:
+        e = SbertEmbedder(SbertConfig(model_name="tiny", backend="onnx", onnx_dir=str(tmp_path), onnx_threads=1))
+        np.testing.assert_allclose(e.encode(TEXTS), tiny_st.encode(TEXTS, convert_to_numpy=True), atol=1e-4)
+    finally:
+        unregister_encoder("tiny")
+        unregister_encoder("tiny", backend="onnx", onnx_threads=1, onnx_dir=str(tmp_path))
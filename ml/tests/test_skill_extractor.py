@@ -52,4 +52,126 @@ def test_extract_alias_dedup(skill_dict):
 def test_empty_text(skill_dict):
     extr = _make_extractor(skill_dict)
     out = _to_iter(extr.extract(""))
-    assert len(out) == 0
\ No newline at end of file
+    assert len(out) == 0
+
+@pytest.fixture
+def vendor_dir(tmp_path):
+    import json
+    d = tmp_path / "vendor"
+    d.mkdir()
+    (d / "tech.json").write_text(json.dumps({
+        "lang": {"python": ["py", "python3"], "java": []},
+        "db": {"postgresql": ["postgres", "postgre sql"]},
+        "cloud": {"aws": ["amazon web services"]},
+    }), encoding="utf-8")
+    return d
+
+def test_registry_and_artifact(vendor_dir, tmp_path):
+    kw = dict(use_fuzzy=False, data_path=str(vendor_dir), artifact_dir=str(tmp_path / "compiled"))
+    extr = se_mod.get_skill_extractor(**kw)
+    assert se_mod.get_skill_extractor(**kw) is extr
+    assert se_mod.get_skill_extractor(**kw, max_alias_len=3) is not extr
+
+    arts = list((tmp_path / "compiled").glob("skills_*.pkl"))
+    assert len(arts) == 1
+
+    # artifact được dùng lại: kết quả giống hệt bản build từ json
+    again = se_mod.SkillExtractor(**kw)
+    assert again.alias2canon == extr.alias2canon
+    text = "Python3 and Postgres on Amazon Web Services"
+    assert again.extract(text) == extr.extract(text) == {"python", "postgresql", "aws"}
+
+
+class _CountingModel:
+    """Encoder giả: vector theo hash, đếm số câu đã encode."""
+    def __init__(self):
+        self.n_encoded = 0
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=True, **kw):
+        import numpy as np
+        self.n_encoded += len(texts)
+        out = np.stack([np.random.default_rng(abs(hash(t)) % (2**32)).normal(size=16) for t in texts])
+        return (out / np.linalg.norm(out, axis=1, keepdims=True)).astype(np.float32)
+
+@pytest.fixture
+def fuzzy_extractor(vendor_dir, tmp_path, monkeypatch):
+    from ml.src.scoring import skill_extractor as sx
+    model = _CountingModel()
+    monkeypatch.setattr(sx, "_load_model", lambda name: model)
+    monkeypatch.setattr(sx, "_CANON_VEC_CACHE", {})
+    import ml.src.scoring.phrase_cache as pc
+    monkeypatch.setattr(pc, "_PHRASE_CACHES", {})
+    extr = sx.SkillExtractor(data_path=str(vendor_dir), use_artifact=False, fuzzy_threshold=0.99)
+    return extr, model
+
+def test_fuzzy_phrase_cache(fuzzy_extractor):
+    extr, model = fuzzy_extractor
+    text = "backend developer with rest api and message queue experience"
+    first = extr.extract(text)
+    n_first = model.n_encoded
+    assert extr.extract(text) == first
+    assert model.n_encoded == n_first          # lần 2: toàn bộ n-gram lấy từ cache
+    st = extr.phrase_cache.stats()
+    assert st["hits"] > 0 and st["size"] > 0
+
+def test_extract_many_matches_extract(fuzzy_extractor, monkeypatch):
+    extr, model = fuzzy_extractor
+    texts = [
+        "Python3 backend, rest api, Postgres",
+        "Java developer on Amazon Web Services",
+        "Python3 backend, rest api, Postgres",
+        "",
+    ]
+    single = [extr.extract(t) for t in texts]
+
+    calls = []
+    orig = model.encode
+    monkeypatch.setattr(model, "encode", lambda xs, **kw: calls.append(len(xs)) or orig(xs, **kw))
+    extr.phrase_cache._mem.clear()
+    assert extr.extract_many(texts) == single
+    assert len(calls) <= 1                      # một lần encode cho cả slate
+
+def test_fuzzy_ann_matches_exact():
+    pytest.importorskip("faiss")
+    import numpy as np
+    from ml.src.scoring.skill_extractor import ExtractorConfig, SkillExtractor
+    rng = np.random.default_rng(1)
+    canon = rng.normal(size=(300, 32)).astype(np.float32)
+    canon /= np.linalg.norm(canon, axis=1, keepdims=True)
+    q = canon[rng.integers(0, 300, 200)] + 0.3 * rng.normal(size=(200, 32)).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+
+    def best(kind):
+        extr = SkillExtractor.__new__(SkillExtractor)
+        extr.cfg = ExtractorConfig(fuzzy_index=kind, ann_min_canon=0, fuzzy_threshold=0.7)
+        extr.canon_vecs = canon
+        extr._canon_index = extr._build_canon_index()
+        idx, sim = extr._best_canon(q)
+        np.testing.assert_allclose(sim, (q * canon[idx]).sum(axis=1), atol=1e-5)   # điểm là cosine thật
+        return {(i, int(j)) for i, (j, s) in enumerate(zip(idx, sim)) if s >= 0.7}
+
+    ref = best("exact")
+    assert best("flat") == ref
+    # HNSW top-1 là xấp xỉ: canonical có thể khác argmax, nhưng hit chỉ có ở dòng exact cũng hit
+    ann = best("hnsw")
+    assert {i for i, _ in ann} <= {i for i, _ in ref}
+    assert len(ann & ref) >= 0.9 * len(ref)
+
+def test_skill_store_roundtrip(vendor_dir, tmp_path, monkeypatch):
+    from ml.src.scoring.skill_store import SkillStore
+    extr = se_mod.SkillExtractor(use_fuzzy=False, data_path=str(vendor_dir), use_artifact=False)
+    store = SkillStore(str(tmp_path / "skills.sqlite"))
+    texts = ["Python3 and Postgres", "java on AWS", "Python3   and POSTGRES"]
+    first = store.extract_many(extr, texts)
+    assert first == [{"python", "postgresql"}, {"java", "aws"}, {"python", "postgresql"}]
+
+    # lần 2: không gọi extractor nữa (text chuẩn hoá giống nhau -> cùng key)
+    monkeypatch.setattr(extr, "extract_many", lambda xs: pytest.fail("should be cached"))
+    assert SkillStore(store.path).extract_many(extr, texts) == first
+
+def test_skill_store_reconnects_after_fork(tmp_path, monkeypatch):
+    from ml.src.scoring import skill_store as ss
+    store = ss.SkillStore(str(tmp_path / "skills.sqlite"))
+    store.put_many({"k": {"python"}})
+    parent = store._conn
+    monkeypatch.setattr(ss.os, "getpid", lambda: -1)                  # như process con sau fork
+    assert store.get_many(["k"]) == {"k": {"python"}} and store._conn is not parent
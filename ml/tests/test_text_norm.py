@@ -0,0 +1,57 @@
+import html
+import re
+import unicodedata
+import ml.src.utils.text_norm as tn
+from ml.src.retrieval import tokenize
+from ml.src.scoring.skill_extractor import tokens
+
+def _clean_ref(s):
+    # bản cũ trong skill_extractor (vòng lặp re.sub)
+    s = html.unescape(str(s or ""))
+    s = tn.TAG_RE.sub(" ", s)
+    s = tn.URL_RE.sub(" ", s)
+    s = tn.EMAIL_RE.sub(" ", s)
+    s = unicodedata.normalize("NFKC", s)
+    s = "".join(ch for ch in s if unicodedata.category(ch)[0] != "C" or ch in ("\n", "\t"))
+    s = s.replace("\r", " ").replace("\n", " ")
+    s = re.sub(r"\s+", " ", s).strip().lower()
+    for pat, rep in tn.CANON_REPLACEMENTS.items():
+        s = re.sub(pat, rep, s)
+    return s
+
+SAMPLES = [
+    "",
+    None,
+    "Senior Golang dev, K8s & CI/CD (GitLab)\r\nNodeJS, ReactJS, next.js",
+    "<p>C++ &amp; C# on .NET</p>\tmail: a.b@x.io https://x.io/cv",
+    "Ｆｕｌｌ－ｗｉｄｔｈ ＰＹＴＨＯＮ​ sql\x0bspark kafka",
+    "cicd ci/cd CI cd nodejs node.js reactjs golang-k8s",
+]
+
+def test_clean_text_matches_reference():
+    for s in SAMPLES:
+        assert tn.clean_text(s) == _clean_ref(s)
+
+def _clean_bm25_ref(s):
+    # cleaner BM25 mà ranker đã train (không unescape/NFKC/lọc ký tự điều khiển)
+    s = str(s or "")
+    s = tn.TAG_RE.sub(" ", s)
+    s = tn.URL_RE.sub(" ", s)
+    s = tn.EMAIL_RE.sub(" ", s)
+    s = re.sub(r"\s+", " ", s).strip().lower()
+    for pat, rep in tn.CANON_REPLACEMENTS.items():
+        s = re.sub(pat, rep, s)
+    return s
+
+def test_bm25_keeps_trained_cleaner():
+    for s in SAMPLES:
+        assert tn.clean_text_bm25(s) == _clean_bm25_ref(s)
+        assert tokenize(s) == [t for t in tn.TOKEN_RE.findall(_clean_bm25_ref(s)) if t not in tn.EN_STOP]
+    assert tokenize(SAMPLES[3]) != tokens(SAMPLES[3])                 # &amp; chỉ được unescape ở skill extractor
+
+def test_skill_tokens_memoized():
+    s = SAMPLES[2]
+    assert tokens(s) == list(t for t in tn.token_stream(s) if t not in tn.EN_STOP)
+    before = tn.token_stream.cache_info().hits
+    tokens(s)
+    assert tn.token_stream.cache_info().hits == before + 1
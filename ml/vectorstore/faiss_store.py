@@ -1,4 +1,5 @@
-import os, json, threading, time
+import os, json, threading, time, struct, zlib, atexit, shutil, tempfile
+from contextlib import contextmanager
 from pathlib import Path
 import numpy as np
 
@@ -6,11 +7,45 @@ try:
     import faiss
 except ImportError as e:
     raise RuntimeError("Cần cài faiss-cpu: pip install faiss-cpu") from e
+try:
+    import fcntl
+except ImportError:         # Windows: không có khoá liên process
+    fcntl = None
+
+_LOCK = threading.RLock()   # chỉ writer (upsert/remove/checkpoint/load) giữ; search() không lock
+_SNAP = None            # _Snapshot đang publish; đổi bằng một phép gán (nguyên tử)
+_OFFSET: dict = {}      # HNSW: CV id -> offset đang sống trong base của _SNAP (chỉ writer dùng)
+_GEN = 0
+_BASE_GEN = 0           # thế hệ có file index.<gen>.faiss chứa base của _SNAP
+_BASE_INDEX = None      # base đã nằm trên đĩa ở _BASE_GEN (checkpoint không ghi lại)
+_META: dict = {}
 
-_LOCK = threading.RLock()
-_INDEX = None
-_IDMAP = []     # list các cv_id cùng thứ tự vector trong index
-_DIM = None
+# Write-ahead log: upsert()/remove() chỉ append bản ghi vào wal.bin (vài KB, fsync) thay vì ghi lại cả index;
+# flusher nền checkpoint khi đủ FLUSH_ROWS dòng chờ hoặc dòng cũ nhất quá FLUSH_SECONDS.
+# Mỗi bản ghi có seq tăng dần; checkpoint ghi index.<gen>.faiss rồi meta.json {gen, wal_seq} (điểm commit),
+# nên load() chỉ replay các bản ghi seq > wal_seq.
+# Nhiều worker (gunicorn) dùng chung wal.bin: append dưới _dir_lock, seq = seq cuối trên đĩa + 1; trước khi append
+# và trước khi checkpoint, worker áp các bản ghi của worker khác (đọc tiếp từ _WAL_OFF) nên checkpoint chứa đủ
+# mọi bản ghi trước khi cắt WAL.
+FLUSH_ROWS = 1000
+FLUSH_SECONDS = 30.0
+COMPACT_RATIO = 0.2     # HNSW: dựng lại khi tombstone vượt tỉ lệ này của ntotal
+# Checkpoint không sao chép base: delta được cuộn vào segment phụ (seg.<gen>.npz, IndexFlatIP) và base giữ nguyên
+# file index.<base_gen>.faiss; chỉ khi segment + tombstone vượt MERGE_RATIO·ntotal (hoặc compact) mới gộp vào
+# bản sao của base (đỉnh RAM gấp đôi base). Index lớn có thể nâng FAISS_MERGE_RATIO / FAISS_FLUSH_ROWS /
+# FAISS_FLUSH_SECONDS trong settings.
+MERGE_RATIO = 0.05
+_WAL_MAGIC = b"FWAL"
+_WAL_HDR = struct.Struct("<4sBQIII")     # magic, op, seq, n, dim, crc32(payload)
+_OP_UPSERT, _OP_REMOVE = 1, 2
+_WAL_SEQ = 0
+_WAL_OFF = 0            # số byte đầu của wal.bin đã áp vào RAM (bản ghi của mọi process)
+_DIR_LOCK_DEPTH = threading.local()
+_PENDING = 0            # số thao tác đã vào RAM + WAL nhưng chưa checkpoint
+_PENDING_SINCE = None
+_FLUSH_EVENT = threading.Event()
+_FLUSHER = None
+_FLUSHER_PID = None
 
 def _base_dir() -> Path:
     # Lấy từ settings nếu có
@@ -22,109 +57,930 @@ def _base_dir() -> Path:
     p.mkdir(parents=True, exist_ok=True)
     return p
 
-def _paths():
+def _paths(gen: int | None = None):
     base = _base_dir()
+    gen = _GEN if gen is None else gen
     return {
-        "index": base / "index.faiss",
-        "ids": base / "ids.jsonl",
-        "meta": base / "meta.json"
+        "index": base / f"index.{gen}.faiss",
+        "tomb": base / f"tomb.{gen}.npy",
+        "seg": base / f"seg.{gen}.npz",
+        "meta": base / "meta.json",
+        "wal": base / "wal.bin",
+        # layout cũ (id theo vị trí trong ids.jsonl), được chuyển đổi khi load()
+        "legacy_index": base / "index.faiss",
+        "legacy_ids": base / "ids.jsonl",
     }
 
+def _setting(name: str, default):
+    try:
+        from django.conf import settings
+        return type(default)(getattr(settings, name, default))
+    except Exception:
+        return default
+
 def _normalize(v: np.ndarray) -> np.ndarray:
     v = v.astype("float32", copy=False)
     n = np.linalg.norm(v, axis=1, keepdims=True) + 1e-12
     return v / n
 
-def _create_index(dim: int, kind: str = "hnsw", M: int = 32, efConstruction: int = 200):
+def _as_ids(ids) -> np.ndarray:
+    try:
+        out = np.asarray([int(i) for i in ids], dtype="int64")
+    except (TypeError, ValueError) as e:
+        raise ValueError("ids phải là số nguyên (CV id)") from e
+    return out
+
+def _last_wins(ids: np.ndarray, embs: np.ndarray | None = None):
+    # id lặp trong cùng một lô: giữ lần xuất hiện cuối
+    if len(np.unique(ids)) == len(ids):
+        return ids, embs
+    _, first_rev = np.unique(ids[::-1], return_index=True)
+    keep = np.sort(len(ids) - 1 - first_rev)
+    return ids[keep], (None if embs is None else embs[keep])
+
+INDEX_KINDS = ("flat", "hnsw", "ivf", "sq8", "sq16", "pq")
+
+def _pq_m(dim: int) -> int:
+    # số sub-quantizer mặc định: ~8 chiều / sub-vector, phải chia hết dim (384 -> 48 B/vector)
+    return next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+
+def ivf_params(n: int, nlist: int | None = None, nprobe: int | None = None, train_size: int | None = None):
+    """
+    Tham số IVF mặc định cho n vector: nlist ~ 4·sqrt(n), mẫu train 64·nlist (k-means cần >= 39·nlist),
+    nprobe = nlist/32 (tối thiểu 8). Trả về (nlist, nprobe, train_size).
+    """
+    nlist = int(nlist or min(65536, max(1, round(4 * np.sqrt(max(1, n))))))
+    train_size = int(train_size or min(max(1, n), 64 * nlist))
+    nprobe = int(nprobe or min(nlist, max(8, nlist // 32)))
+    return nlist, nprobe, train_size
+
+def _create_index(dim: int, kind: str = "hnsw", M: int = 32, efConstruction: int = 200, efSearch: int = 64,
+                  nlist: int = 100, nprobe: int = 8, pq_m: int | None = None, pq_nbits: int = 8):
+    """
+    flat/hnsw: float32 (4 B/chiều).
+      ivf  : IndexIVFFlat (quantizer IndexFlatIP, nlist cụm, search nprobe cụm); giữ id gốc nên không bọc
+             IndexIDMap2 (remove_ids của IVF không đánh lại số), cần train k-means
+    Lượng tử hoá (giảm RAM, cosine xấp xỉ):
+      sq8  : IndexScalarQuantizer 8-bit (1 B/chiều, cần train min/max)
+      sq16 : IndexScalarQuantizer fp16  (2 B/chiều)
+      pq   : IndexPQ, pq_m byte/vector với pq_nbits=8 (cần >= 2^pq_nbits vector để train)
+    """
     if kind == "flat":
         index = faiss.IndexFlatIP(dim)
     elif kind == "hnsw":
         index = faiss.IndexHNSWFlat(dim, M, faiss.METRIC_INNER_PRODUCT)
         index.hnsw.efConstruction = efConstruction
-        index.hnsw.efSearch = 64
+        index.hnsw.efSearch = efSearch
+    elif kind == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.nprobe = min(nprobe, nlist)
+    elif kind == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif kind == "sq16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif kind == "pq":
+        index = faiss.IndexPQ(dim, pq_m or _pq_m(dim), pq_nbits, faiss.METRIC_INNER_PRODUCT)
     else:
         raise ValueError("Unsupported index kind")
     return index
 
+def _wrap(index):
+    # id = CV id: IVF lưu id gốc trong inverted list, các loại khác bọc IndexIDMap2
+    return index if isinstance(index, faiss.IndexIVF) else faiss.IndexIDMap2(index)
+
+def _inner(index):
+    return faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+
+def _labels_of(index) -> np.ndarray:
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map)
+    inv = index.invlists
+    parts = [faiss.rev_swig_ptr(inv.get_ids(l), inv.list_size(l)).copy()
+             for l in range(index.nlist) if inv.list_size(l)]
+    return np.concatenate(parts).astype("int64") if parts else np.zeros(0, dtype="int64")
+
+def _train_if_needed(index, embs: np.ndarray):
+    if index.is_trained:
+        return
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexPQ) and len(embs) < (1 << inner.pq.nbits):
+        raise ValueError(f"Index PQ cần ít nhất {1 << inner.pq.nbits} vector để train")
+    if isinstance(inner, faiss.IndexIVF) and len(embs) < inner.nlist:
+        raise ValueError(f"Index IVF cần ít nhất nlist={inner.nlist} vector để train")
+    index.train(embs)
+
+def _hnsw_of(index):
+    base = _inner(index)
+    return base.hnsw if isinstance(base, faiss.IndexHNSW) else None
+
+class _Segment:
+    """Các dòng đã checkpoint nhưng chưa gộp vào base (id duy nhất); IndexFlatIP dựng một lần, dùng chung."""
+    __slots__ = ("ids", "vecs", "index")
+
+    def __init__(self, ids: np.ndarray, vecs: np.ndarray):
+        self.ids, self.vecs = ids, vecs
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vecs.shape[1]))
+        self.index.add_with_ids(vecs, ids)
+
+class _Snapshot:
+    """
+    Phiên bản bất biến của store: search() đọc _SNAP không cần lock (FAISS search đọc song song an toàn).
+    Writer không sửa snapshot đã publish: upsert/remove tạo snapshot mới dùng chung base + segment + tombstone mới
+    + delta nhỏ (IndexFlatIP dựng lại từ mảng, cỡ <= FLUSH_ROWS); checkpoint cuộn delta vào segment mới, chỉ gộp
+    vào bản sao của base khi segment đủ lớn (_merge).
+    """
+    __slots__ = ("index", "is_hnsw", "labels", "dead", "seg", "seg_dead", "seg_sel", "delta_ids", "delta_vecs",
+                 "delta", "params", "version")
+
+    def __init__(self, index, dead=(), delta_ids=None, delta_vecs=None, labels=None, params=None, version=0,
+                 seg: _Segment | None = None, seg_dead=()):
+        self.index = index                      # faiss.IndexIDMap2 hoặc IndexIVF (base), id = CV id
+        self.is_hnsw = _hnsw_of(index) is not None
+        self.labels = _labels_of(index) if labels is None else labels   # IDMap: offset -> id; IVF: id theo list
+        self.dead = frozenset(dead)             # HNSW: offset bị thay/xoá (id có thể lặp); loại khác: id
+        self.seg = seg
+        self.seg_dead = frozenset(seg_dead)     # id của segment đã bị thay/xoá sau checkpoint
+        self.seg_sel = None
+        if self.seg_dead:
+            batch = faiss.IDSelectorBatch(np.fromiter(self.seg_dead, dtype="int64", count=len(self.seg_dead)))
+            self.seg_sel = (faiss.IDSelectorNot(batch), batch)
+        self.delta_ids = np.zeros(0, dtype="int64") if delta_ids is None else delta_ids
+        self.delta_vecs = np.zeros((0, index.d), dtype="float32") if delta_vecs is None else delta_vecs
+        self.delta = None
+        if len(self.delta_ids):
+            self.delta = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+            self.delta.add_with_ids(self.delta_vecs, self.delta_ids)
+        self.params = params if params is not None or not self.dead else _dead_params(self)
+        self.version = version
+
+    def seg_live(self):
+        """(ids, vecs) còn sống của segment."""
+        if self.seg is None:
+            return np.zeros(0, dtype="int64"), np.zeros((0, self.index.d), dtype="float32")
+        if not self.seg_dead:
+            return self.seg.ids, self.seg.vecs
+        keep = ~np.isin(self.seg.ids, np.fromiter(self.seg_dead, dtype="int64", count=len(self.seg_dead)))
+        return self.seg.ids[keep], self.seg.vecs[keep]
+
+    def live_count(self) -> int:
+        n_seg = 0 if self.seg is None else len(self.seg.ids) - len(self.seg_dead)
+        # tombstone luôn trỏ vào base (offset HNSW / id có trong labels) với mọi loại index
+        return int(self.index.ntotal) - len(self.dead) + n_seg + len(self.delta_ids)
+
+def _dead_params(s: _Snapshot):
+    """SearchParameters loại tombstone; (params, selector...) để giữ tham chiếu C++. IndexPQ không nhận params."""
+    base = _inner(s.index)
+    if isinstance(base, faiss.IndexPQ):
+        return None
+    batch = faiss.IDSelectorBatch(np.fromiter(s.dead, dtype="int64", count=len(s.dead)))
+    sel = faiss.IDSelectorNot(batch)
+    if s.is_hnsw:
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=_hnsw_of(s.index).efSearch)
+    elif isinstance(base, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=base.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return (params, sel, batch)
+
+def _publish(s: _Snapshot):
+    global _SNAP, _OFFSET
+    if s.is_hnsw and (_SNAP is None or _SNAP.index is not s.index):
+        live = np.ones(len(s.labels), dtype=bool)
+        live[np.fromiter(s.dead, dtype="int64", count=len(s.dead))] = False
+        _OFFSET = dict(zip(s.labels[live].tolist(), np.flatnonzero(live).tolist()))
+    elif not s.is_hnsw:
+        _OFFSET = {}
+    _SNAP = s
+
+# ---------------- build / save ----------------
+def _chunks(data, ids=None, chunk_size: int = 65536):
+    """Các lô (ids, vecs đã chuẩn hoá): từ mảng + ids, hoặc từ iterable các cặp (ids, vecs) (stream CV từ DB)."""
+    if ids is not None:
+        if len(data) != len(ids):
+            raise ValueError("embeddings và ids phải cùng độ dài")
+        ids, data = _last_wins(_as_ids(ids), np.asarray(data))
+        for st in range(0, len(ids), chunk_size):
+            yield ids[st:st + chunk_size], np.ascontiguousarray(_normalize(data[st:st + chunk_size]))
+        return
+    for c_ids, c_vecs in data:
+        if len(c_vecs) != len(c_ids):
+            raise ValueError("embeddings và ids phải cùng độ dài")
+        if len(c_ids):
+            yield _as_ids(c_ids), np.ascontiguousarray(_normalize(np.asarray(c_vecs)))
+
+def _first(chunks):
+    head = next(chunks, None)
+    if head is None:
+        raise ValueError("Không có dữ liệu để build index")
+    return head
+
+def _fill(index, chunks, head=()):
+    for c_ids, c_vecs in head:
+        index.add_with_ids(c_vecs, c_ids)
+    for c_ids, c_vecs in chunks:
+        index.add_with_ids(c_vecs, c_ids)
+    return index
+
+def build_flat(data, ids=None, chunk_size: int = 65536):
+    """Index chính xác (IndexFlatIP). `data`: mảng [N, d] kèm ids, hoặc iterable các lô (ids, vecs)."""
+    chunks = _chunks(data, ids, chunk_size)
+    head = _first(chunks)
+    return _fill(_wrap(_create_index(head[1].shape[1], kind="flat")), chunks, [head])
+
+def build_hnsw(data, ids=None, M: int = 32, efConstruction: int = 200, efSearch: int = 64, chunk_size: int = 65536):
+    """HNSW: M cạnh/nút, efConstruction lúc dựng graph, efSearch mặc định lúc search (lưu cùng file)."""
+    chunks = _chunks(data, ids, chunk_size)
+    head = _first(chunks)
+    base = _create_index(head[1].shape[1], kind="hnsw", M=M, efConstruction=efConstruction, efSearch=efSearch)
+    return _fill(_wrap(base), chunks, [head])
+
+def build_ivf(data, ids=None, nlist: int | None = None, nprobe: int | None = None, train=None,
+              train_size: int | None = None, n_total: int | None = None, seed: int = 0, chunk_size: int = 65536):
+    """
+    IVF-Flat, id = CV id. nlist/nprobe/train_size mặc định theo ivf_params(N), N = len(ids) hoặc n_total (stream).
+    Mẫu train k-means: `train` nếu truyền (vd. CV chọn ngẫu nhiên trong DB), không thì train_size vector ngẫu nhiên
+    của mảng; khi stream, các lô đầu (đủ train_size) được giữ lại làm mẫu rồi add sau.
+    nlist bị hạ nếu mẫu < 39·nlist (k-means thiếu điểm cho mỗi cụm).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(ids) if ids is not None else int(n_total or 0)
+    chunks = _chunks(data, ids, chunk_size)
+    head = [_first(chunks)]
+    if train is not None:
+        train = np.ascontiguousarray(_normalize(np.asarray(train)))
+    else:
+        want = ivf_params(n, nlist, train_size=train_size)[2] if (n or nlist) else int(train_size or 65536)
+        rows = len(head[0][0])
+        while rows < want:
+            c = next(chunks, None)
+            if c is None:
+                break
+            head.append(c)
+            rows += len(c[0])
+        X = head[0][1] if len(head) == 1 else np.vstack([v for _, v in head])
+        train = X[np.sort(rng.choice(len(X), min(want, len(X)), replace=False))]
+        n = max(n, rows)
+    nlist = ivf_params(n or len(train), nlist)[0]
+    if len(train) < 39 * nlist:
+        print(f"[faiss] mẫu train {len(train)} < 39·nlist={39 * nlist}: hạ nlist xuống {max(1, len(train) // 39)}")
+        nlist = max(1, len(train) // 39)
+    nprobe = ivf_params(n, nlist, nprobe)[1]
+    index = _create_index(train.shape[1], kind="ivf", nlist=nlist, nprobe=nprobe)
+    _train_if_needed(index, train)
+    return _fill(index, chunks, head)
+
+_BUILDERS = {"flat": build_flat, "hnsw": build_hnsw, "ivf": build_ivf}
+
+def _kind_of(index) -> str:
+    base = _inner(index)
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        return "sq16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(base, faiss.IndexPQ):
+        return "pq"
+    return "flat"
+
+def _index_meta(index) -> dict:
+    meta = {"dim": index.d, "metric": "ip_cosine", "index_kind": _kind_of(index), "id_space": "int64",
+            "created_at": int(time.time())}
+    base, hnsw = _inner(index), _hnsw_of(index)
+    if isinstance(base, faiss.IndexIVF):
+        meta |= {"nlist": int(base.nlist), "nprobe": int(base.nprobe)}
+    if hnsw is not None:
+        meta |= {"M": int(hnsw.nb_neighbors(1)), "efConstruction": int(hnsw.efConstruction),
+                 "efSearch": int(hnsw.efSearch)}
+    return meta
+
 def build_new(embeddings: np.ndarray, ids, kind: str = "hnsw", meta: dict | None = None):
-    """Xây index FAISS từ đầu và persist ra file; cập nhật cache RAM."""
-    global _INDEX, _IDMAP, _DIM
+    """Xây index FAISS từ đầu, persist và publish; search vẫn chạy trên bản cũ tới lúc đổi."""
     if len(embeddings) != len(ids):
         raise ValueError("embeddings và ids phải cùng độ dài")
     if len(ids) == 0:
         raise ValueError("Không có dữ liệu để build index")
+    if kind in _BUILDERS:
+        index = _BUILDERS[kind](embeddings, ids)
+    else:
+        ids, embs = _last_wins(_as_ids(ids), _normalize(np.asarray(embeddings)))
+        index = _wrap(_create_index(embs.shape[1], kind=kind))
+        _train_if_needed(index, embs)
+        index.add_with_ids(embs, ids)
+    with _LOCK:
+        save(index, meta=meta)
+        if _SNAP is None:
+            load()
 
-    embs = _normalize(np.asarray(embeddings))
-    dim = embs.shape[1]
-    p = _paths()
+def save(index, path: str | None = None, meta: dict | None = None) -> str:
+    """
+    Persist index vừa build (build_flat/build_hnsw/build_ivf); trả về đường dẫn file index.
+    path=None: swap vào store (FAISS_INDEX_DIR). File ghi trong thư mục tạm rồi os.replace thành thế hệ mới,
+    meta.json là điểm commit. WAL giữ nguyên: thao tác chưa checkpoint (của server) được replay lên index mới khi
+    load(); process đang phục vụ (kể cả worker rảnh) nạp index mới ở tick kế của flusher (~1 giây).
+    Process này nếu đã load thì nạp lại ngay.
+    path=<thư mục>: ghi thành một store độc lập ở đó (chép sang FAISS_INDEX_DIR để dùng).
+    """
+    meta = _index_meta(index) | (meta or {}) | {"count": int(index.ntotal), "dead": 0,
+                                                 "checkpoint_at": int(time.time())}
+    if path:
+        out = Path(path)
+        out.mkdir(parents=True, exist_ok=True)
+        _write_index_atomic(index, out / "index.1.faiss")
+        _write_atomic(out / "meta.json", lambda f: f.write(json.dumps(meta | {"gen": 1, "wal_seq": 0},
+                                                                       ensure_ascii=False, indent=2)))
+        return str(out / "index.1.faiss")
+    with _LOCK, _dir_lock():
+        disk = _disk_meta()
+        gen = max(_GEN, int(disk.get("gen", 0))) + 1
+        p = _paths(gen)
+        _write_index_atomic(index, p["index"])
+        meta |= {"gen": gen, "wal_seq": int(disk.get("wal_seq", 0))}
+        _write_atomic(p["meta"], lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2)))
+        _remove_old(p)
+        print(f"[faiss] swap index mới gen={gen} ({meta['index_kind']}, {meta['count']} vector)")
+        if _SNAP is not None:
+            load()
+    return str(p["index"])
 
-    with _LOCK:
-        index = _create_index(dim, kind=kind)
-        index.add(embs)
-        faiss.write_index(index, str(p["index"]))
+def _write_atomic(path: Path, write, mode: str = "w"):
+    tmp = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp, mode, **({"encoding": "utf-8", "newline": "\n"} if "b" not in mode else {})) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
 
-        with open(p["ids"], "w", encoding="utf-8") as f:
-            for _id in ids:
-                f.write(json.dumps(_id, ensure_ascii=False) + "\n")
+def _write_index_atomic(index, path: Path):
+    # ghi trong thư mục tạm cạnh đích (cùng filesystem) rồi os.replace: reader không bao giờ thấy file dở
+    tmp_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=path.parent))
+    try:
+        faiss.write_index(index, str(tmp_dir / path.name))
+        with open(tmp_dir / path.name, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_dir / path.name, path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
-        meta = (meta or {}) | {
-            "dim": dim, "count": len(ids),
-            "metric": "ip_cosine", "index_kind": kind,
-            "created_at": int(time.time())
-        }
-        p["meta"].write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+def _disk_meta() -> dict:
+    p = _paths(0)["meta"]
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
 
-        _INDEX = index
-        _IDMAP = list(ids)
-        _DIM = dim
+@contextmanager
+def _dir_lock():
+    """
+    Khoá liên process quanh việc ghi thế hệ mới (checkpoint, build_faiss_index) và append/đọc WAL.
+    Lồng được trong cùng thread (vd. save() -> load()); flock chỉ lấy ở tầng ngoài cùng.
+    """
+    depth = getattr(_DIR_LOCK_DEPTH, "n", 0)
+    if fcntl is None or depth:
+        _DIR_LOCK_DEPTH.n = depth + 1
+        try:
+            yield
+        finally:
+            _DIR_LOCK_DEPTH.n = depth
+        return
+    with open(_base_dir() / ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        _DIR_LOCK_DEPTH.n = 1
+        try:
+            yield
+        finally:
+            _DIR_LOCK_DEPTH.n = 0
+            fcntl.flock(f, fcntl.LOCK_UN)
 
-def load() -> bool:
-    """Load index + idmap vào RAM từ file. Trả về True nếu có file."""
-    global _INDEX, _IDMAP, _DIM
-    p = _paths()
-    if not p["index"].exists() or not p["ids"].exists():
-        return False
-    with _LOCK:
-        index = faiss.read_index(str(p["index"]))
-        ids = []
-        with open(p["ids"], "r", encoding="utf-8") as f:
-            for line in f:
-                ids.append(json.loads(line))
-        _INDEX = index
-        _IDMAP = ids
-        _DIM = _INDEX.d
+def _remove_old(p, base: Path | None = None):
+    # giữ file của thế hệ p; base: file index của thế hệ trước mà thế hệ p vẫn dùng lại
+    d = p["meta"].parent
+    keep = ((base or p["index"]).name, p["tomb"].name, p["seg"].name)
+    for old in list(d.glob("index.*.faiss")) + list(d.glob("tomb.*.npy")) + list(d.glob("seg.*.npz")):
+        if old.name not in keep:
+            old.unlink(missing_ok=True)
+    for old in (p["legacy_index"], p["legacy_ids"]):
+        old.unlink(missing_ok=True)
+
+def _commit() -> bool:
+    """
+    Ghi thế hệ mới: index.<gen>.faiss nếu base đổi (không thì meta trỏ base_gen cũ) + tomb.<gen>.npy
+    + seg.<gen>.npz, rồi meta.json là điểm commit; xoá WAL + file cũ.
+    Gọi khi giữ _LOCK và delta đã gộp (_merge); base bất biến nên search vẫn chạy trong lúc ghi.
+    Trả về False (không ghi) nếu process khác đã swap thế hệ mới hơn (build_faiss_index): cần load() lại.
+    Bản ghi WAL của worker khác chưa áp được đọc và gộp trước khi ghi, vì WAL bị cắt sau commit.
+    """
+    global _GEN, _BASE_GEN, _BASE_INDEX, _WAL_OFF
+    with _dir_lock():
+        if int(_disk_meta().get("gen", 0)) > _GEN:
+            return False
+        if _wal_tail(_paths()):
+            _merge()
+        s = _SNAP
+        assert not len(s.delta_ids), "delta phải được gộp trước khi commit"
+        gen = _GEN + 1
+        p = _paths(gen)
+        base_gen = _BASE_GEN if s.index is _BASE_INDEX else gen
+        if base_gen == gen:
+            _write_index_atomic(s.index, p["index"])
+        if s.dead:
+            _write_atomic(p["tomb"], lambda f: np.save(f, np.array(sorted(s.dead), dtype="int64")), mode="wb")
+        if s.seg is not None:
+            _write_atomic(p["seg"], lambda f: np.savez(f, ids=s.seg.ids, vecs=s.seg.vecs), mode="wb")
+        meta = _META | {"gen": gen, "base_gen": base_gen, "wal_seq": _WAL_SEQ, "count": s.live_count(),
+                        "dead": len(s.dead), "seg": 0 if s.seg is None else len(s.seg.ids),
+                        "checkpoint_at": int(time.time())}
+        _write_atomic(p["meta"], lambda f: f.write(json.dumps(meta, ensure_ascii=False, indent=2)))
+        _GEN, _BASE_GEN, _BASE_INDEX = gen, base_gen, s.index
+        _wal_reset(p)
+        _WAL_OFF = 0
+        _remove_old(p, _paths(base_gen)["index"])
     return True
 
-def is_loaded() -> bool:
-    return _INDEX is not None
+# ---------------- WAL ----------------
+def _wal_append(p, op: int, seq: int, ids: np.ndarray, embs: np.ndarray | None = None) -> int:
+    """Append một bản ghi (gọi khi giữ _dir_lock); trả về số byte đã ghi."""
+    payload = ids.astype("<i8").tobytes() + (b"" if embs is None else embs.astype("<f4").tobytes())
+    dim = 0 if embs is None else embs.shape[1]
+    hdr = _WAL_HDR.pack(_WAL_MAGIC, op, seq, len(ids), dim, zlib.crc32(payload))
+    with open(p["wal"], "ab") as f:
+        f.write(hdr + payload)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(hdr) + len(payload)
 
-def add(embeddings: np.ndarray, ids):
-    """Append vector + id rồi persist; yêu cầu đã load()."""
+def _wal_records(path: Path, start: int = 0):
+    """
+    ([(op, seq, ids, embs|None)...], offset cuối) đọc từ byte `start`; đuôi bị ghi dở (crash giữa chừng)
+    được cắt bỏ. Gọi khi giữ _dir_lock: không thấy bản ghi đang được process khác append dở.
+    """
+    if not path.exists():
+        return [], 0
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    out, off = [], 0
+    while off + _WAL_HDR.size <= len(data):
+        magic, op, seq, n, dim, crc = _WAL_HDR.unpack_from(data, off)
+        end = off + _WAL_HDR.size + n * 8 + n * dim * 4
+        if magic != _WAL_MAGIC or op not in (_OP_UPSERT, _OP_REMOVE) or end > len(data):
+            break
+        payload = data[off + _WAL_HDR.size:end]
+        if zlib.crc32(payload) != crc:
+            break
+        ids = np.frombuffer(payload[:n * 8], dtype="<i8").astype("int64")
+        embs = np.frombuffer(payload[n * 8:], dtype="<f4").reshape(n, dim) if op == _OP_UPSERT else None
+        out.append((op, seq, ids, embs))
+        off = end
+    if off < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(start + off)
+    return out, start + off
+
+def _wal_replay(records) -> int:
+    """Áp các bản ghi seq > _WAL_SEQ (chưa nằm trong checkpoint/RAM); trả về số dòng đã áp."""
+    global _WAL_SEQ
+    rows = 0
+    for op, seq, ids, embs in records:
+        if seq <= _WAL_SEQ:
+            continue
+        if op == _OP_UPSERT:
+            _apply_upsert(ids, embs)
+        else:
+            _apply_remove(ids)
+        _WAL_SEQ = seq
+        rows += len(ids)
+    return rows
+
+def _wal_tail(p) -> int:
+    """Áp bản ghi process khác đã append sau _WAL_OFF (gọi khi giữ _LOCK + _dir_lock, cùng thế hệ)."""
+    global _WAL_OFF, _PENDING, _PENDING_SINCE
+    records, _WAL_OFF = _wal_records(p["wal"], _WAL_OFF)
+    rows = _wal_replay(records)
+    if rows:
+        _PENDING += rows
+        _PENDING_SINCE = _PENDING_SINCE or time.time()
+    return rows
+
+def _wal_reset(p):
+    if p["wal"].exists():
+        with open(p["wal"], "r+b") as f:
+            f.truncate(0)
+            os.fsync(f.fileno())
+
+# ---------------- upsert / remove (copy-on-write) ----------------
+def _seg_dead(s: _Snapshot, ids: np.ndarray) -> frozenset:
+    if s.seg is None:
+        return s.seg_dead
+    return s.seg_dead | frozenset(ids[np.isin(ids, s.seg.ids)].tolist())
+
+def _apply_upsert(ids: np.ndarray, embs: np.ndarray):
+    s = _SNAP
+    dead = set(s.dead)
+    if s.is_hnsw:
+        for i in ids.tolist():
+            off = _OFFSET.pop(i, None)
+            if off is not None:
+                dead.add(off)
+    else:
+        dead.update(ids[np.isin(ids, s.labels)].tolist())   # tombstone chỉ giữ id có trong base
+    keep = ~np.isin(s.delta_ids, ids)
+    _publish(_Snapshot(s.index, dead, np.concatenate([s.delta_ids[keep], ids]),
+                       np.vstack([s.delta_vecs[keep], embs]), labels=s.labels,
+                       params=s.params if len(dead) == len(s.dead) else None, version=s.version + 1,
+                       seg=s.seg, seg_dead=_seg_dead(s, ids)))
+
+def _apply_remove(ids: np.ndarray) -> int:
+    s = _SNAP
+    dead = set(s.dead)
+    if s.is_hnsw:
+        for i in ids.tolist():
+            off = _OFFSET.pop(i, None)
+            if off is not None:
+                dead.add(off)
+    else:
+        dead.update(i for i in ids[np.isin(ids, s.labels)].tolist() if i not in s.dead)
+    in_delta = np.isin(s.delta_ids, ids)
+    seg_dead = _seg_dead(s, ids)
+    n = len(dead) - len(s.dead) + int(in_delta.sum()) + len(seg_dead) - len(s.seg_dead)
+    if n:
+        _publish(_Snapshot(s.index, dead, s.delta_ids[~in_delta], s.delta_vecs[~in_delta], labels=s.labels,
+                           params=s.params if len(dead) == len(s.dead) else None, version=s.version + 1,
+                           seg=s.seg, seg_dead=seg_dead))
+    return n
+
+def _log_and_apply(op: int, ids: np.ndarray, embs: np.ndarray | None = None):
+    global _WAL_SEQ, _WAL_OFF, _PENDING, _PENDING_SINCE
+    with _LOCK, _dir_lock():
+        # seq nối tiếp WAL trên đĩa: áp bản ghi của worker khác trước (hoặc nạp thế hệ họ vừa checkpoint)
+        if int(_disk_meta().get("gen", 0)) > _GEN:
+            load()
+        else:
+            _wal_tail(_paths())
+        _WAL_OFF += _wal_append(_paths(), op, _WAL_SEQ + 1, ids, embs)
+        _WAL_SEQ += 1
+        out = _apply_upsert(ids, embs) if op == _OP_UPSERT else _apply_remove(ids)
+        _PENDING += len(ids)
+        _PENDING_SINCE = _PENDING_SINCE or time.time()
+    _ensure_flusher()
+    if _PENDING >= _setting("FAISS_FLUSH_ROWS", FLUSH_ROWS):
+        _FLUSH_EVENT.set()
+    return out
+
+def upsert(embeddings: np.ndarray, ids):
+    """Thêm hoặc thay vector theo CV id (ghi WAL trước, checkpoint do flusher nền); yêu cầu đã load()."""
     assert is_loaded(), "Index chưa load"
     if len(embeddings) != len(ids):
         raise ValueError("embeddings và ids phải cùng độ dài")
-    embs = _normalize(np.asarray(embeddings))
-    p = _paths()
+    if len(ids) == 0:
+        return
+    ids, embs = _last_wins(_as_ids(ids), np.ascontiguousarray(_normalize(np.asarray(embeddings))))
+    _log_and_apply(_OP_UPSERT, ids, embs)
+
+def add(embeddings: np.ndarray, ids):
+    """Giữ tương thích: add == upsert (CV sửa lại không còn bị nhân đôi vector)."""
+    upsert(embeddings, ids)
+
+def remove(ids) -> int:
+    """Xoá vector theo CV id (HNSW: tombstone, dọn khi compact). Trả về số vector đã xoá."""
+    assert is_loaded(), "Index chưa load"
+    ids = _as_ids(ids)
+    if len(ids) == 0:
+        return 0
+    return _log_and_apply(_OP_REMOVE, np.unique(ids))
+
+def _merge(compact: bool = False) -> bool:
+    """
+    Checkpoint thường: cuộn delta + segment còn sống thành segment mới, base (và file của nó) giữ nguyên.
+    Khi segment + tombstone vượt MERGE_RATIO·ntotal (hoặc compact): gộp vào base mới (bản sao, hoặc dựng lại
+    HNSW khi compact). Gọi khi giữ _LOCK; search vẫn chạy trên snapshot cũ trong lúc dựng.
+    """
+    s = _SNAP
+    side_ids, side_vecs = s.seg_live()
+    if len(s.delta_ids):
+        side_ids, side_vecs = np.concatenate([side_ids, s.delta_ids]), np.vstack([side_vecs, s.delta_vecs])
+    changed = len(s.delta_ids) > 0 or bool(s.seg_dead)
+    if s.is_hnsw:
+        compact = compact or len(s.dead) > _setting("FAISS_COMPACT_RATIO", COMPACT_RATIO) * max(1, s.index.ntotal)
+    backlog = len(side_ids) + (0 if s.is_hnsw else len(s.dead))
+    if not compact and backlog <= _setting("FAISS_MERGE_RATIO", MERGE_RATIO) * s.index.ntotal:
+        if not changed:
+            return False
+        seg = _Segment(side_ids, side_vecs) if len(side_ids) else None
+        _publish(_Snapshot(s.index, s.dead, labels=s.labels, params=s.params, version=s.version + 1, seg=seg))
+        return True
+    if s.is_hnsw:
+        if not (len(side_ids) or (compact and s.dead)):
+            return False
+        if compact and s.dead:
+            hnsw = _hnsw_of(s.index)
+            live = np.setdiff1d(np.arange(s.index.ntotal, dtype="int64"),
+                                np.fromiter(s.dead, dtype="int64", count=len(s.dead)))
+            base = _create_index(s.index.d, kind="hnsw", M=hnsw.nb_neighbors(1), efConstruction=hnsw.efConstruction,
+                                 efSearch=hnsw.efSearch)
+            index, dead = faiss.IndexIDMap2(base), ()
+            for st in range(0, len(live), 65536):
+                chunk = live[st:st + 65536]
+                index.add_with_ids(s.index.index.reconstruct_batch(chunk), s.labels[chunk])
+        else:
+            index, dead = faiss.clone_index(s.index), s.dead
+    else:
+        if not (len(side_ids) or s.dead):
+            return False
+        index, dead = faiss.clone_index(s.index), ()
+        if s.dead:
+            index.remove_ids(faiss.IDSelectorBatch(np.fromiter(s.dead, dtype="int64", count=len(s.dead))))
+    if len(side_ids):
+        index.add_with_ids(side_vecs, side_ids)
+    _publish(_Snapshot(index, dead, version=s.version + 1))
+    return True
+
+def compact() -> int:
+    """HNSW: dựng lại graph chỉ từ vector còn sống (bỏ tombstone) rồi checkpoint. Trả về số offset đã dọn."""
+    global _PENDING, _PENDING_SINCE
+    with _LOCK:
+        n = len(_SNAP.dead) if _SNAP.is_hnsw else 0
+        if not n:
+            return 0
+        _merge(compact=True)
+        if not _commit():
+            load()                          # index đã bị thay bởi bản rebuild: không còn gì để dọn
+            return 0
+        _PENDING, _PENDING_SINCE = 0, None
+        return n
+
+# ---------------- checkpoint ----------------
+def _checkpoint():
+    """Gộp delta (compact nếu cần), ghi thế hệ mới, xoá WAL. Gọi khi giữ _LOCK."""
+    global _PENDING, _PENDING_SINCE
+    if _SNAP is None or _PENDING == 0:
+        return False
+    _merge()
+    if not _commit():
+        # build_faiss_index đã swap / worker khác đã checkpoint thế hệ mới: nạp nó, replay WAL còn lại rồi checkpoint
+        load()
+        if _PENDING == 0 or not _commit():
+            return False
+    _PENDING, _PENDING_SINCE = 0, None
+    return True
+
+def flush() -> bool:
+    """Checkpoint ngay các thao tác đang chờ trong WAL. Trả về True nếu có ghi."""
     with _LOCK:
-        _INDEX.add(embs)
-        with open(p["ids"], "a", encoding="utf-8") as f:
-            for _id in ids:
-                f.write(json.dumps(_id, ensure_ascii=False) + "\n")
-        faiss.write_index(_INDEX, str(p["index"]))
-        _IDMAP.extend(ids)
-
-def search(query_embeddings: np.ndarray, topk: int = 10):
-    """Trả về danh sách kết quả cho từng query: [[(cv_id, score), ...], ...]."""
+        return _checkpoint()
+
+def _poll_disk():
+    """Worker rảnh (không có gì chờ checkpoint) vẫn nạp thế hệ mới do build_faiss_index/worker khác ghi."""
+    if _SNAP is not None and int(_disk_meta().get("gen", 0)) > _GEN:
+        load()
+
+def _flusher_loop():
+    while True:
+        _FLUSH_EVENT.wait(timeout=1.0)
+        _FLUSH_EVENT.clear()
+        try:
+            _poll_disk()                        # mỗi tick, kể cả khi _PENDING == 0
+        except Exception as e:                  # meta/index đang bị thay: tick sau đọc lại
+            print(f"[faiss] nạp thế hệ mới lỗi: {e}")
+        with _LOCK:
+            due = _PENDING >= _setting("FAISS_FLUSH_ROWS", FLUSH_ROWS) or (
+                _PENDING_SINCE is not None and time.time() - _PENDING_SINCE >= _setting("FAISS_FLUSH_SECONDS", FLUSH_SECONDS))
+            if due:
+                try:
+                    _checkpoint()
+                except Exception as e:          # WAL vẫn còn, lần sau thử lại
+                    print(f"[faiss] checkpoint lỗi: {e}")
+
+def _ensure_flusher():
+    global _FLUSHER, _FLUSHER_PID
+    if _FLUSHER is not None and _FLUSHER_PID == os.getpid() and _FLUSHER.is_alive():
+        return
+    _FLUSHER_PID = os.getpid()
+    _FLUSHER = threading.Thread(target=_flusher_loop, name="faiss-flusher", daemon=True)
+    _FLUSHER.start()
+
+atexit.register(lambda: _SNAP is not None and _PENDING and flush())
+
+def _load_legacy(p, meta: dict):
+    # index.faiss + ids.jsonl (id theo vị trí): chuyển sang IndexIDMap2, id lặp (bản sửa cũ bị nhân đôi) giữ bản cuối
+    old = faiss.read_index(str(p["legacy_index"]))
+    with open(p["legacy_ids"], "r", encoding="utf-8") as f:
+        ids = _as_ids(json.loads(line) for line in f)[:old.ntotal]
+    embs = old.reconstruct_n(0, len(ids)) if len(ids) else np.zeros((0, old.d), dtype="float32")
+    ids, embs = _last_wins(ids, embs)
+    base = faiss.clone_index(old)           # giữ tham số + phần đã train
+    base.reset()
+    index = _wrap(base)
+    if len(ids):
+        index.add_with_ids(embs, ids)
+    print(f"[faiss] chuyển index cũ sang IndexIDMap2 ({len(ids)} vector)")
+    return index
+
+def _tune(index):
+    # tham số search lưu trong file; settings FAISS_NPROBE / FAISS_EF_SEARCH (nếu đặt) ghi đè khi load
+    base, hnsw = _inner(index), _hnsw_of(index)
+    nprobe, ef = _setting("FAISS_NPROBE", 0), _setting("FAISS_EF_SEARCH", 0)
+    if nprobe and isinstance(base, faiss.IndexIVF):
+        base.nprobe = min(nprobe, base.nlist)
+    if ef and hnsw is not None:
+        hnsw.efSearch = ef
+
+def load() -> bool:
+    """Load index vào RAM từ file, replay WAL (các thao tác chưa checkpoint). Trả về True nếu có file."""
+    global _GEN, _BASE_GEN, _BASE_INDEX, _META, _WAL_SEQ, _WAL_OFF, _PENDING, _PENDING_SINCE
+    base = _paths(0)
+    meta = json.loads(base["meta"].read_text(encoding="utf-8")) if base["meta"].exists() else {}
+    gen = meta.get("gen")
+    p = _paths(gen or 0)
+    base_gen = int(meta.get("base_gen", gen or 0))
+    index_path = _paths(base_gen)["index"]
+    legacy = gen is None and p["legacy_index"].exists() and p["legacy_ids"].exists()
+    if not legacy and (gen is None or not index_path.exists()):
+        return False
+    seg = None
+    if legacy:
+        index, dead = _load_legacy(p, meta), ()
+        meta = meta | {"id_space": "int64"}
+    else:
+        try:
+            index = faiss.read_index(str(index_path))
+            dead = np.load(p["tomb"]).tolist() if p["tomb"].exists() else ()
+            if dead and _hnsw_of(index) is None:
+                dead = np.intersect1d(dead, _labels_of(index)).tolist()   # tomb cũ có thể chứa id ngoài base
+            if p["seg"].exists():
+                with np.load(p["seg"]) as z:
+                    seg = _Segment(z["ids"], z["vecs"])
+        except (RuntimeError, OSError):
+            if int(_disk_meta().get("gen", 0)) != gen:
+                return load()               # file thế hệ cũ vừa bị xoá sau commit của process khác
+            raise
+    _tune(index)
+    with _LOCK, _dir_lock():
+        if int(_disk_meta().get("gen", 0)) != int(gen or 0):
+            return load()                   # process khác vừa commit thế hệ mới trong lúc đọc file
+        _publish(_Snapshot(index, dead, version=(_SNAP.version + 1) if _SNAP else 0, seg=seg))
+        _GEN, _META = int(gen or 0), {k: v for k, v in meta.items()
+                                      if k not in ("gen", "base_gen", "wal_seq", "count", "dead", "seg")}
+        _BASE_GEN, _BASE_INDEX = base_gen, (None if legacy else index)
+        _WAL_SEQ = int(meta.get("wal_seq", 0))     # bản ghi seq <= wal_seq đã nằm trong checkpoint
+        records, _WAL_OFF = _wal_records(p["wal"])
+        pending = _wal_replay(records)
+        if pending:
+            _merge()                        # delta replay có thể lớn: cuộn vào segment, WAL giữ tới checkpoint
+        _PENDING, _PENDING_SINCE = pending, (time.time() if pending else None)
+        if legacy:
+            _commit()
+            _PENDING, _PENDING_SINCE = 0, None
+    _ensure_flusher()                       # cả khi không có gì chờ: flusher theo dõi thế hệ mới trên đĩa
+    return True
+
+def is_loaded() -> bool:
+    return _SNAP is not None
+
+# ---------------- search ----------------
+FILTER_MAX_WIDEN = 64   # filter chọn lọc: efSearch/nprobe/k lấy dư tối đa chừng này lần trước khi quét toàn bộ
+
+class IdFilter:
+    """
+    Tập CV id được phép cho search(id_filter=...): bitmap 1 bit/id (IDSelectorBitmap), dựng một lần rồi dùng lại
+    giữa các query (recruitapi cache theo thuộc tính DB). HNSW search theo offset nội bộ nên bitmap theo offset
+    được dựng lười cho base hiện tại và giữ kèm tới khi base đổi (checkpoint).
+    """
+    def __init__(self, ids):
+        ids = np.unique(ids.astype("int64") if isinstance(ids, np.ndarray) else _as_ids(ids))
+        self.ids = ids[ids >= 0]
+        mask = np.zeros(int(self.ids[-1]) + 1 if len(self.ids) else 0, dtype=bool)
+        mask[self.ids] = True
+        self.bits = np.packbits(mask, bitorder="little")
+        self.sel = faiss.IDSelectorBitmap(len(self.bits), faiss.swig_ptr(self.bits))
+        self._base = (None, None, None, 0)      # (base, bitmap theo offset, selector theo offset, số id có trong base)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def contains(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype="int64")
+        ok = (ids >= 0) & (ids < len(self.bits) * 8)
+        out = np.zeros(ids.shape, dtype=bool)
+        i = ids[ok]
+        out[ok] = (self.bits[i >> 3] >> (i & 7)) & 1
+        return out
+
+    def _for_base(self, s: _Snapshot):
+        cached = self._base
+        if cached[0] is not s.index:
+            member = self.contains(s.labels)
+            bits = np.packbits(member, bitorder="little")
+            cached = (s.index, bits, faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits)), int(member.sum()))
+            self._base = cached                 # gán một lần: thread khác thấy bản cũ hoặc mới, đều đúng
+        return cached
+
+def _available(s: _Snapshot, flt: IdFilter) -> int:
+    # số vector còn sống thuộc filter (tombstone luôn nằm trong base: offset HNSW / id có trong s.labels)
+    dead = np.fromiter(s.dead, dtype="int64", count=len(s.dead))
+    n_dead = int(flt.contains(s.labels[dead] if s.is_hnsw else dead).sum()) if len(dead) else 0
+    return max(0, flt._for_base(s)[3] - n_dead) + int(flt.contains(s.seg_live()[0]).sum()) + \
+        int(flt.contains(s.delta_ids).sum())
+
+def _topk_kept(D, I, keep, k: int):
+    D2 = np.full((len(D), k), -np.inf, dtype="float32")
+    I2 = np.full((len(D), k), -1, dtype="int64")
+    for r in range(len(D)):
+        d, i = D[r][keep[r]][:k], I[r][keep[r]][:k]
+        D2[r, :len(d)], I2[r, :len(i)] = d, i
+    return D2, I2
+
+def _search_base(s: _Snapshot, q: np.ndarray, k: int, flt: IdFilter | None = None, widen: float = 1.0):
+    """
+    Search base (bỏ tombstone, giữ id thuộc flt). widen > 1: filter chọn lọc, mở rộng efSearch/nprobe/số kết quả
+    lấy dư theo tỉ lệ; widen = inf: quét hết (IVF nprobe = nlist, HNSW tính chính xác trên các offset được phép).
+    """
+    if flt is None and not s.dead:
+        return s.index.search(q, k)
+    base = _inner(s.index)
+    if isinstance(base, faiss.IndexPQ):
+        # IndexPQ không nhận selector: lấy dư (tombstone + độ chọn lọc của filter) rồi lọc
+        k2 = s.index.ntotal if widen == float("inf") else int(min(s.index.ntotal, (k + len(s.dead)) * widen))
+        D, I = s.index.search(q, max(k, k2))
+        keep = I >= 0
+        if s.dead:
+            keep &= ~np.isin(I, np.fromiter(s.dead, dtype="int64", count=len(s.dead)))
+        if flt is not None:
+            keep &= flt.contains(I)
+        return _topk_kept(D, I, keep, k)
+    if flt is None:
+        if s.is_hnsw:
+            # tombstone là offset nội bộ (id có thể lặp sau upsert): search graph bên trong rồi map offset -> id
+            D, O = base.search(q, k, params=s.params[0])
+            return D, np.where(O >= 0, s.labels[np.maximum(O, 0)], -1)
+        return s.index.search(q, k, params=s.params[0])
+    # filter ∧ không-tombstone; các selector được giữ trong biến cục bộ tới hết lần search
+    not_dead = s.params[1] if s.params is not None else None
+    if s.is_hnsw:
+        _, off_bits, off_sel, _ = flt._for_base(s)
+        if widen == float("inf"):
+            off = np.flatnonzero(np.unpackbits(off_bits, count=len(s.labels), bitorder="little"))
+            off = off[~np.isin(off, np.fromiter(s.dead, dtype="int64", count=len(s.dead)))]
+            if not len(off):
+                return np.full((len(q), k), -np.inf, dtype="float32"), np.full((len(q), k), -1, dtype="int64")
+            D = q @ base.reconstruct_batch(off).T
+            order = np.argsort(-D, axis=1, kind="stable")[:, :k]
+            D, I = np.take_along_axis(D, order, 1), s.labels[off[order]]
+            return _topk_kept(D, I, np.ones(I.shape, dtype=bool), k)
+        sel = off_sel if not_dead is None else faiss.IDSelectorAnd(off_sel, not_dead)
+        ef = int(min(max(base.hnsw.efSearch, k) * widen, s.index.ntotal))
+        D, O = base.search(q, k, params=faiss.SearchParametersHNSW(sel=sel, efSearch=max(ef, k)))
+        return D, np.where(O >= 0, s.labels[np.maximum(O, 0)], -1)
+    sel = flt.sel if not_dead is None else faiss.IDSelectorAnd(flt.sel, not_dead)
+    if isinstance(base, faiss.IndexIVF):
+        nprobe = base.nlist if widen == float("inf") else int(min(base.nlist, np.ceil(base.nprobe * widen)))
+        return s.index.search(q, k, params=faiss.SearchParametersIVF(sel=sel, nprobe=nprobe))
+    return s.index.search(q, k, params=faiss.SearchParameters(sel=sel))
+
+def _search_flat(index, q: np.ndarray, k: int, sels):
+    # segment/delta (IndexFlatIP theo id, quét chính xác); sels: các selector cùng phải thoả
+    sels = [x for x in sels if x is not None]
+    sel = None if not sels else sels[0] if len(sels) == 1 else faiss.IDSelectorAnd(*sels)
+    return index.search(q, k, params=None if sel is None else faiss.SearchParameters(sel=sel))
+
+def _search_snapshot(s: _Snapshot, q: np.ndarray, k: int, flt: IdFilter | None = None, widen: float = 1.0):
+    scores, idxs = _search_base(s, q, k, flt, widen)
+    flt_sel = None if flt is None else flt.sel
+    parts = []
+    if s.seg is not None:
+        parts.append(_search_flat(s.seg.index, q, k, [flt_sel, s.seg_sel and s.seg_sel[0]]))
+    if s.delta is not None:
+        parts.append(_search_flat(s.delta, q, k, [flt_sel]))
+    if parts:
+        scores = np.hstack([scores] + [d for d, _ in parts])
+        idxs = np.hstack([idxs] + [i for _, i in parts])
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        scores, idxs = np.take_along_axis(scores, order, 1), np.take_along_axis(idxs, order, 1)
+    return scores, idxs
+
+def search(query_embeddings: np.ndarray, topk: int = 10, id_filter: IdFilter | None = None):
+    """
+    Trả về danh sách kết quả cho từng query: [[(cv_id, score), ...], ...].
+    id_filter: chỉ trả CV id thuộc IdFilter (lọc ngay trong FAISS, không post-filter nên không hụt top-k);
+    filter càng hẹp thì search càng lấy dư, query nào vẫn thiếu kết quả được search lại quét toàn bộ.
+    """
     assert is_loaded(), "Index chưa load"
+    snap = _SNAP            # snapshot bất biến: không lock, các thread search song song
     q = _normalize(np.asarray(query_embeddings))
-    with _LOCK:
-        scores, idxs = _INDEX.search(q, topk)
+    if id_filter is None:
+        scores, idxs = _search_snapshot(snap, q, topk)
+    else:
+        avail = _available(snap, id_filter)
+        if avail == 0:
+            return [[] for _ in range(len(q))]
+        widen = min(FILTER_MAX_WIDEN, max(1.0, snap.live_count() / avail))
+        scores, idxs = _search_snapshot(snap, q, topk, id_filter, widen)
+        short = (idxs >= 0).sum(axis=1) < min(topk, avail)
+        if short.any() and (snap.is_hnsw or isinstance(_inner(snap.index), (faiss.IndexIVF, faiss.IndexPQ))):
+            scores[short], idxs[short] = _search_snapshot(snap, q[short], topk, id_filter, float("inf"))
     results = []
     for row_scores, row_idxs in zip(scores, idxs):
         row = []
         for s, i in zip(row_scores, row_idxs):
             if i == -1:
                 continue
-            row.append((_IDMAP[i], float(s)))
+            row.append((int(i), float(s)))
         results.append(row)
     return results
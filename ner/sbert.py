@@ -21,6 +21,11 @@ except Exception:  # keep import optional
     SentenceTransformer = None
     np = None
 
+try:  # inside the recruit repo: share the process-wide encoder with ml/ (one copy of the weights)
+    from ml.src.embedder.registry import get_encoder as _get_encoder
+except Exception:
+    _get_encoder = None
+
 
 # ============================= Utils =============================
 
@@ -252,7 +257,7 @@ class SkillExtractorFS:
         if self.use_sbert:
             if SentenceTransformer is None or np is None:
                 raise RuntimeError("sentence-transformers / numpy not installed")
-            self._sbert = SentenceTransformer(sbert_model)
+            self._sbert = _get_encoder(sbert_model) if _get_encoder else SentenceTransformer(sbert_model)
             self._build_sbert_index(skill_db)
 
     # -------------------- SBERT Index --------------------
@@ -23,9 +23,11 @@ class MatchingConfig(AppConfig):
                     device=getattr(settings, "EMB_DEVICE", None),
                     batch_size=int(getattr(settings, "EMB_BATCH", 64)),
                     normalize=True,
-                    cache_path=str(Path(__file__).resolve().parent.parent / "ml" / "src" / "cache" / "emb_sbert.pkl"),
+                    cache_path=str(Path(__file__).resolve().parent.parent / "ml" / "src" / "cache" / "emb_sbert.sqlite"),
                 )
                 get_sbert_embedder(cfg)
+                from ml.src.embedder.registry import warmup
+                warmup(cfg.model_name, cfg.device)     # shared encoder: first-call allocations happen here, once
             except Exception as e:
                 log.info(f"SBERT warm-up skipped: {e}")
             try:
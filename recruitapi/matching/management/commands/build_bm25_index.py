@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from matching.models import CV
+from ml.apis import load_model, rebuild_bm25_index
+
+class Command(BaseCommand):
+    help = "Rebuild BM25 index (IDF toàn cục) từ toàn bộ CV.active (stream theo lô DB, ghi snapshot nguyên tử)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", type=str, default="",
+                            help="thư mục index (mặc định: feat_cfg.bm25_index_path của model)")
+        parser.add_argument("--chunk", type=int, default=2000, help="số CV đọc mỗi lô DB")
+
+    def handle(self, *args, **opts):
+        path = opts["path"] or load_model().feat_cfg.bm25_index_path
+        if not path:
+            self.stdout.write(self.style.WARNING("Chưa cấu hình bm25_index_path (dùng --path)"))
+            return
+        qs = CV.objects.filter(is_active=True).exclude(resume_text="").only("id", "resume_text").order_by("id")
+        n = qs.count()
+        self.stdout.write(f"Index BM25 {n} CV -> {path} ...")
+
+        def items():
+            for i, cv in enumerate(qs.iterator(chunk_size=opts["chunk"]), 1):
+                yield cv.id, cv.resume_text
+                if i % (opts["chunk"] * 10) == 0:
+                    self.stdout.write(f"  {i}/{n} CV")
+
+        total = rebuild_bm25_index(items(), path=path)
+        self.stdout.write(self.style.SUCCESS(f"Rebuild xong ({total} CV) -> {path}"))
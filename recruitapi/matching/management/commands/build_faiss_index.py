@@ -1,44 +1,64 @@
-import math
 import numpy as np
 from django.core.management.base import BaseCommand
 from matching.models import CV
-from ml.embeddings import embed_texts
+from ml.embeddings import embed_documents
 from ml.vectorstore import faiss_store
 
 class Command(BaseCommand):
-    help = "Rebuild FAISS index từ toàn bộ CV.active"
+    help = "Rebuild FAISS index từ toàn bộ CV.active (stream theo lô DB -> embed -> index, swap nguyên tử)"
 
     def add_arguments(self, parser):
         parser.add_argument("--batch", type=int, default=256, help="batch embed")
         parser.add_argument("--hnsw", action="store_true", help="dùng HNSW thay vì Flat/IVF")
-        parser.add_argument("--ivf", type=int, default=0, help="dùng IVF với nlist (0 = tắt)")
-        parser.add_argument("--save-to", type=str, default="", help="đường dẫn file index (nếu module cho phép)")
+        parser.add_argument("--m", type=int, default=32, help="HNSW: số cạnh mỗi nút")
+        parser.add_argument("--ef-construction", type=int, default=200, help="HNSW: efConstruction")
+        parser.add_argument("--ef-search", type=int, default=64, help="HNSW: efSearch mặc định")
+        parser.add_argument("--ivf", type=int, default=0, help="dùng IVF với nlist (0 = tắt, -1 = tự chọn ~4·sqrt(N))")
+        parser.add_argument("--nprobe", type=int, default=0, help="IVF: số cụm quét khi search (0 = nlist/32, >= 8)")
+        parser.add_argument("--train-size", type=int, default=0, help="IVF: số CV ngẫu nhiên để train (0 = 64·nlist)")
+        parser.add_argument("--save-to", type=str, default="",
+                            help="ghi ra thư mục này thay vì swap vào FAISS_INDEX_DIR")
 
     def handle(self, *args, **opts):
-        qs = CV.objects.filter(is_active=True).only("id", "resume_text").order_by("id")
-        ids, texts = [], []
-        for cv in qs.iterator(chunk_size=2000):
-            if cv.resume_text:
+        qs = CV.objects.filter(is_active=True).exclude(resume_text="").only("id", "resume_text").order_by("id")
+        n = qs.count()
+        if n == 0:
+            self.stdout.write(self.style.WARNING("Không có CV nào để index"))
+            return
+        B = opts["batch"]
+
+        def chunks():
+            # không giữ cả tập CV/embedding trong RAM: mỗi lô DB được embed rồi add thẳng vào index
+            ids, texts, done = [], [], 0
+            for cv in qs.iterator(chunk_size=max(B, 2000)):
+                if not cv.resume_text:
+                    continue
                 ids.append(cv.id)
                 texts.append(cv.resume_text)
+                if len(ids) == B:
+                    yield ids, embed_documents(texts)
+                    done += len(ids)
+                    ids, texts = [], []
+                    if done % (B * 40) == 0:
+                        self.stdout.write(f"  {done}/{n} CV")
+            if ids:
+                yield ids, embed_documents(texts)
 
-        self.stdout.write(f"Embedding {len(ids)} CV ...")
-        # embed theo batch để không tràn RAM/GPU
-        embs = []
-        B = opts["batch"]
-        for i in range(0, len(texts), B):
-            embs.append(embed_texts(texts[i:i+B]))
-        X = np.vstack(embs).astype("float32")   # shape [N, d]
-        I = np.array(ids, dtype="int64")
-
-        # build index bằng helper trong module faiss_store (tận dụng save/load sẵn có)
-        # Nếu module của bạn có API build/swap, dùng trực tiếp; nếu không, dùng create/update:
-        if opts["ivf"] > 0:
-            index = faiss_store.build_ivf(X, I, nlist=opts["ivf"])   # ví dụ: hàm tiện ích của bạn
+        self.stdout.write(f"Embedding + index {n} CV (batch={B}) ...")
+        if opts["ivf"]:
+            nlist, nprobe, train_size = faiss_store.ivf_params(n, opts["ivf"] if opts["ivf"] > 0 else None,
+                                                              opts["nprobe"] or None, opts["train_size"] or None)
+            # mẫu train chọn ngẫu nhiên trên toàn bảng (không lệch theo id); vector vào cache embed nên không tính lại
+            sample = list(qs.order_by("?").values_list("resume_text", flat=True)[:train_size])
+            self.stdout.write(f"IVF nlist={nlist} nprobe={nprobe}: train trên {len(sample)} CV ngẫu nhiên")
+            train = [embed_documents(sample[i:i + B]) for i in range(0, len(sample), B)]
+            index = faiss_store.build_ivf(chunks(), nlist=nlist, nprobe=nprobe,
+                                          train=np.vstack(train), n_total=n)
         elif opts["hnsw"]:
-            index = faiss_store.build_hnsw(X, I)                     # ví dụ: hàm tiện ích của bạn
+            index = faiss_store.build_hnsw(chunks(), M=opts["m"], efConstruction=opts["ef_construction"],
+                                           efSearch=opts["ef_search"])
         else:
-            index = faiss_store.build_flat(X, I)                     # ví dụ: hàm tiện ích của bạn
+            index = faiss_store.build_flat(chunks())
 
-        saved = faiss_store.save(index, path=opts["save_to"] or None)  # nếu module hỗ trợ
-        self.stdout.write(self.style.SUCCESS(f"Rebuild xong ({len(ids)} vectors). Save={bool(saved)}"))
+        saved = faiss_store.save(index, path=opts["save_to"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuild xong ({index.ntotal} vectors) -> {saved}"))
@@ -1,22 +1,91 @@
+import threading
+import time
 from typing import Iterable
 import numpy as np
-from ml.embeddings import embed_texts
+from django.conf import settings
+from ml.apis import cache_cv_skills, index_cv_bm25, remove_cv_bm25
+from ml.embeddings import embed_documents
 from ml.vectorstore import faiss_store
+from .models import CV
+
+# IdFilter (bitmap CV id cho faiss_store.search) theo thuộc tính CV trong DB, cache theo bộ thuộc tính;
+# hết hạn sau FAISS_FILTER_TTL giây, hoặc ngay khi process này thêm/sửa/xoá CV trong index.
+FILTER_TTL = 60.0
+FILTER_CACHE_SIZE = 256
+_FILTER_LOCK = threading.RLock()
+_FILTERS: dict = {}         # key -> (created_at, generation, IdFilter)
+_FILTER_GEN = 0
 
 def ensure_faiss_loaded() -> bool:
     return faiss_store.load()
 
 def add_one_to_faiss(cv_id: int | str, resume_text: str):
-    emb = embed_texts([resume_text])[0]  # np.ndarray (D,)
+    emb = embed_documents([resume_text])[0]  # np.ndarray (D,)
     if not faiss_store.is_loaded():
         faiss_store.build_new(np.asarray([emb]), [cv_id], kind="hnsw")
     else:
-        faiss_store.add(np.asarray([emb]), [cv_id])
+        faiss_store.upsert(np.asarray([emb]), [cv_id])   # CV sửa lại: thay vector cũ
+    invalidate_cv_filters()
 
 def add_many_to_faiss(items: Iterable[tuple[int | str, str]]):
     ids, texts = zip(*items)
-    embs = embed_texts(list(texts))
+    embs = embed_documents(list(texts))
     if not faiss_store.is_loaded():
         faiss_store.build_new(np.asarray(embs), list(ids), kind="hnsw")
     else:
-        faiss_store.add(np.asarray(embs), list(ids))
\ No newline at end of file
+        faiss_store.upsert(np.asarray(embs), list(ids))
+    invalidate_cv_filters()
+
+def remove_from_faiss(cv_ids: Iterable[int | str]) -> int:
+    if not faiss_store.is_loaded() and not faiss_store.load():
+        return 0
+    invalidate_cv_filters()
+    return faiss_store.remove(list(cv_ids))
+
+def invalidate_cv_filters():
+    global _FILTER_GEN
+    with _FILTER_LOCK:
+        _FILTER_GEN += 1
+        _FILTERS.clear()
+
+def cv_filter(location: str = "", owner_ids: Iterable[int] | None = None, applied_to_owner: int | None = None,
+              active_only: bool = True) -> "faiss_store.IdFilter | None":
+    """
+    CV được phép trả về từ FAISS: is_active, cv_location chứa `location`, thuộc các owner_ids, hoặc đã apply vào
+    JD của recruiter applied_to_owner. None = không lọc.
+    """
+    location = (location or "").strip()
+    key = (location.lower(), tuple(sorted({int(o) for o in owner_ids or ()})), applied_to_owner, active_only)
+    if key == ("", (), None, False):
+        return None
+    ttl = float(getattr(settings, "FAISS_FILTER_TTL", FILTER_TTL))
+    with _FILTER_LOCK:
+        hit = _FILTERS.get(key)
+        if hit is not None and hit[1] == _FILTER_GEN and time.time() - hit[0] < ttl:
+            return hit[2]
+        gen = _FILTER_GEN
+    qs = CV.objects.all()
+    if active_only:
+        qs = qs.filter(is_active=True)
+    if location:
+        qs = qs.filter(cv_location__icontains=location)
+    if key[1]:
+        qs = qs.filter(owner_id__in=key[1])
+    if applied_to_owner is not None:
+        qs = qs.filter(application__jd__owner_id=applied_to_owner).distinct()
+    flt = faiss_store.IdFilter(np.fromiter(qs.values_list("id", flat=True).iterator(), dtype="int64"))
+    with _FILTER_LOCK:
+        if gen == _FILTER_GEN:          # CV đổi trong lúc query DB: không cache bản có thể đã cũ
+            if len(_FILTERS) >= FILTER_CACHE_SIZE:
+                _FILTERS.pop(next(iter(_FILTERS)))
+            _FILTERS[key] = (time.time(), gen, flt)
+    return flt
+
+def cache_skills_for_cv(resume_text: str):
+    cache_cv_skills([resume_text or ""])
+
+def index_cv_for_bm25(cv_id: int | str, resume_text: str):
+    index_cv_bm25(cv_id, resume_text)
+
+def remove_cv_from_bm25(cv_id: int | str):
+    remove_cv_bm25(cv_id)
\ No newline at end of file
@@ -12,7 +12,9 @@ from .serializers import (
     CVSerializer, JDSerializer,
     RankRequestSerializer, RegisterSerializer, UserSerializer,
 )
-from .services import add_one_to_faiss
+from .services import (
+    add_one_to_faiss, cache_skills_for_cv, cv_filter, index_cv_for_bm25, remove_cv_from_bm25, remove_from_faiss,
+)
 from ml.apis import is_loaded as model_is_loaded, reload_model, rank_cv_for_jd
 from ml.embeddings import embed_texts
 from ml.vectorstore.faiss_store import is_loaded as faiss_is_loaded, load as faiss_load, search as faiss_search
@@ -66,8 +68,27 @@ class FaissSearchView(APIView):
         if not faiss_is_loaded():
             if not faiss_load():
                 return Response({"detail":"FAISS index not found"}, status=503)
+        # lọc ngay trong FAISS (không post-filter): CV active, theo vùng (location hoặc vùng của jd_id),
+        # owner_ids, applicants_only = chỉ CV đã apply vào JD của recruiter đang gọi
+        location = (request.data.get("location") or "").strip()
+        jd_id = request.data.get("jd_id")
+        if jd_id and not location:
+            jd = JD.objects.filter(id=jd_id, is_active=True).only("job_location").first()
+            if jd is None:
+                return Response({"detail": f"JD id={jd_id} không tồn tại"}, status=404)
+            location = jd.job_location
+        owner_ids = request.data.get("owner_ids") or []
+        if not isinstance(owner_ids, (list, tuple)):
+            return Response({"detail": "owner_ids must be a list of user ids"}, status=400)
+        try:
+            owner_ids = [int(o) for o in owner_ids]
+        except (TypeError, ValueError):
+            return Response({"detail": "owner_ids must be a list of user ids"}, status=400)
+        applicants_only = bool(request.data.get("applicants_only"))
+        id_filter = cv_filter(location=location, owner_ids=owner_ids,
+                              applied_to_owner=request.user.id if applicants_only else None)
         q_emb = embed_texts([q])
-        results = faiss_search(q_emb, topk=topk)[0]  # [(cv_id, score), ...]
+        results = faiss_search(q_emb, topk=topk, id_filter=id_filter)[0]  # [(cv_id, score), ...]
         return Response({"results": [{"cv_id": str(cid), "score": float(score)} for cid, score in results]}, status=200)
 
 # ===== Ranking (JWT) =====
@@ -174,19 +195,50 @@ class CVViewSet(viewsets.ModelViewSet):
             add_one_to_faiss(cv.id, cv.resume_text)
         except Exception:
             pass
+        try:
+            cache_skills_for_cv(cv.resume_text)
+        except Exception:
+            pass
+        try:
+            index_cv_for_bm25(cv.id, cv.resume_text)
+        except Exception:
+            pass
 
     def perform_update(self, serializer):
         require_role(self.request.user, "candidate")
         cv = serializer.save()
+        if not cv.is_active:
+            self._remove_from_indexes(cv)
+            return
         try:
             add_one_to_faiss(cv.id, cv.resume_text)
         except Exception:
             pass
+        try:
+            cache_skills_for_cv(cv.resume_text)
+        except Exception:
+            pass
+        try:
+            index_cv_for_bm25(cv.id, cv.resume_text)
+        except Exception:
+            pass
 
     def perform_destroy(self, instance: CV):
         require_role(self.request.user, "candidate")
         instance.is_active = False
         instance.save(update_fields=["is_active"])
+        self._remove_from_indexes(instance)
+
+    def _remove_from_indexes(self, cv: CV):
+        # CV đã soft-delete không được xuất hiện trong kết quả search
+        try:
+            remove_from_faiss([cv.id])
+        except Exception:
+            pass
+        try:
+            remove_cv_from_bm25(cv.id)
+        except Exception:
+            pass
 
 class JDViewSet(viewsets.ModelViewSet):
     serializer_class = JDSerializer